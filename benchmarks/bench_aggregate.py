@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+    Time taken for the capacity planning counts, datasources by Receiver,
+    vendor/model, type_id, zone, enabled and client, with a scan of the
+    device tree per count versus one aggregate() call.
+
+    python benchmarks/bench_aggregate.py [devices]
+"""
+import os
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mfe_saw.aggregate import aggregate
+from mfe_saw.devindex import DevIndex
+from mfe_saw.treestore import TreeStore
+from bench_treestore import build_lod
+
+BY = ['rec_name', ('vendor', 'model'), 'type_id', 'zone_name', 'enabled',
+      'client']
+
+
+def scans(devtree):
+    """
+    A Counter per grouping, each its own pass over the tree.
+    """
+    counts = {}
+    for grouping in BY:
+        fields = (grouping,) if isinstance(grouping, str) else grouping
+        counts[grouping] = Counter(
+            tuple(ds.get(field) for field in fields)
+            for ds in devtree if ds['desc_id'] in ('3', '256'))
+    return counts
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def main(devices=100000):
+    lod = build_lod(devices)
+    for num, ds in enumerate(lod):
+        ds['rec_name'] = 'ERC-{}'.format(num % 10)
+    devtree = TreeStore(lod)
+    del lod
+    index = DevIndex(devtree)
+
+    old, _ = timed(scans, devtree)
+    new, _ = timed(aggregate, devtree, index, BY)
+    indexed, _ = timed(aggregate, devtree, index, ['type_id', 'zone_id'])
+    metrics, _ = timed(aggregate, devtree, index, BY,
+                       metrics=['count', 'enabled', 'clients', 'heard'])
+
+    print('devices:               {}'.format(len(devtree)))
+    print('scan per grouping:     {:6.3f}s  ({} scans)'.format(old, len(BY)))
+    print('aggregate():           {:6.3f}s  {:.1f}x'.format(new, old / new))
+    print('  with all metrics:    {:6.3f}s'.format(metrics))
+    print('  indexed fields only: {:6.3f}s'.format(indexed))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
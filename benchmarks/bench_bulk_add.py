@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+    Time taken to add datasources one at a time with DataSource.add(),
+    as the CLI did, versus bulk_add(), against a simulated ESM that takes
+    latency seconds per request.
+
+    python benchmarks/bench_bulk_add.py [devices] [adds] [latency]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mfe_saw.base import Base
+from mfe_saw.bulk import bulk_add
+from mfe_saw.datasource import DataSource, DevTree
+from mfe_saw.devindex import DevIndex
+from mfe_saw.treestore import TreeSnapshot, TreeStore
+from bench_treestore import build_lod
+
+
+def simulated_post(latency):
+    """
+    Returns:
+        Base.post replacement accepting every add after latency
+    """
+    def post(self, method, data=None, callback=None, raw=False):
+        time.sleep(latency)
+        return {'id': {'id': '1'}}
+    return post
+
+
+def batch(adds):
+    return [{'name': 'new-{}'.format(num), 'type_id': '65',
+             'ds_ip': '198.{}.{}.{}'.format(18 + (num >> 16), num >> 8 & 255,
+                                            num & 255),
+             'parent_id': '144117387099111424'} for num in range(adds)]
+
+
+def one_at_a_time(datasources):
+    for ds in datasources:
+        DataSource(**ds).add()
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def main(devices=10000, adds=500, latency=0.01):
+    tree = TreeStore(build_lod(devices))
+    DevTree._publish(TreeSnapshot(tree, DevIndex(tree)))
+    Base._baseurl = 'https://esm/rs/esm/'
+    Base.post = simulated_post(latency)
+
+    old, _ = timed(one_at_a_time, batch(adds))
+    new, results = timed(lambda: list(bulk_add(batch(adds))))
+    assert all(result.status == 'added' for result in results)
+
+    print('devices in tree:       {}'.format(len(tree)))
+    print('adds:                  {} ({:.0f} ms per request)'.format(
+          adds, latency * 1000))
+    print('one at a time:         {:6.2f}s'.format(old))
+    print('bulk_add():            {:6.2f}s  {:.1f}x ({} workers)'.format(
+          new, old / new, Base._max_workers))
+
+
+if __name__ == '__main__':
+    main(*[cast(arg) for cast, arg in zip((int, int, float), sys.argv[1:])])
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+    Requests and time taken to delete client datasources and datasources
+    one DataSource.delete() at a time versus bulk_delete(), against a
+    simulated ESM that takes latency seconds per request.
+
+    python benchmarks/bench_bulk_delete.py [clients] [datasources] [latency]
+"""
+import os
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mfe_saw.base import Base
+from mfe_saw.bulk import bulk_delete
+from mfe_saw.datasource import DataSource, DevTree
+from mfe_saw.devindex import DevIndex
+from mfe_saw.treestore import TreeSnapshot, TreeStore
+
+CALLS = Counter()
+CONTAINERS = 4
+
+
+def simulated_post(latency):
+    """
+    Returns:
+        Base.post replacement that accepts deletes after latency
+    """
+    def post(self, method, data=None, callback=None, raw=False):
+        time.sleep(latency)
+        CALLS[method] += 1
+        return {'EC': '0'}
+    return post
+
+
+def make_tree(clients, datasources):
+    """
+    Publishes a tree of one Receiver with datasources and client
+    containers holding clients.
+
+    Returns:
+        tuple (client ds_ids, datasource ds_ids)
+    """
+    devices = [{'desc_id': '2', 'name': 'ERC-1', 'ds_id': '1',
+                'client_groups': '0'}]
+    client_ids = []
+    for num in range(CONTAINERS):
+        container = str(100 + num)
+        devices.append({'desc_id': '3', 'name': 'group-{}'.format(num),
+                        'ds_id': container, 'parent_id': '1',
+                        'client_groups': '1'})
+        for cnum in range(num, clients, CONTAINERS):
+            client_ids.append(str(10000 + cnum))
+            devices.append({'desc_id': '256', 'ds_id': client_ids[-1],
+                            'name': 'client-{}'.format(cnum),
+                            'parent_id': container, 'client_groups': '0'})
+    ds_ids = [str(1000 + num) for num in range(datasources)]
+    devices += [{'desc_id': '3', 'name': 'ds-{}'.format(ds_id),
+                 'ds_id': ds_id, 'parent_id': '1', 'client_groups': '0'}
+                for ds_id in ds_ids]
+    for idx, ds in enumerate(devices, start=1):
+        ds['idx'] = idx
+    tree = TreeStore(devices)
+    DevTree._publish(TreeSnapshot(tree, DevIndex(tree)))
+    return client_ids, ds_ids
+
+
+def one_at_a_time(targets):
+    for ds in targets:
+        DataSource(**ds).delete()
+
+
+def main(clients=2000, datasources=200, latency=0.005):
+    Base._baseurl = 'https://esm/rs/esm/'
+    Base.post = simulated_post(latency)
+    client_ids, ds_ids = make_tree(clients, datasources)
+    targets = [DevTree._Snapshot.tree[DevTree._Snapshot.index.topology
+                                      .position(ds_id)].copy()
+               for ds_id in client_ids + ds_ids]
+
+    start = time.perf_counter()
+    one_at_a_time(targets)
+    old, old_calls = time.perf_counter() - start, sum(CALLS.values())
+
+    CALLS.clear()
+    start = time.perf_counter()
+    results = list(bulk_delete(client_ids + ds_ids))
+    new, new_calls = time.perf_counter() - start, sum(CALLS.values())
+    assert all(result.status == 'deleted' for result in results)
+    assert len(DevTree._Snapshot.tree) == 1 + CONTAINERS
+
+    print('clients / datasources: {} / {} ({:.0f} ms per request)'.format(
+          clients, datasources, latency * 1000))
+    print('DataSource.delete():   {:6.2f}s  {} requests'.format(
+          old, old_calls))
+    print('bulk_delete():         {:6.2f}s  {} requests ({} workers)'.format(
+          new, new_calls, Base._max_workers))
+
+
+if __name__ == '__main__':
+    main(*[cast(arg) for cast, arg in zip((int, int, float), sys.argv[1:])])
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+    Requests and time taken to add datasources with bulk_add(), one
+    dsAddDataSource each, versus bulk_import() and its native import
+    files, against a simulated ESM that takes latency seconds per
+    request.
+
+    The tree refresh bulk_import() reconciles with is replaced by
+    publishing the imported datasources, so the time of one tree build
+    is not included.
+
+    python benchmarks/bench_bulk_import.py [adds] [chunk size] [latency]
+"""
+import os
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mfe_saw.base import Base
+from mfe_saw.bulk import bulk_add, bulk_import
+from mfe_saw.datasource import DevTree
+from mfe_saw.devindex import DevIndex
+from mfe_saw.treestore import TreeSnapshot, TreeStore
+
+CALLS = Counter()
+REC_ID = '144117387099111424'
+
+
+def simulated_post(latency):
+    """
+    Returns:
+        Base.post replacement accepting adds and imports after latency
+    """
+    def post(self, method, data=None, callback=None, raw=False):
+        time.sleep(latency)
+        CALLS[method] += 1
+        if method == 'MISC_WRITEFILE':
+            return {'FTOKEN': data['FNAME'] or 'import'}
+        if method.startswith('devGetDeviceList'):
+            resp = [{'name': 'ERC-1', 'id': {'id': REC_ID}}]
+        elif method == 'dsGetDataSourceTypes':
+            resp = {'vendors': [{'name': 'UNIX', 'models': [
+                        {'id': {'id': 65}, 'name': 'Linux'}]}]}
+        else:
+            resp = {'id': {'id': '1'}, 'EC': '0'}
+        return callback(resp) if callback else resp
+    return post
+
+
+def publish(datasources):
+    """
+    Publishes a tree of one Receiver and the datasources.
+    """
+    tree = TreeStore([{'desc_id': '2', 'name': 'ERC-1', 'ds_id': REC_ID,
+                       'zone_id': '0', 'client_groups': '0'}] +
+                     [dict(ds, desc_id='3', ds_id=str(num), zone_id='0',
+                           client_groups='0')
+                      for num, ds in enumerate(datasources)])
+    DevTree._publish(TreeSnapshot(tree, DevIndex(tree)))
+
+
+def batch(adds):
+    return [{'name': 'new-{}'.format(num), 'type_id': '65',
+             'ds_ip': '198.{}.{}.{}'.format(18 + (num >> 16), num >> 8 & 255,
+                                            num & 255),
+             'parent_id': REC_ID} for num in range(adds)]
+
+
+def run(func, adds):
+    publish([])
+    CALLS.clear()
+    start = time.perf_counter()
+    results = list(func(batch(adds)))
+    assert all(result.status == 'added' for result in results)
+    return time.perf_counter() - start, sum(CALLS.values())
+
+
+def main(adds=2000, chunk_size=500, latency=0.005):
+    Base._baseurl = 'https://esm/rs/esm/'
+    Base.post = simulated_post(latency)
+    DevTree.refresh = lambda self, full=False, recs=None: publish(batch(adds))
+
+    old, old_calls = run(bulk_add, adds)
+    new, new_calls = run(lambda datasources: bulk_import(
+                             datasources, chunk_size=chunk_size,
+                             unverified=True), adds)
+    print('adds:                  {} ({:.0f} ms per request)'.format(
+          adds, latency * 1000))
+    print('bulk_add():            {:6.2f}s  {} requests ({} workers)'.format(
+          old, old_calls, Base._max_workers))
+    print('bulk_import():         {:6.2f}s  {} requests, chunks of {}'.format(
+          new, new_calls, chunk_size))
+
+
+if __name__ == '__main__':
+    main(*[cast(arg) for cast, arg in zip((int, int, float), sys.argv[1:])])
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+    Requests and time taken to add client datasources with one
+    DS_ADDDSCLIENT per client versus client file uploads, against a
+    simulated ESM that takes latency seconds per request.
+
+    python benchmarks/bench_client_upload.py [clients] [containers] [latency]
+"""
+import os
+import sys
+import time
+from collections import Counter
+from functools import partial
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mfe_saw.base import Base
+from mfe_saw.bulk import bulk_add, bulk_add_clients
+from mfe_saw.datasource import DevTree
+from mfe_saw.devindex import DevIndex
+from mfe_saw.treestore import TreeSnapshot, TreeStore
+from mfe_saw.utils import dehexify, hexify
+
+CALLS = Counter()
+
+
+def simulated_post(latency):
+    """
+    Returns:
+        Base.post replacement that accepts adds and uploads after latency
+    """
+    files = {}
+
+    def post(self, method, data=None, callback=None, raw=False):
+        time.sleep(latency)
+        CALLS[method] += 1
+        if method == 'MISC_WRITEFILE':
+            fname = data['FNAME'] or 'upload-{}'.format(len(files))
+            files[fname] = files.get(fname, '') + data['DATA1']
+            return {'FTOKEN': fname}
+        if method == 'DS_IMPORTDSCLIENTS':
+            files[data['DSID']] = files.pop(data['FNAME'])
+            return {'EC': '0'}
+        if method == 'DS_GETDSCLIENTLIST':
+            return {'FTOKEN': data['DSID']}
+        if method == 'MISC_READFILE':
+            return {'DATA': hexify(''.join(
+                        '1' + row + '\n' for row in
+                        dehexify(files.get(data['FNAME'], '')).splitlines()))}
+        return {'EC': '0'}
+    return post
+
+
+def make_tree(containers):
+    devices = [{'desc_id': '2', 'name': 'ERC-1', 'ds_id': '1', 'zone_id': '0',
+                'client_groups': '0'}]
+    devices += [{'desc_id': '3', 'name': 'group-{}'.format(num),
+                 'ds_id': str(100 + num), 'ds_ip': '10.1.0.{}'.format(num),
+                 'client_groups': '1', 'zone_id': '0'}
+                for num in range(containers)]
+    tree = TreeStore(devices)
+    DevTree._publish(TreeSnapshot(tree, DevIndex(tree)))
+
+
+def batch(clients, containers):
+    return [{'name': 'client-{}'.format(num), 'type_id': '65',
+             'ds_ip': '198.18.{}.{}'.format(num >> 8, num & 255),
+             'parent_id': str(100 + num % containers), 'client': True}
+            for num in range(clients)]
+
+
+def run(func, clients):
+    CALLS.clear()
+    start = time.perf_counter()
+    results = list(func(clients))
+    assert all(result.status == 'added' for result in results)
+    return time.perf_counter() - start, sum(CALLS.values())
+
+
+def main(clients=2000, containers=4, latency=0.005):
+    make_tree(containers)
+    Base._baseurl = 'https://esm/rs/esm/'
+    Base.post = simulated_post(latency)
+
+    old, old_calls = run(bulk_add, batch(clients, containers))
+    new, new_calls = run(partial(bulk_add_clients, unverified=True),
+                         batch(clients, containers))
+    print('clients x containers:  {} x {} ({:.0f} ms per request)'.format(
+          clients, containers, latency * 1000))
+    print('DS_ADDDSCLIENT each:   {:6.2f}s  {} requests ({} workers)'.format(
+          old, old_calls, Base._max_workers))
+    print('client file upload:    {:6.2f}s  {} requests'.format(new, new_calls))
+
+
+if __name__ == '__main__':
+    main(*[cast(arg) for cast, arg in zip((int, int, float), sys.argv[1:])])
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+    Time taken to decode a large ESM payload by the chained replace
+    dehexify DevTree used to have, a single regex alternation and the
+    current dehexify.
+
+    The payload is the device tree string from tests/test_utils.py
+    repeated to the requested size.
+
+    python benchmarks/bench_dehexify.py [megabytes]
+"""
+import gc
+import os
+import re
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from mfe_saw.utils import dehexify, _HEXEN, _URI
+from tests.test_utils import uri_string
+
+_HEXEN_TABLE = str.maketrans(dict(_HEXEN))
+_TOKENS = re.compile('|'.join(enc for enc, _ in _URI))
+_TOKEN_MAP = dict(_URI)
+
+
+def chained_replace(data):
+    """
+    dehexify as it was: one str.replace per code, 27 in all.
+    """
+    hexen = {'\x1c': ',', '\x11': '\n', '\x12': ' ', '\x22': '"',
+             '\x23': '#', '\x27': '\'', '\x28': '(', '\x29': ')',
+             '\x2b': '+', '\x2d': '-', '\x2e': '.', '\x2f': '/',
+             '\x7c': '|'}
+    uri = {'%11': ',', '%12': '\n', '%20': ' ', '%22': '"', '%23': '#',
+           '%27': '\'', '%28': '(', '%29': ')', '%2B': '+', '%2D': '-',
+           '%2E': '.', '%2F': '/', '%3A': ':', '%7C': '|'}
+    for (enc, dec) in hexen.items():
+        data = data.replace(enc, dec)
+    for (enc, dec) in uri.items():
+        data = data.replace(enc, dec)
+    return data
+
+
+def regex_alternation(data):
+    """
+    Translation table plus one regex pass for the %XX tokens.
+    """
+    return _TOKENS.sub(lambda match: _TOKEN_MAP[match.group()],
+                       data.translate(_HEXEN_TABLE))
+
+
+def timed(func, data, repeat=3):
+    """
+    Returns:
+        tuple (best seconds, result)
+    """
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        result = func(data)
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return best, result
+
+
+def main(megabytes=100):
+    data = uri_string * (megabytes * 2**20 // len(uri_string))
+    print('payload:               {:.0f} MB, {} %XX tokens'.format(
+          len(data) / 2**20, data.count('%')))
+    base, expected = timed(chained_replace, data)
+    print('chained replace:       {:6.2f}s'.format(base))
+    for name, func, payload in [
+            ('regex alternation', regex_alternation, data),
+            ('dehexify, str', dehexify, data),
+            ('dehexify, bytes', dehexify, data.encode())]:
+        seconds, result = timed(func, payload)
+        if not isinstance(result, str):
+            result = result.decode()
+        assert result == expected, name
+        print('{:22} {:6.2f}s  {:.2f}x'.format(name + ':', seconds,
+                                              base / seconds))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100)
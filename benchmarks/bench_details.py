@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+    Time taken to fetch datasource details one dsGetDataSourceDetail
+    after another versus DevTree.details(), cold, with a warm cache and
+    after one datasource in a hundred changed, against a simulated ESM
+    that takes latency seconds per request.
+
+    python benchmarks/bench_details.py [datasources] [latency]
+"""
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mfe_saw.base import Base
+from mfe_saw.datasource import DataSource, DevTree
+from mfe_saw.devindex import DevIndex
+from mfe_saw.treestore import TreeSnapshot, TreeStore
+
+CALLS = Counter()
+
+
+def simulated_post(latency):
+    """
+    Returns:
+        Base.post replacement returning details after latency
+    """
+    def post(self, method, data=None, callback=None, raw=False):
+        time.sleep(latency)
+        CALLS[method] += 1
+        return {'id': data['datasourceId'], 'parameters': [
+                    {'key': 'facility', 'value': 'local7'}]}
+    return post
+
+
+def publish(datasources, changed=0):
+    """
+    Publishes a tree of one Receiver and datasources, the first changed
+    of them with a new IP.
+    """
+    devices = [{'desc_id': '2', 'name': 'ERC-1', 'ds_id': '1',
+                'client_groups': '0'}]
+    devices += [{'desc_id': '3', 'name': 'ds-{}'.format(num),
+                 'ds_id': str(1000 + num), 'parent_id': '1',
+                 'ds_ip': '198.18.{}.{}'.format(num >> 8,
+                                                num & 255 ^ (num < changed)),
+                 'type_id': '65', 'client_groups': '0'}
+                for num in range(datasources)]
+    tree = TreeStore(devices)
+    DevTree._publish(TreeSnapshot(tree, DevIndex(tree)))
+
+
+def one_at_a_time(datasources):
+    for num in range(datasources):
+        DataSource(name='ds-{}'.format(num), ds_id=str(1000 + num),
+                   parent_id='1', type_id='65')._ds_details()
+
+
+def timed(func, *args):
+    CALLS.clear()
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start, sum(CALLS.values())
+
+
+def main(datasources=2000, latency=0.005):
+    Base._baseurl = 'https://esm/rs/esm/'
+    Base.post = simulated_post(latency)
+    publish(datasources)
+    devtree = DevTree.__new__(DevTree)
+    devtree._rec_ids = devtree._view = None
+    path = os.path.join(tempfile.mkdtemp(), 'details.db')
+
+    def details():
+        results = list(devtree.details(cache_path=path))
+        assert len(results) == datasources
+        assert all(r.status in ['cached', 'fetched'] for r in results)
+
+    print('datasources:           {} ({:.0f} ms per request)'.format(
+          datasources, latency * 1000))
+    print('one at a time:         {:6.2f}s  {} requests'.format(
+          *timed(one_at_a_time, datasources)))
+    print('details(), cold:       {:6.2f}s  {} requests ({} workers)'.format(
+          *timed(details), Base._max_workers))
+    print('details(), cached:     {:6.2f}s  {} requests'.format(
+          *timed(details)))
+    publish(datasources, changed=datasources // 100)
+    print('details(), 1% changed: {:6.2f}s  {} requests'.format(
+          *timed(details)))
+
+
+if __name__ == '__main__':
+    main(*[cast(arg) for cast, arg in zip((int, float), sys.argv[1:])])
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""
+    Time taken to list the datasources not heard from since a date by
+    parsing every last_time string, as the CLI -l option did, versus the
+    sorted LastTimeIndex.
+
+    python benchmarks/bench_last_times.py [devices]
+"""
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mfe_saw.devindex import DevIndex
+from mfe_saw.treestore import TreeStore
+from bench_treestore import build_lod
+
+SINCE = datetime(2017, 4, 1)
+
+
+def scan(devtree):
+    """
+    The -l loop as it was.
+    """
+    found = []
+    for ds in devtree:
+        if ds['last_time'] and ds['desc_id'] == '3':
+            if datetime.strptime(ds['last_time'], '%m/%d/%Y %H:%M:%S') < SINCE:
+                found.append(ds)
+    return found
+
+
+def indexed(devtree, index):
+    return [devtree[pos] for pos in index.last_times.before(SINCE)
+            if devtree[pos]['desc_id'] == '3']
+
+
+def main(devices=100000):
+    lod = build_lod(devices)
+    for num, ds in enumerate(lod):
+        ds['last_time'] = '{:02d}/{:02d}/2017 10:{:02d}:00'.format(
+                            num % 12 + 1, num % 28 + 1, num % 60)
+    devtree = TreeStore(lod)
+    del lod
+
+    start = time.perf_counter()
+    index = DevIndex(devtree)
+    built = time.perf_counter() - start
+
+    start = time.perf_counter()
+    old = scan(devtree)
+    old_time = time.perf_counter() - start
+    start = time.perf_counter()
+    new = indexed(devtree, index)
+    new_time = time.perf_counter() - start
+    assert len(old) == len(new)
+
+    print('devices:               {}'.format(len(devtree)))
+    print('silent since:          {} matches'.format(len(new)))
+    print('strptime scan:         {:6.3f}s'.format(old_time))
+    print('LastTimeIndex:         {:6.3f}s  {:.0f}x'.format(new_time,
+                                                           old_time / new_time))
+    print('DevIndex build:        {:6.3f}s  (once per tree build)'.format(built))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
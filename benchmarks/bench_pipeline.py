@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+    Peak memory used to turn a raw device tree payload into a 'TreeStore'
+    with the list based parse stages DevTree used to have versus the
+    generator pipeline.
+
+    python benchmarks/bench_pipeline.py [rows]
+"""
+import csv
+import gc
+import os
+import sys
+import time
+import tracemalloc
+from io import StringIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mfe_saw.datasource import DevTree
+from mfe_saw.treestore import TreeStore
+from mfe_saw.utils import dehexify
+from synthetic import VENMODS, devtree_text, hexify
+
+
+class VenmodTable(object):
+    """
+    Answers type_id_to_venmod() like ESM does once its types are cached.
+    """
+    def __init__(self):
+        self._venmods = {type_id: (vendor, model)
+                         for type_id, vendor, model in VENMODS}
+
+    def type_id_to_venmod(self, type_id):
+        return self._venmods.get(type_id)
+
+
+def make_tree():
+    """
+    Returns:
+        DevTree with the enrichment tables set and no ESM connection
+    """
+    tree = DevTree.__new__(DevTree)
+    tree._esm = VenmodTable()
+    tree._zone_names = {}
+    tree._zone_map = {'': '0'}
+    tree._type_map = {'2': 'receiver', '3': 'datasource'}
+    tree._last_times_map = {}
+    return tree
+
+
+def list_stages(raw):
+    """
+    The stages as they were: the whole payload decoded and wrapped in
+    StringIO, a list built by each stage and a pass over it per field.
+    """
+    tree = make_tree()
+    text = dehexify(raw)
+    devtree = []
+    for idx, row in enumerate(csv.reader(StringIO(text)), start=1):
+        if len(row) == 0 or row[0] == '16':
+            continue
+        if row[16] == 'TTTTTTTTTTTTTTTTTTTTTTTTTTTTTTTT':
+            row[16] = '0'
+        devtree.append({'idx': idx, 'desc_id': row[0], 'name': row[1],
+                        'ds_id': row[2], 'enabled': row[15],
+                        'ds_ip': row[27], 'hostname': row[28],
+                        'type_id': row[16], 'vendor': '', 'model': '',
+                        'tz_id': '', 'date_order': '', 'port': '',
+                        'syslog_tls': '', 'client_groups': row[29],
+                        'zone_name': '', 'zone_id': '', 'client': False})
+    devtree = list(tree._iter_rec_info(devtree))
+    devtree = [dict(ds) for ds in devtree]
+    for ds in devtree:
+        tree._enrich_ds(ds)
+    return TreeStore(devtree)
+
+
+def cached_pipeline(raw):
+    """
+    The in-memory build: the parsed section is kept as a list for the
+    next incremental build and copies stream into the store.
+    """
+    tree = make_tree()
+    section = tree._parse_devtree(raw)
+    devices = tree._splice_clients((dict(ds) for ds in section), None)
+    return TreeStore(tree._enrich_ds(ds) for ds in devices)
+
+
+def streaming_pipeline(raw):
+    """
+    The SQLite build: nothing but the current row is held.
+    """
+    tree = make_tree()
+    devices = tree._iter_rec_info(tree._iter_devtree(raw))
+    return TreeStore(tree._enrich_ds(ds)
+                     for ds in tree._splice_clients(devices, None))
+
+
+def measure(stage, raw):
+    """
+    Returns:
+        tuple (peak bytes over the payload, seconds, devices)
+    """
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    store = stage(raw)
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak, seconds, len(store)
+
+
+def main(rows=200000):
+    raw = hexify(devtree_text(recs=20, ds_per_rec=rows // 20))
+    print('payload:               {:.1f} MB'.format(len(raw) / 2**20))
+    for name, stage in [('list stages', list_stages),
+                        ('pipeline, cached', cached_pipeline),
+                        ('pipeline, streaming', streaming_pipeline)]:
+        peak, seconds, count = measure(stage, raw)
+        print('{:22} {:7.1f} MB peak  {:5.2f}s  ({} devices)'.format(
+              name + ':', peak / 2**20, seconds, count))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+    Time taken to splice client datasources into the device tree and to
+    fetch their client files.
+
+    Splicing compares the slice insert per container DevTree used to do
+    with the single pass DevTree._splice_clients(). Fetching compares
+    one container after another with the parallel in-order prefetch,
+    against a simulated ESM that takes latency seconds per request.
+
+    python benchmarks/bench_splice.py [containers] [clients] [latency]
+"""
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mfe_saw.base import Base
+from mfe_saw.datasource import DevTree, _ClientFetcher
+from synthetic import clients_text, devtree_text
+
+
+def parse(containers, clients):
+    """
+    Returns:
+        tuple (device list, dict of container ds_id to client list)
+    """
+    tree = DevTree.__new__(DevTree)
+    devtree = tree._parse_devtree(devtree_text(recs=10,
+                                               ds_per_rec=containers // 5,
+                                               containers=containers // 10,
+                                               clients=clients))
+    client_lods = {}
+    for num, ds in enumerate(ds for ds in devtree if DevTree._has_clients(ds)):
+        client_lods[ds['ds_id']] = tree._clients_to_lod(
+                                        clients_text(clients, num * clients))
+    return devtree, client_lods
+
+
+def slice_insert(devtree, client_lods):
+    """
+    The splice loop as it was: one slice insert per container.
+    """
+    devtree = [dict(ds) for ds in devtree]
+    didx = 0
+    for container in [ds for ds in devtree if DevTree._has_clients(ds)]:
+        clients = [dict(client) for client in client_lods[container['ds_id']]]
+        container['idx'] = container['idx'] + didx
+        pidx = container['idx']
+        cidx = pidx + 1
+        for client in clients:
+            client['parent_id'] = container['ds_id']
+            client['idx'] = cidx
+            cidx += 1
+            didx += 1
+        devtree[pidx:pidx] = clients
+    return devtree
+
+
+def single_pass(devtree, client_lods):
+    """
+    DevTree._splice_clients()
+    """
+    return list(DevTree._splice_clients(
+        (dict(ds) for ds in devtree),
+        lambda container: (dict(client)
+                           for client in client_lods[container['ds_id']])))
+
+
+def simulated_post(latency):
+    """
+    Returns:
+        Base.post replacement answering client requests after latency
+    """
+    def post(self, method, data=None, callback=None, raw=False):
+        time.sleep(latency)
+        if method == 'DS_GETDSCLIENTLIST':
+            return {'FTOKEN': data['DSID']}
+        return {'DATA': ''}
+    return post
+
+
+def fetch_sequential(ds_ids):
+    return [_ClientFetcher.fetch(ds_id) for ds_id in ds_ids]
+
+
+def fetch_prefetched(ds_ids):
+    tree = DevTree.__new__(DevTree)
+    with ThreadPoolExecutor(max_workers=Base._max_workers) as tree._pool:
+        return [future.result()
+                for _, future in tree._prefetch_clients(ds_ids)]
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def main(containers=1000, clients=200, latency=0.005):
+    devtree, client_lods = parse(containers, clients)
+    print('devices:               {}'.format(len(devtree)))
+    print('containers x clients:  {} x {}'.format(len(client_lods), clients))
+
+    old, old_tree = timed(slice_insert, devtree, client_lods)
+    new, new_tree = timed(single_pass, devtree, client_lods)
+    assert [ds['ds_id'] for ds in old_tree] == [ds['ds_id'] for ds in new_tree]
+    assert [ds['idx'] for ds in new_tree] == list(range(1, len(new_tree) + 1))
+    print('slice insert:          {:6.2f}s'.format(old))
+    print('single pass:           {:6.2f}s  {:.1f}x'.format(new, old / new))
+
+    Base.post = simulated_post(latency)
+    ds_ids = list(client_lods)
+    old, _ = timed(fetch_sequential, ds_ids)
+    new, _ = timed(fetch_prefetched, ds_ids)
+    print('fetch, sequential:     {:6.2f}s  ({:.0f} ms per request)'.format(
+          old, latency * 1000))
+    print('fetch, prefetched:     {:6.2f}s  {:.1f}x ({} workers)'.format(
+          new, old / new, Base._max_workers))
+
+
+if __name__ == '__main__':
+    main(*[cast(arg) for cast, arg in zip((int, int, float), sys.argv[1:])])
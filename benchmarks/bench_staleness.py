@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""
+    Time taken to build the staleness report, bucket counts per Receiver,
+    vendor/model and zone, over a built tree.
+
+    python benchmarks/bench_staleness.py [devices]
+"""
+import os
+import sys
+import time
+from datetime import datetime
+from io import StringIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mfe_saw.devindex import DevIndex
+from mfe_saw.staleness import staleness, write_csv
+from mfe_saw.treestore import TreeStore
+from bench_treestore import build_lod
+
+NOW = datetime(2017, 12, 31).timestamp()
+
+
+def main(devices=100000):
+    lod = build_lod(devices)
+    for num, ds in enumerate(lod):
+        ds['last_time'] = ('' if num % 50 == 0 else
+                           '{:02d}/{:02d}/2017 10:{:02d}:00'.format(
+                               num % 12 + 1, num % 28 + 1, num % 60))
+    devtree = TreeStore(lod)
+    del lod
+    index = DevIndex(devtree)
+
+    start = time.perf_counter()
+    rows = staleness(devtree, index, now=NOW)
+    report = time.perf_counter() - start
+    start = time.perf_counter()
+    write_csv(rows, StringIO())
+    written = time.perf_counter() - start
+
+    print('devices:               {}'.format(len(devtree)))
+    print('datasources:           {}'.format(rows[0]['total']))
+    print('report rows:           {}'.format(len(rows)))
+    print('staleness():           {:6.3f}s'.format(report))
+    print('write_csv():           {:6.3f}s'.format(written))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+    Memory used per device by the device tree as a list of dicts versus
+    the column oriented 'TreeStore'.
+
+    python benchmarks/bench_treestore.py [devices]
+"""
+import gc
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mfe_saw.datasource import DevTree
+from mfe_saw.treestore import TreeStore
+from synthetic import VENMODS, devtree_text
+
+ZONES = ['', 'HQ', 'Branch', 'DMZ']
+
+
+def build_lod(devices):
+    """
+    Parses a synthetic tree with the DevTree parser and fills in the
+    fields the other build stages would add.
+    """
+    tree = DevTree.__new__(DevTree)
+    tree._devtree = tree._parse_devtree(devtree_text(recs=10,
+                                                     ds_per_rec=devices // 10))
+    for num, ds in enumerate(tree._devtree):
+        _, ds['vendor'], ds['model'] = VENMODS[num % len(VENMODS)]
+        ds['desc'] = 'datasource'
+        ds['zone_name'] = ''.join(ZONES[num % len(ZONES)])
+        ds['zone_id'] = str(num % len(ZONES))
+        ds['last_time'] = '07/{:02d}/2017 10:{:02d}:00'.format(num % 28 + 1,
+                                                              num % 60)
+    return tree._devtree
+
+
+def main(devices=100000):
+    tracemalloc.start()
+    lod = build_lod(devices)
+    gc.collect()
+    before = tracemalloc.get_traced_memory()[0]
+
+    store = TreeStore(lod)
+    count = len(lod)
+    del lod
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    print('devices:               {}'.format(count))
+    print('list of dicts:         {:.0f} bytes/device'.format(before / count))
+    print('TreeStore:             {:.0f} bytes/device'.format(after / len(store)))
+    print('reduction:             {:.1f}x'.format(before / after))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+    Synthetic ESM payloads for the benchmarks.
+
+    Rows follow the column layout of the GRP_GETVIRTUALGROUPIPSLISTDATA
+    device tree and the DS_GETDSCLIENTLIST client files that 'DevTree'
+    parses.
+"""
+import random
+
+VENMODS = [('65', 'UNIX', 'Linux'),
+           ('43', 'Microsoft', 'Windows Event Log - WMI'),
+           ('348', 'Microsoft', 'Exchange'),
+           ('166', 'NXLog', 'Windows Event Log'),
+           ('326', 'McAfee', 'Web Gateway'),
+           ('406', 'Microsoft', 'ACS - SQL Pull'),
+           ('542', 'McAfee', 'SaaS Email Protection')]
+
+_ROW = ('{desc_id},{name},{ds_id},{order},T,T,T,T,T,T,T,T,TTT,0,0,T,'
+        '{type_id},syslog,F,F,F,TTT,0,gsyslog,0,T,F,{ds_ip},{hostname},'
+        '{clients},0,')
+
+_CLIENT = ('{ds_id},{name},T,{ds_ip},{hostname},{type_id},{vendor},{model},'
+           '51,0,0,514,F')
+
+
+def _ip(num):
+    """
+    Returns:
+        str: IPv4 address for an integer
+    """
+    return '10.{}.{}.{}'.format((num >> 16) & 255, (num >> 8) & 255,
+                                num & 255)
+
+
+def devtree_text(recs=10, ds_per_rec=1000, containers=0, clients=0):
+    """
+    Args:
+        recs (int): number of receivers
+        ds_per_rec (int): datasources under each receiver
+        containers (int): how many of those datasources have clients
+        clients (int): advertised client count for each container
+
+    Returns:
+        str: dehexified device tree, one device per line
+    """
+    rows = ['14,Local ESM,144115188075855872,0,T,T,T,T,T,T,T,T,TTT,1,0,T,'
+            '306,,F,F,F,TTT,,syslog,0,T,F,10.0.0.1,,3,1,']
+    ds_num = 1
+    for rec in range(recs):
+        rec_id = 144117387099111424 + rec * 10000000
+        rows.append(_ROW.format(desc_id='2', name='ERC-{}'.format(rec),
+                                ds_id=rec_id, order=0,
+                                type_id='TTTTTTTTTTTTTTTTTTTTTTTTTTTTTTTT',
+                                ds_ip='172.16.{}.1'.format(rec),
+                                hostname='', clients=0))
+        for num in range(ds_per_rec):
+            type_id = VENMODS[ds_num % len(VENMODS)][0]
+            rows.append(_ROW.format(desc_id='3',
+                                    name='DS-{}-{}'.format(rec, num),
+                                    ds_id=rec_id + num + 1, order=num,
+                                    type_id=type_id, ds_ip=_ip(ds_num),
+                                    hostname='host{}.corp.local'.format(ds_num),
+                                    clients=clients if num < containers else 0))
+            ds_num += 1
+    return '\n'.join(rows) + '\n'
+
+
+def clients_text(count=200, start=0):
+    """
+    Args:
+        count (int): number of client rows
+        start (int): offset for the generated ids and addresses
+
+    Returns:
+        str: dehexified client file
+    """
+    rows = []
+    for num in range(start, start + count):
+        type_id, vendor, model = VENMODS[num % len(VENMODS)]
+        rows.append(_CLIENT.format(ds_id=288230376151711744 + num,
+                                   name='client-{}'.format(num),
+                                   ds_ip=_ip(num + 1000000),
+                                   hostname='client{}.corp.local'.format(num),
+                                   type_id=type_id, vendor=vendor,
+                                   model=model))
+    return '\n'.join(rows) + '\n'
+
+
+def hexify(text):
+    """
+    Re-encodes dehexified text the way the ESM sends it.
+    """
+    return (text.replace(',', '%11')
+                .replace('\n', '%12').replace(' ', '%20')
+                .replace('.', '%2E').replace('-', '%2D'))
+
+
+def last_times_text(ds_ids, seed=1):
+    """
+    Args:
+        ds_ids (list): datasource ids to generate last event times for
+
+    Returns:
+        str: dehexified QRY_GETDEVICELASTALERTTIME style rows
+    """
+    rand = random.Random(seed)
+    rows = []
+    for ds_id in ds_ids:
+        rows.append('{},,,{:02d}/{:02d}/2017 {:02d}:{:02d}:{:02d}'.format(
+            ds_id, rand.randint(1, 12), rand.randint(1, 28),
+            rand.randint(0, 23), rand.randint(0, 59), rand.randint(0, 59)))
+    return '\n'.join(rows) + '\n'
@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""
+    mfe_saw.aggregate
+    ~~~~~~~~~~~~~
+
+    This module imports into 'DevTree' to count devices grouped by their
+    fields.
+
+    Every grouping and metric is counted in the same pass over the
+    columns of a built tree. Plain counts of one indexed field are read
+    from the index postings without a pass at all.
+"""
+from mfe_saw.devindex import DESC_CLASSES, INDEXED_FIELDS
+from mfe_saw.sqlstore import FIELDS
+
+METRICS = ['count', 'enabled', 'clients', 'heard']
+
+
+def kind_positions(index, kind, size):
+    """
+    Args:
+        index (DevIndex): indexes over the tree
+        kind (str): device class from DESC_CLASSES, None for all
+        size (int): count of devices in the tree
+
+    Returns:
+        positions of the devices of the kind in device tree order
+
+    Raises:
+        ValueError: if the kind is invalid
+    """
+    if kind is None:
+        return range(size)
+    if kind not in DESC_CLASSES:
+        raise ValueError('Invalid device kind: {}'.format(kind))
+    desc_ids = index.values('desc_id')
+    return sorted(pos for desc_id in DESC_CLASSES[kind]
+                  for pos in desc_ids.get(desc_id, []))
+
+
+def group_columns(devtree, index, fields):
+    """
+    Client datasources don't carry a rec_name so the Receiver each device
+    is under is taken from the topology instead. Devices under a DBM or
+    ACE have no Receiver in the topology and keep their rec_name, or
+    their container's for clients.
+
+    Args:
+        devtree (TreeStore): built device tree
+        index (DevIndex): indexes over devtree
+        fields (iterable): device field names
+
+    Returns:
+        dict of field name to list of values in device tree order
+
+    Raises:
+        ValueError: if a field is not a device field
+    """
+    columns = {}
+    for field in fields:
+        if field not in FIELDS:
+            raise ValueError('Invalid DataSource field: {}'.format(field))
+        if field == 'rec_name':
+            names = devtree.column('name')
+            rec_names = devtree.column('rec_name')
+            topology = index.topology
+            column = []
+            for pos, rec_name in enumerate(rec_names):
+                rec = topology.receiver(pos)
+                if rec is not None:
+                    rec_name = names[rec]
+                elif rec_name is None and topology.parent(pos) is not None:
+                    rec_name = rec_names[topology.parent(pos)]
+                column.append(rec_name)
+            columns[field] = column
+        elif field not in columns:
+            columns[field] = devtree.column(field)
+    return columns
+
+
+def _metric_flags(devtree, index, metric):
+    """
+    Returns:
+        list of bools in device tree order, whether each device counts
+        towards the metric
+
+    Raises:
+        ValueError: if the metric is invalid
+    """
+    if metric == 'enabled':
+        return [value == 'T' for value in devtree.column('enabled')]
+    if metric == 'clients':
+        return [bool(value) for value in devtree.column('client')]
+    if metric == 'heard':
+        return [index.epoch(pos) is not None for pos in range(len(devtree))]
+    raise ValueError('Invalid metric: {}'.format(metric))
+
+
+def aggregate(devtree, index, by, metrics=None, kind='datasource'):
+    """
+    Counts devices per group for several groupings at once.
+
+    Args:
+        devtree (TreeStore): built device tree
+        index (DevIndex): indexes over devtree
+        by (list): groupings, each a field name or a tuple of field
+                   names, e.g. ['rec_name', ('vendor', 'model')]
+        metrics (list): from METRICS, defaults to ['count']
+                        count       devices in the group
+                        enabled     devices with enabled 'T'
+                        clients     client datasources
+                        heard       devices with a last event time
+        kind (str): device class from DESC_CLASSES, None for all
+
+    Returns:
+        dict of each grouping to a dict of its keys to a dict of metric
+        counts. Keys are field values, tuples of them for tuple
+        groupings. Devices without a single field grouping's field are
+        left out of it, as they are from the index postings. e.g.
+
+            {'rec_name': {'ERC-1': {'count': 5}},
+             ('vendor', 'model'): {('UNIX', 'Linux'): {'count': 5}}}
+
+    Raises:
+        ValueError: if a field, metric or the kind is invalid
+    """
+    by = [grouping if isinstance(grouping, str) else tuple(grouping)
+          for grouping in by]
+    metrics = list(metrics or ['count'])
+    flagged = [metric for metric in metrics if metric != 'count']
+    positions = kind_positions(index, kind, len(devtree))
+
+    result = {}
+    scanned = []
+    members = None if kind is None else set(positions)
+    for grouping in by:
+        if grouping in INDEXED_FIELDS and not flagged:
+            result[grouping] = _posting_counts(index, grouping, members)
+        elif grouping not in scanned:
+            scanned.append(grouping)
+    if not scanned:
+        return result
+
+    fields = [field for grouping in scanned
+              for field in ((grouping,) if isinstance(grouping, str)
+                            else grouping)]
+    columns = group_columns(devtree, index, fields)
+    flags = [_metric_flags(devtree, index, metric) for metric in flagged]
+    keys = [columns[grouping] if isinstance(grouping, str)
+            else list(zip(*[columns[field] for field in grouping]))
+            for grouping in scanned]
+    counts = [{} for _ in scanned]
+    width = len(flagged) + 1
+    for pos in positions:
+        hits = [num for num, flag in enumerate(flags, start=1) if flag[pos]]
+        for gcounts, gkeys in zip(counts, keys):
+            key = gkeys[pos]
+            if key is None:
+                continue
+            row = gcounts.get(key)
+            if row is None:
+                row = gcounts[key] = [0] * width
+            row[0] += 1
+            for num in hits:
+                row[num] += 1
+
+    names = ['count'] + flagged
+    for grouping, gcounts in zip(scanned, counts):
+        result[grouping] = {key: {name: row[num] for num, name
+                                  in enumerate(names) if name in metrics}
+                            for key, row in gcounts.items()}
+    return {grouping: result[grouping] for grouping in by}
+
+
+def _posting_counts(index, field, members=None):
+    """
+    Args:
+        index (DevIndex): indexes over the tree
+        field (str): indexed field name
+        members (set): positions of the kind being counted, None for all
+
+    Returns:
+        dict of field value to {'count': devices with it}
+    """
+    if members is None:
+        return {value: {'count': len(posts)}
+                for value, posts in index.values(field).items()}
+    counts = {}
+    for value, posts in index.values(field).items():
+        count = sum(1 for pos in posts if pos in members)
+        if count:
+            counts[value] = {'count': count}
+    return counts
@@ -8,6 +8,7 @@ import ast
 import base64
 import json
 import re
+import threading
 import urllib.parse as urlparse
 from concurrent.futures import ThreadPoolExecutor
 import requests
@@ -18,11 +19,16 @@ from mfe_saw.exceptions import ESMException, ESMDataSourceNotFound
 class Base(object):
     """
     The Base class for mfe_saw objects
+
+    Every request to the ESM, from any instance or thread, holds a slot
+    of the shared _limiter so at most _max_workers run at a time.
     """
     _headers = {'Content-Type': 'application/json'}
     _baseurl = None
     _basepriv = None
     _max_workers = 10
+    _limiter = threading.BoundedSemaphore(_max_workers)
+    _parse_lock = threading.Lock()
     _ssl_verify = False
     _params = PARAMS
     
@@ -88,14 +94,25 @@ class Base(object):
         except AttributeError:
             raise ESMAuthError()
             
-    def _get_params(self, method):
+    def _get_params(self, method, values=None):
         """
         Look up parameters in params dict
+
+        Args:
+            method (str): params key
+            values (dict): values for the params, defaults to the
+                           instance attributes
         """
         self._method = method
         self._method, self.data = self._params.get(self._method)
-        self._data = self.data % self.__dict__
-        self._data = ast.literal_eval(''.join(self._data.split()))
+        # Whitespace is dropped from the template only, values such as
+        # an uploaded file chunk are passed on as they are.
+        self._data = (''.join(self.data.split())
+                      % (self.__dict__ if values is None else values))
+        # ast.literal_eval isn't safe to call from several threads at
+        # once on some Python 3.11 releases.
+        with Base._parse_lock:
+            self._data = ast.literal_eval(self._data)
         return self._method, self._data
 
     @staticmethod
@@ -160,11 +177,12 @@ class Base(object):
                 except json.JSONDecodeError:
                     raise ESMParamsError()
 
-        self._future = self._ex.submit(self._post, url=self._url,
-                                     data=self._data,
-                                     headers=self._headers,
-                                     verify=self._ssl_verify)
-        self._resp = self._future.result()
+        with Base._limiter:
+            self._future = self._ex.submit(self._post, url=self._url,
+                                         data=self._data,
+                                         headers=self._headers,
+                                         verify=self._ssl_verify)
+            self._resp = self._future.result()
 
         if self._raw:
             return self._resp
@@ -0,0 +1,875 @@
+# -*- coding: utf-8 -*-
+"""
+    mfe_saw.bulk
+    ~~~~~~~~~~~~~
+
+    This module adds batches of datasources to the ESM.
+
+    A batch is validated and checked for duplicates against the device
+    tree in one pass, then the adds are posted concurrently. Every item
+    gets an 'AddResult' and items that were added can be recorded in a
+    checkpoint file so an interrupted batch can be run again without
+    adding anything twice.
+
+    Experimental: client datasources can instead be uploaded as client
+    files, a few requests per container however many clients it gets,
+    and other datasources as the ESM's native import files, a few
+    requests per chunk of datasources. Imports are reconciled against
+    the device tree once they are done. The ESM import methods these
+    call are unverified, so they have to be asked for with
+    unverified=True.
+
+    Batches of datasources are deleted the same way round: client
+    deletions are sent a batch of ds_ids per request per container, the
+    other deletions concurrently, and the deleted devices are taken out
+    of the published tree instead of rebuilding it.
+"""
+import json
+import logging
+import threading
+from collections import namedtuple
+from concurrent.futures import (FIRST_COMPLETED, ThreadPoolExecutor,
+                                as_completed, wait)
+
+from mfe_saw.base import Base
+from mfe_saw.datasource import (DS_DEFAULTS, DS_FIELDS, NAME_PATTERN,
+                                DataSource, DevTree, _ClientFetcher)
+from mfe_saw.devindex import DESC_CLASSES, DevIndex, desc_depth
+from mfe_saw.esm import ESM
+from mfe_saw.exceptions import ESMException
+from mfe_saw.importfile import import_chunks
+from mfe_saw.treestore import TreeSnapshot
+from mfe_saw.utils import hexify
+
+AddResult = namedtuple('AddResult', ['index', 'name', 'status', 'ds_id',
+                                     'error'])
+AddResult.__doc__ = """
+    Outcome of adding one datasource from a batch.
+
+    index is the item's position in the batch. status is one of:
+        added       the ESM accepted it, ds_id is set if it was returned
+        duplicate   the name or IP is already in the zone
+        invalid     the item failed validation, see error
+        failed      the ESM request failed, see error
+        skipped     the checkpoint shows it was added by an earlier run
+    """
+
+_DUP_FIELDS = ['name', 'ds_ip', 'hostname', 'ds_id']
+
+
+def checkpoint_key(ds):
+    """
+    Returns:
+        str: key identifying the datasource in a checkpoint file
+    """
+    return '{}:{}'.format(ds.get('zone_id') or '0', ds.get('name'))
+
+
+def read_checkpoint(path):
+    """
+    Args:
+        path (str): checkpoint file written by bulk_add()
+
+    Returns:
+        dict of checkpoint key to ds_id for the datasources it records
+        as added. Empty if the file doesn't exist.
+    """
+    added = {}
+    try:
+        with open(path, 'r') as open_f:
+            for line in open_f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                added[entry['key']] = entry.get('ds_id')
+    except FileNotFoundError:
+        pass
+    return added
+
+
+def validate(ds):
+    """
+    Args:
+        ds (dict): datasource fields
+
+    Returns:
+        str: reason the datasource can't be added or None if it is valid
+    """
+    if not NAME_PATTERN.search(ds.get('name') or ''):
+        return 'Valid name required for DataSource'
+    for field in ['parent_id', 'type_id']:
+        if not ds.get(field):
+            return 'DataSource {} required'.format(field)
+    if ds.get('ds_ip'):
+        if not DataSource.valid_ip(ds['ds_ip']):
+            return 'Invalid DataSource IP: {}'.format(ds['ds_ip'])
+    elif not ds.get('hostname'):
+        return 'DataSource IP or hostname required'
+    return None
+
+
+def existing_keys():
+    """
+    Returns:
+        set of (zone_id, value) for the lowercased name, IP, hostname and
+        ds_id of every device in the tree, the fields DevTree.search()
+        matches on. The tree is built first if it hasn't been.
+    """
+    DevTree()
+    if DevTree._Backend is not None:
+        return {(ds.get('zone_id'), str(ds[field]).lower())
+                for ds in DevTree._Backend
+                for field in _DUP_FIELDS if ds.get(field)}
+    tree = DevTree._Snapshot.tree
+    zones = tree.column('zone_id')
+    keys = set()
+    for field in _DUP_FIELDS:
+        keys.update((zone, value.lower())
+                    for zone, value in zip(zones, tree.column(field))
+                    if value)
+    return keys
+
+
+def _screen(datasources, done=None, validator=validate):
+    """
+    Validates a batch and checks it for duplicates in one pass.
+
+    Args:
+        datasources (iterable): datasource dicts
+        done (dict): checkpoint keys to skip, see read_checkpoint()
+        validator (callable): returns the reason a datasource is invalid
+                              or None
+
+    Returns:
+        Generator of AddResult tuples for items that won't be added and
+        (index, ds) tuples for the rest. Names and IPs earlier in the
+        batch count as duplicates.
+    """
+    done = done or {}
+    seen = existing_keys()
+    for index, ds in enumerate(datasources):
+        name = ds.get('name')
+        zone = ds.get('zone_id') or '0'
+        dups = [(zone, str(ds[field]).lower()) for field in ['name', 'ds_ip']
+                if ds.get(field)]
+        key = checkpoint_key(ds)
+        if key in done:
+            seen.update(dups)
+            yield AddResult(index, name, 'skipped', done[key], None)
+            continue
+        error = validator(ds)
+        if error:
+            yield AddResult(index, name, 'invalid', None, error)
+            continue
+        if any(dup in seen for dup in dups):
+            yield AddResult(index, name, 'duplicate', None,
+                            'Datasource name or IP already exists.')
+            continue
+        seen.update(dups)
+        yield index, ds
+
+
+class _Adder(Base):
+    """
+    Posts datasource adds for bulk_add().
+
+    Base.post keeps each request's state on the instance, so every
+    worker thread gets an adder of its own.
+    """
+    _local = threading.local()
+
+    @classmethod
+    def submit(cls, ds):
+        """
+        Args:
+            ds (dict): validated datasource fields
+
+        Returns:
+            ds_id (str) returned by the ESM or None
+        """
+        adder = getattr(cls._local, 'adder', None)
+        if adder is None:
+            adder = cls._local.adder = cls()
+        return adder._add(ds)
+
+    def _add(self, ds):
+        """
+        Adds a datasource, or a client datasource if ds['client'] is set.
+
+        Raises:
+            ESMException: if the ESM didn't accept it
+        """
+        values = dict(DS_DEFAULTS, ds_ip='')
+        values.update(ds)
+        values['parameters'] = [{key: val for key, val in ds.items()
+                                 if key not in DS_FIELDS}]
+        if ds.get('client'):
+            self._method, self._data = self._get_params('add_client', values)
+        else:
+            self._method, self._data = self._get_params('add_ds', values)
+        self._resp = self.post(self._method, self._data)
+
+        if ds.get('client'):
+            if not self._resp or self._resp.get('EC') != '0':
+                raise ESMException('Client datasource not added: {}'
+                                   .format(self._resp))
+            return None
+        if not isinstance(self._resp, dict):
+            raise ESMException('Datasource not added: {}'.format(self._resp))
+        ds_id = self._resp.get('id')
+        if isinstance(ds_id, dict):
+            ds_id = ds_id.get('id', ds_id.get('value'))
+        return ds_id
+
+
+def bulk_add(datasources, max_workers=None, checkpoint=None):
+    """
+    Adds a batch of datasources.
+
+    Args:
+        datasources (iterable): datasource dicts as DataSource() takes
+                                them. Dicts with 'client' set are added
+                                as client datasources of their parent_id.
+        max_workers (int): adds in flight at once, defaults to
+                           Base._max_workers. Every ESM request also
+                           shares the Base limiter.
+        checkpoint (str): file recording each datasource added. Items
+                          it already records are skipped.
+
+    Returns:
+        Generator of AddResult tuples, validation and duplicate results
+        first and then adds as they complete. The device tree is marked
+        dirty once the generator is exhausted, see DevTree.mark_dirty().
+    """
+    done = read_checkpoint(checkpoint) if checkpoint else {}
+    pending = []
+    for item in _screen(datasources, done):
+        if isinstance(item, AddResult):
+            yield item
+        else:
+            pending.append(item)
+
+    if not pending:
+        return
+    log = open(checkpoint, 'a') if checkpoint else None
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers or Base._max_workers) as pool:
+            futures = {pool.submit(_Adder.submit, ds): (index, ds)
+                       for index, ds in pending}
+            for future in as_completed(futures):
+                index, ds = futures[future]
+                try:
+                    ds_id = future.result()
+                except Exception as err:
+                    logging.warning('Datasource not added: %s: %s',
+                                    ds.get('name'), err)
+                    yield AddResult(index, ds.get('name'), 'failed', None,
+                                    str(err))
+                    continue
+                if log:
+                    log.write(json.dumps({'key': checkpoint_key(ds),
+                                          'ds_id': ds_id}) + '\n')
+                    log.flush()
+                yield AddResult(index, ds.get('name'), 'added', ds_id, None)
+    finally:
+        if log:
+            log.close()
+        DevTree.mark_dirty()
+
+
+CLIENT_FIELDS = ['ds_id', 'name', 'enabled', 'ds_ip', 'hostname', 'type_id',
+                 'vendor', 'model', 'tz_id', 'dorder', 'maskflag', 'port',
+                 'syslog_tls']
+
+
+def _flag(value):
+    """
+    Returns:
+        'T' or 'F' for the ESM client file
+    """
+    return 'T' if str(value).lower() in ['t', 'true', '1', 'yes'] else 'F'
+
+
+def client_row(ds):
+    """
+    Args:
+        ds (dict): client datasource fields as DataSource() takes them
+
+    Returns:
+        str: the client as a row of the ESM client file, in the column
+        order DevTree reads client files in. New clients have no ds_id.
+    """
+    values = dict(ds, ds_id='')
+    values['enabled'] = _flag(ds.get('enabled', True))
+    values['syslog_tls'] = _flag(ds.get('syslog_tls', False))
+    if values.get('dorder') is None:
+        values['dorder'] = ds.get('date_order')
+    return ','.join('' if values.get(field) is None else str(values[field])
+                    for field in CLIENT_FIELDS)
+
+
+def client_containers():
+    """
+    Returns:
+        set of the ds_ids of the client containers in the tree, built
+        first if it hasn't been
+    """
+    DevTree()
+    if DevTree._Backend is not None:
+        return {ds['ds_id'] for ds in DevTree._Backend.client_groups()}
+    snap = DevTree._Snapshot
+    ds_ids = snap.tree.column('ds_id')
+    return {ds_ids[pos] for pos in snap.index.topology.containers}
+
+
+class _FileWriter(Base):
+    """
+    Writes files to the ESM for imports.
+    """
+    def _write_file(self, rows, chunk_size):
+        """
+        Writes the rows to a new file on the ESM, chunk_size rows per
+        request.
+
+        Returns:
+            str: ftoken of the file
+
+        Raises:
+            ESMException: if a write isn't accepted
+        """
+        self._ftoken = ''
+        for start in range(0, len(rows), chunk_size):
+            self._chunk = hexify(''.join(row + '\n' for row
+                                         in rows[start:start + chunk_size]))
+            self._method, self._data = self._get_params('get_wfile')
+            self._resp = self.post(self._method, self._data)
+            try:
+                self._ftoken = self._ftoken or self._resp['FTOKEN']
+            except (KeyError, TypeError):
+                raise ESMException('File not written to the ESM: {}'
+                                   .format(self._resp))
+        return self._ftoken
+
+    def _import_file(self, param, what):
+        """
+        Posts an import of the file written last.
+
+        Raises:
+            ESMException: if the import isn't accepted
+        """
+        self._method, self._data = self._get_params(param)
+        self._resp = self.post(self._method, self._data)
+        if not isinstance(self._resp, dict) or self._resp.get('EC', '0') != '0':
+            raise ESMException('{} not imported: {}'.format(what, self._resp))
+
+
+class _ClientUploader(_FileWriter, _ClientFetcher):
+    """
+    Uploads client files for bulk_add_clients(), one per worker thread.
+    """
+    _local = threading.local()
+
+    @classmethod
+    def upload(cls, ds_id, rows, chunk_size):
+        """
+        Args:
+            ds_id (str): client container ds_id
+            rows (list): client file rows, see client_row()
+            chunk_size (int): rows written per request
+
+        Returns:
+            dict of client name to ds_id from the container's client
+            list after the import
+        """
+        uploader = getattr(cls._local, 'uploader', None)
+        if uploader is None:
+            uploader = cls._local.uploader = cls()
+        return uploader._upload(ds_id, rows, chunk_size)
+
+    def _upload(self, ds_id, rows, chunk_size):
+        """
+        Writes the rows to a file on the ESM a chunk at a time, imports
+        it into the container and reads back the container's clients.
+
+        Raises:
+            ESMException: if a write or the import isn't accepted
+        """
+        self._write_file(rows, chunk_size)
+        self._ds_id = ds_id
+        self._import_file('import_clients', 'Client file')
+        return {client['name']: client['ds_id'] for client
+                in DevTree._iter_clients(self._get_raw_clients(ds_id))}
+
+
+def bulk_add_clients(clients, chunk_size=1000, max_workers=None,
+                     unverified=False):
+    """
+    Adds client datasources in bulk through client file uploads.
+
+    EXPERIMENTAL: the DS_IMPORTDSCLIENTS method and parameters it calls
+    are inferred, not confirmed against an ESM, so it has to be asked
+    for with unverified=True. bulk_add() is the supported way to add
+    clients.
+
+    Clients are grouped by container and each container's clients are
+    written to the ESM as one client file, chunk_size rows per request,
+    imported with one request and checked with one read of the
+    container's client list. Containers are uploaded concurrently.
+
+    Args:
+        clients (iterable): client datasource dicts as DataSource()
+                            takes them. parent_id must be the ds_id of a
+                            client container.
+        chunk_size (int): client rows written per request
+        max_workers (int): containers uploaded at once, defaults to
+                           Base._max_workers
+        unverified (bool): confirms the unverified import method may be
+                           used
+
+    Returns:
+        Generator of AddResult tuples, validation and duplicate results
+        first and then each container's clients as it completes. Clients
+        missing from the client list after the import are 'failed'.
+
+    Raises:
+        ValueError: if unverified isn't True
+    """
+    if not unverified:
+        raise ValueError('bulk_add_clients() uses an unverified ESM import '
+                         'method, pass unverified=True to use it')
+    containers = client_containers()
+
+    def validator(ds):
+        error = validate(ds)
+        if error is None and ds.get('parent_id') not in containers:
+            error = 'parent_id is not a client container: {}'.format(
+                        ds.get('parent_id'))
+        return error
+
+    groups = {}
+    for item in _screen(clients, validator=validator):
+        if isinstance(item, AddResult):
+            yield item
+        else:
+            groups.setdefault(item[1].get('parent_id'), []).append(item)
+
+    if not groups:
+        return
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers or Base._max_workers) as pool:
+            futures = {pool.submit(_ClientUploader.upload, ds_id,
+                                   [client_row(ds) for _, ds in items],
+                                   chunk_size): items
+                       for ds_id, items in groups.items()}
+            for future in as_completed(futures):
+                items = futures[future]
+                try:
+                    listed = future.result()
+                    error = 'Not in the client list after the import.'
+                except Exception as err:
+                    logging.warning('Clients not added to %s: %s',
+                                    items[0][1].get('parent_id'), err)
+                    listed = {}
+                    error = str(err)
+                for index, ds in items:
+                    if ds['name'] in listed:
+                        yield AddResult(index, ds['name'], 'added',
+                                        listed[ds['name']], None)
+                    else:
+                        yield AddResult(index, ds['name'], 'failed', None,
+                                        error)
+    finally:
+        DevTree.mark_dirty()
+
+
+
+class _Importer(_FileWriter):
+    """
+    Uploads datasource import files for bulk_import(), one per worker
+    thread.
+    """
+    _local = threading.local()
+
+    @classmethod
+    def submit(cls, text, write_size):
+        """
+        Args:
+            text (str): import file, see importfile.import_chunks()
+            write_size (int): rows written per request
+        """
+        importer = getattr(cls._local, 'importer', None)
+        if importer is None:
+            importer = cls._local.importer = cls()
+        importer._write_file(text.splitlines(), write_size)
+        importer._import_file('import_ds', 'Datasource import file')
+
+
+def _name_ids():
+    """
+    Returns:
+        dict of (zone_id, lowercased name) to ds_id for every device in
+        the tree
+    """
+    if DevTree._Backend is not None:
+        return {(ds.get('zone_id'), ds['name'].lower()): ds['ds_id']
+                for ds in DevTree._Backend if ds.get('name')}
+    tree = DevTree._Snapshot.tree
+    return {(zone, name.lower()): ds_id for zone, name, ds_id
+            in zip(tree.column('zone_id'), tree.column('name'),
+                   tree.column('ds_id')) if name}
+
+
+def bulk_import(datasources, chunk_size=5000, write_size=1000,
+                max_workers=None, unverified=False):
+    """
+    Adds datasources through the ESM's native import files instead of
+    one dsAddDataSource request each.
+
+    EXPERIMENTAL: the DS_IMPORTDATASOURCES method and parameters it
+    calls have not been confirmed against an ESM, so it has to be asked
+    for with unverified=True. bulk_add() is the supported way to add
+    datasources.
+
+    The batch is validated and checked for duplicates like bulk_add()
+    and written as '#version#' import files of up to chunk_size
+    datasources, see mfe_saw.importfile. Each file is written to the
+    ESM write_size rows per request and imported with one request,
+    max_workers files at a time. The device tree is then refreshed once
+    and every datasource looked up in it by zone and name.
+
+    Args:
+        datasources (iterable): datasource dicts as DataSource() takes
+                                them. Client datasources are invalid,
+                                see bulk_add_clients().
+        chunk_size (int): most datasources per import file
+        write_size (int): import file rows written per request
+        max_workers (int): import files in flight at once, defaults to
+                           Base._max_workers
+        unverified (bool): confirms the unverified import method may be
+                           used
+
+    Returns:
+        Generator of AddResult tuples, validation and duplicate results
+        first and then every imported datasource in batch order. A
+        datasource is 'added' with its ds_id if it is in the refreshed
+        tree, else 'failed'. Running the batch again reports the ones
+        already imported as duplicates.
+
+    Raises:
+        ValueError: if unverified isn't True
+    """
+    if not unverified:
+        raise ValueError('bulk_import() uses an unverified ESM import '
+                         'method, pass unverified=True to use it')
+    def validator(ds):
+        if ds.get('client'):
+            return 'Client datasources are added with bulk_add_clients()'
+        return validate(ds)
+
+    pending = []
+    for item in _screen(datasources, validator=validator):
+        if isinstance(item, AddResult):
+            yield item
+        else:
+            pending.append(item)
+    if not pending:
+        return
+
+    venmods = {str(type_id): (vendor, model)
+               for type_id, vendor, model in ESM()._get_ds_types()}
+    max_workers = max_workers or Base._max_workers
+    # id() of each datasource in a failed import file to the error. The
+    # datasources are held in pending for as long as errors is read.
+    errors = {}
+
+    def check(future, num, chunk):
+        try:
+            future.result()
+        except Exception as err:
+            logging.warning('Import file %d not imported: %s', num, err)
+            errors.update((id(ds), str(err)) for ds in chunk)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {}
+        chunks = import_chunks((ds for _, ds in pending), chunk_size, venmods)
+        for num, (chunk, text) in enumerate(chunks):
+            if len(futures) >= max_workers:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    check(future, *futures.pop(future))
+            futures[pool.submit(_Importer.submit, text, write_size)] = (
+                num, chunk)
+        for future in as_completed(futures):
+            check(future, *futures[future])
+
+    DevTree().refresh()
+    found = _name_ids()
+    for index, ds in pending:
+        ds_id = found.get((ds.get('zone_id') or '0', ds['name'].lower()))
+        if ds_id is not None:
+            yield AddResult(index, ds['name'], 'added', ds_id, None)
+        else:
+            yield AddResult(index, ds['name'], 'failed', None,
+                            errors.get(id(ds), 'Not in the device tree '
+                                               'after the import.'))
+
+
+DeleteResult = namedtuple('DeleteResult', ['ds_id', 'name', 'status', 'error'])
+DeleteResult.__doc__ = """
+    Outcome of deleting one datasource from a batch.
+
+    status is one of:
+        deleted     the ESM accepted the delete
+        missing     the ds_id isn't in the device tree
+        invalid     the device isn't a datasource, e.g. a Receiver
+        failed      the ESM request failed, see error
+
+    Targets below another target in the tree, e.g. clients of a
+    container that is being deleted, go with it and get its status.
+    """
+
+
+# Devices a datasource can be added under: Receiver, DBM and ACE. The
+# ESM takes their ds_id as the receiverId of a datasource below them.
+_PARENT_DESCS = ['2', '4', '15']
+
+
+def _device_lookup():
+    """
+    Returns:
+        function taking a ds_id and returning a tuple (name, desc_id,
+        receiver ds_id or None, ancestor ds_ids nearest first) for the
+        device, or None if it isn't in the tree
+    """
+    if DevTree._Backend is not None:
+        def lookup(ds_id):
+            for ds in DevTree._Backend.select('ds_id', ds_id):
+                parent_id = ds.get('parent_id')
+                rec_id = (None if ds['desc_id'] in DESC_CLASSES['client']
+                          else parent_id)
+                return (ds['name'], ds['desc_id'], rec_id,
+                        [] if parent_id is None else [parent_id])
+            return None
+        return lookup
+
+    snap = DevTree._Snapshot
+    topology = snap.index.topology if snap.index else None
+    names = snap.tree.column('name')
+    desc_ids = snap.tree.column('desc_id')
+    ds_ids = snap.tree.column('ds_id')
+    parent_ids = snap.tree.column('parent_id')
+
+    def lookup(ds_id):
+        pos = topology.position(ds_id) if topology else None
+        if pos is None:
+            return None
+        ancestors = []
+        rec_id = (None if desc_ids[pos] in DESC_CLASSES['client']
+                  else parent_ids[pos])
+        parent = topology.parent(pos)
+        while parent is not None:
+            ancestors.append(ds_ids[parent])
+            if rec_id is None and desc_ids[parent] in _PARENT_DESCS:
+                rec_id = ds_ids[parent]
+            parent = topology.parent(parent)
+        return (names[pos], desc_ids[pos], rec_id, ancestors)
+    return lookup
+
+
+def _plan_deletes(targets):
+    """
+    Resolves a batch of delete targets against the device tree.
+
+    Args:
+        targets (iterable): ds_ids or datasource dicts
+
+    Returns:
+        tuple (results, clients, datasources, covered)
+            results      DeleteResult tuples for targets that won't be
+                         deleted
+            clients      dict of container ds_id to list of (ds_id,
+                         name) of its clients to delete
+            datasources  list of (receiver ds_id, ds_id, name) of the
+                         other datasources, grouped by Receiver
+            covered      dict of ds_id to list of (ds_id, name) of the
+                         targets below it
+    """
+    lookup = _device_lookup()
+    results = []
+    found = {}
+    for target in targets:
+        ds_id = target if isinstance(target, str) else target['ds_id']
+        if ds_id in found:
+            continue
+        info = lookup(ds_id)
+        if info is None:
+            results.append(DeleteResult(ds_id, None, 'missing',
+                                        'Not in the device tree.'))
+        elif desc_depth(info[1]) < '3':
+            results.append(DeleteResult(ds_id, info[0], 'invalid',
+                                        'Only datasources can be deleted.'))
+        else:
+            found[ds_id] = info
+
+    clients = {}
+    datasources = []
+    covered = {}
+    for ds_id, (name, desc_id, rec_id, ancestors) in found.items():
+        owner = next((ancestor for ancestor in reversed(ancestors)
+                      if ancestor in found), None)
+        if owner is not None:
+            covered.setdefault(owner, []).append((ds_id, name))
+        elif desc_id in DESC_CLASSES['client']:
+            clients.setdefault(ancestors[0], []).append((ds_id, name))
+        elif rec_id is None:
+            results.append(DeleteResult(ds_id, name, 'invalid',
+                                        'No Receiver, DBM or ACE above it.'))
+        else:
+            datasources.append((rec_id, ds_id, name))
+    datasources.sort(key=lambda item: item[0] or '')
+    return results, clients, datasources, covered
+
+
+class _Deleter(Base):
+    """
+    Posts deletes for bulk_delete(), one per worker thread.
+    """
+    _local = threading.local()
+
+    @classmethod
+    def submit(cls, method, values):
+        """
+        Args:
+            method (str): 'del_ds' or 'del_client'
+            values (dict): values for the params
+        """
+        deleter = getattr(cls._local, 'deleter', None)
+        if deleter is None:
+            deleter = cls._local.deleter = cls()
+        deleter._delete(method, values)
+
+    def _delete(self, method, values):
+        """
+        Raises:
+            ESMException: if the ESM didn't accept a client delete
+        """
+        self._method, self._data = self._get_params(method, values)
+        self._resp = self.post(self._method, self._data)
+        if method == 'del_client':
+            if not isinstance(self._resp, dict) or self._resp.get('EC', '0') != '0':
+                raise ESMException('Client datasources not deleted: {}'
+                                   .format(self._resp))
+
+
+def bulk_delete(targets, batch_size=500, max_workers=None):
+    """
+    Deletes a batch of datasources and client datasources.
+
+    Targets are looked up in the device tree as it was last built.
+    Client datasources are grouped by container and deleted with one
+    request per batch_size clients. Other datasources are grouped by
+    Receiver and deleted one request each, concurrently. Deleting a
+    datasource deletes everything below it, so targets below another
+    target aren't sent.
+
+    Args:
+        targets (iterable): ds_ids or datasource dicts
+        batch_size (int): client ds_ids sent per request
+        max_workers (int): requests in flight at once, defaults to
+                           Base._max_workers
+
+    Returns:
+        Generator of DeleteResult tuples, missing and invalid targets
+        first and then deletes as they complete. Once the generator is
+        exhausted the deleted devices are taken out of the published
+        tree, see DevTree.changes(). The SQLite backend is marked dirty
+        instead, see DevTree.mark_dirty().
+
+    Warning:
+        This really does delete the datasources and ALL data ever
+        collected for them.
+    """
+    results, clients, datasources, covered = _plan_deletes(targets)
+    for result in results:
+        yield result
+
+    tasks = []
+    for container, items in clients.items():
+        for start in range(0, len(items), batch_size):
+            batch = items[start:start + batch_size]
+            tasks.append(('del_client',
+                          {'parent_id': container,
+                           'client_ids': ','.join(ds_id for ds_id, _ in batch)},
+                          batch))
+    for rec_id, ds_id, name in datasources:
+        tasks.append(('del_ds', {'parent_id': rec_id, 'ds_id': ds_id},
+                      [(ds_id, name)]))
+    if not tasks:
+        return
+
+    deleted = []
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers or Base._max_workers) as pool:
+            futures = {pool.submit(_Deleter.submit, method, values): items
+                       for method, values, items in tasks}
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                    status, error = 'deleted', None
+                except Exception as err:
+                    logging.warning('Datasources not deleted: %s: %s',
+                                    ', '.join(name for _, name
+                                              in futures[future]), err)
+                    status, error = 'failed', str(err)
+                for ds_id, name in futures[future]:
+                    if status == 'deleted':
+                        deleted.append(ds_id)
+                    yield DeleteResult(ds_id, name, status, error)
+                    for sub_id, sub_name in covered.get(ds_id, []):
+                        yield DeleteResult(sub_id, sub_name, status, error)
+    finally:
+        if deleted:
+            _prune_tree(deleted)
+
+
+def _prune_tree(ds_ids):
+    """
+    Publishes the device tree without the devices and everything below
+    them. Their containers' cached client sections are dropped so the
+    next refresh fetches those client files again.
+
+    Args:
+        ds_ids (iterable): ds_ids of deleted devices
+    """
+    if DevTree._Backend is not None:
+        DevTree.mark_dirty()
+        return
+    with DevTree._BuildLock:
+        snap = DevTree._Snapshot
+        if snap.index is None:
+            return
+        topology = snap.index.topology
+        tree_ids = snap.tree.column('ds_id')
+        gone = bytearray(len(snap.tree))
+        stale = set()
+        for ds_id in ds_ids:
+            pos = topology.position(ds_id)
+            if pos is None:
+                continue
+            end = pos + 1 + topology.subtree_size(pos)
+            gone[pos:end] = b'\x01' * (end - pos)
+            stale.add('clients:{}'.format(ds_id))
+            parent = topology.parent(pos)
+            if parent is not None:
+                stale.add('clients:{}'.format(tree_ids[parent]))
+
+        tree = snap.tree.subset(pos for pos, flag in enumerate(gone)
+                                if not flag)
+        if 'idx' in tree.fields():
+            for pos in range(len(tree)):
+                tree.set(pos, 'idx', pos + 1)
+        sections = {name: section for name, section in snap.sections.items()
+                    if name not in stale}
+        DevTree._publish(TreeSnapshot(tree, DevIndex(tree), sections,
+                                      built=snap.built, recs=snap.recs))
@@ -11,10 +11,12 @@ import textwrap
 from configparser import ConfigParser, NoSectionError, MissingSectionHeaderError
 from pathlib import Path
 from datetime import timedelta, datetime
+from itertools import chain
 
 from mfe_saw.esm import ESM 
-from mfe_saw.exceptions import ESMException
-from mfe_saw.datasource import DataSource, DevTree
+from mfe_saw.datasource import DevTree
+from mfe_saw.bulk import bulk_add, bulk_add_clients, bulk_import
+from mfe_saw.staleness import write_csv, write_ndjson
 from mfe_saw.version import __version__
 
     
@@ -34,6 +36,19 @@ def get_args(args):
                              help='Scan <dsdir> for new datasource files')
 
                              
+    parser.add_argument('--checkpoint',
+                             dest='checkpoint', default=None, metavar='file',
+                             help='With -a, record added datasources in <file> and\n'
+                                  'skip the ones it lists. Rerun with the same file\n'
+                                  'to resume an interrupted add.')
+
+    parser.add_argument('--native',
+                             action='store_true', dest='native', default=None,
+                             help='EXPERIMENTAL. With -a, add datasources through ESM\n'
+                                  'import files and clients through client file uploads\n'
+                                  'instead of one request each. The ESM import methods\n'
+                                  'it calls are unverified, use on a test ESM first.')
+
     parser.add_argument('-s',  
                              dest='search', nargs='?', default=None, metavar='term',
                              help='Search for datasource name, hostname, or IP.'
@@ -45,6 +60,37 @@ def get_args(args):
                              help=('Display datasources and date of last event.\n'
                                    'Can be filtered by: (days=x'))
                                    
+    parser.add_argument('--stale',
+                             dest='stale', nargs='?', const='csv', default=None,
+                             choices=['csv', 'ndjson'], metavar='format',
+                             help=('Report datasource counts by time since their last\n'
+                                   'event per Receiver, vendor/model and zone.\n'
+                                   'Written as csv (default) or ndjson.'))
+
+    parser.add_argument('--by',
+                             dest='by', action='append', default=None,
+                             metavar='fields',
+                             help=('Group the --stale report by these comma separated\n'
+                                   'fields instead, e.g. --by rec_name --by vendor,model'))
+
+    parser.add_argument('-c', '--cached',
+                             dest='max_age', nargs='?', const=3600, default=None,
+                             metavar='seconds', type=int,
+                             help=('Use the device tree saved on disk if it is newer\n'
+                                   'than <seconds> (default 3600) instead of\n'
+                                   'rebuilding it from the ESM.'))
+
+    parser.add_argument('--refresh',
+                             action='store_true', dest='refresh', default=None,
+                             help='Rebuild the device tree from the ESM. With -c the\n'
+                                  'saved tree is replaced.')
+
+    parser.add_argument('-r', '--rec',
+                             dest='recs', action='append', default=None,
+                             metavar='name',
+                             help='Only build the device tree for this Receiver name\n'
+                                  'or ID. May be given more than once.')
+
     parser.add_argument('-v',
                              action='store_true', dest='esm_version', default=None,
                              help='Prints the software release version for the ESM.')
@@ -53,6 +99,9 @@ def get_args(args):
                                  version="%(prog)s {}".format(__version__))
                              
     pargs = parser.parse_args()        
+    if pargs.native and pargs.checkpoint:
+        parser.error('--checkpoint is not supported with --native. Imports '
+                     'already added are reported as duplicates on a rerun.')
     return pargs
 
 class Config(object):
@@ -401,6 +450,22 @@ def verify_ds(ds_names):
         else:
             return None
 
+def get_devtree(pargs):
+    """
+    Creates the DevTree for the CLI options.
+    
+    Args:
+        pargs (obj): parsed CLI arguments
+        
+    Returns:
+        DevTree object
+    """
+    max_age = pargs.max_age
+    if pargs.refresh and max_age is not None:
+        # No saved tree is new enough, so it is built once and replaced.
+        max_age = 0
+    return DevTree(max_age=max_age, recs=pargs.recs)
+    
 def search(term, devtree):
     """
     Search the device tree for a datasource
@@ -436,7 +501,7 @@ def main():
             print("No datasource files found.")
             sys.exit(0)
         
-        devtree = DevTree()
+        devtree = get_devtree(pargs)
         ds_lod = convert_ds_files(new_files, types=config.types)
         
         recs = devtree.recs()
@@ -478,64 +543,70 @@ def main():
                 except KeyError:
                     pass
         client_grps = devtree._get_client_grps()
-        
-        dup_name = devtree.search(ds['name'], zone_id=ds.get('zone_id'))
-        dup_ip = devtree.search(ds['ds_ip'], zone_id=ds.get('zone_id'))
-        
         for ds in ds_lod:
-            if dup_name:
-                print('Duplicate datasource {}. Datasource not' 
-                       'added: {} - {}.'.format(ds['name']. ds['ds_ip']))
-                continue
-
-            if dup_ip:
-                print('Duplicate datasource IP. Datasource not' 
-                       'added: {} - {}.'.format(ds['name']. ds['ds_ip']))
-                continue
-
-            client=None
             if ds.get('client'):
-                client=True
                 for grp in client_grps:
                     if grp['type_id'] == ds['type_id']:
                         ds['parent_id'] = grp['ds_id']
-            ds = DataSource(**ds)
-            ds_to_verify = []
-            try:
-                ds.add(client=client)
-                ds_to_verify.append(ds.name)
-            except ESMException:
-                print('Duplicate datasource not added: {}.'.format(ds.name))
-                continue
 
-        
-        devtree.refresh()
-        for ds in ds_to_verify:
-            if search(ds, devtree):
-                print('DataSource successfully added: {}'.format(ds))
+        if pargs.native:
+            results = chain(bulk_import([ds for ds in ds_lod
+                                         if not ds.get('client')],
+                                        unverified=True),
+                            bulk_add_clients([ds for ds in ds_lod
+                                              if ds.get('client')],
+                                             unverified=True))
+        else:
+            results = bulk_add(ds_lod, checkpoint=pargs.checkpoint)
+        for result in results:
+            if result.status in ['added', 'skipped']:
+                print('DataSource {}: {}'.format(result.status, result.name))
             else:
-                print("Problem occured while adding datasource and it was not added.")
+                print('DataSource not added ({}): {} {}'.format(
+                        result.status, result.name, result.error or ''))
+        devtree.refresh()
             
     if pargs.search:
-        devtree = DevTree()
-        print(search(pargs.search, devtree))
+        devtree = get_devtree(pargs)
+        ds = search(pargs.search, devtree)
+        if ds:
+            print(ds)
+        else:
+            matches = devtree.search_substring(pargs.search, limit=10)
+            if not matches:
+                matches = devtree.fuzzy_search(pargs.search, limit=10)
+            if matches:
+                print('No exact match for: {}. Closest datasources:'
+                        .format(pargs.search))
+            for match in matches:
+                print(','.join([match['name'], match['ds_ip'], 
+                                match['hostname']]))
 
     
     if pargs.esm_version:
         print(esm.version())
         
     if pargs.days:
-        devtree = DevTree()
+        devtree = get_devtree(pargs)
         time_filter = datetime.now() - timedelta(days=pargs.days)
-        format = '%m/%d/%Y %H:%M:%S'
-        for ds in devtree._DevTree:
-           if ds['last_time'] and ds['desc_id'] == '3':
-               if datetime.strptime(ds['last_time'], format) < time_filter:
-                    fields = [ds['name'], ds['ds_ip'], ds['model'], 
-                               ds['rec_name'], ds['last_time']]
-                    print(','.join(fields))
+        for ds in devtree.silent_since(time_filter):
+            if ds['desc_id'] == '3':
+                fields = [ds['name'], ds['ds_ip'], ds['model'], 
+                           ds['rec_name'], ds['last_time']]
+                print(','.join(fields))
                 
 
+    if pargs.stale:
+        devtree = get_devtree(pargs)
+        groupings = None
+        if pargs.by:
+            groupings = [fields.split(',') for fields in pargs.by]
+        rows = devtree.staleness(groupings=groupings)
+        if pargs.stale == 'ndjson':
+            write_ndjson(rows, sys.stdout)
+        else:
+            write_csv(rows, sys.stdout)
+
     print(esm.type_id_to_venmod('295'))
 
         
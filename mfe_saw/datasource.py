@@ -6,22 +6,61 @@
     This module imports into the mfe_saw core class to
     provide 'DevTree' and 'DataSource' objects.
 """
-import csv
+import hashlib
 import ipaddress
 import inspect
 import json
 import logging
+import os
+import queue
 import re
 import sys
-from itertools import chain
-from io import StringIO
+import threading
+import weakref
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from itertools import chain, islice
 from functools import partial
+from urllib.parse import urlparse
 
+from mfe_saw.aggregate import aggregate
 from mfe_saw.base import Base
+from mfe_saw.details import DetailCache, fetch_details
+from mfe_saw.devindex import DESC_CLASSES, DevIndex, desc_depth
 from mfe_saw.esm import ESM
-from mfe_saw.utils import dehexify
+from mfe_saw.sqlstore import SQLiteStore
+from mfe_saw.staleness import staleness
+from mfe_saw.treediff import diff_trees
+from mfe_saw.treestore import TreeSnapshot, TreeStore
+from mfe_saw.utils import dehexify_rows
 from mfe_saw.exceptions import ESMException
 
+DS_DEFAULTS = {'ds_id': None,
+               'child_enabled': 'false',
+               'child_count': '0',
+               'child_type': '0',
+               'zone_id': '0',
+               'url': None,
+               'enabled': 'true',
+               'idm_id': '0',
+               'hostname': None,
+               'tz_id': None,
+               'dorder': None,
+               'maskflag': None,
+               'port': None,
+               'syslog_tls': None,
+               'vendor': None,
+               'model': None,
+               'client_groups': None}
+
+DS_FIELDS = ['parent_id', 'name','ds_id', 'type_id', 'rec_ip',
+             'child_enabled', 'child_count', 'child_type',
+             'ds_ip', 'zone_id', 'url', 'enabled', 'idm_id']
+
+NAME_PATTERN = re.compile('^[a-zA-Z0-9_-]{1,100}$')
+
+
 class DataSource(Base):
     """
     A DataSource object represents a validated datasource configuration.
@@ -95,30 +134,12 @@ class DataSource(Base):
         self._esm = ESM()
         self._devtree = DevTree()
 
-        self.ds_id = None
-        self.child_enabled = "false"
-        self.child_count = "0"
-        self.child_type = "0"
-        self.zone_id = "0"
-        self.url = None
-        self.enabled = 'true'
-        self.idm_id = "0"
-        self.hostname = None
-        self.tz_id = None
-        self.dorder = None
-        self.maskflag = None
-        self.port = None
-        self.syslog_tls = None
-        self.vendor = None
-        self.model = None
-        self.client_groups = None
+        self.__dict__.update(DS_DEFAULTS)
         self._prop = None
         self._pval = None
         self.__dict__.update(self._kwargs)
         
-        self._dsfields = ['parent_id', 'name','ds_id', 'type_id', 'rec_ip',
-                           'child_enabled', 'child_count', 'child_type',
-                           'ds_ip', 'zone_id', 'url', 'enabled', 'idm_id']
+        self._dsfields = DS_FIELDS
 
         self.parameters = [{self._key: self._val 
                             for self._key, self._val in self._kwargs.items()
@@ -133,7 +154,7 @@ class DataSource(Base):
             KeyError: if name is missing or invalid
         """
         try:
-            if re.search('^[a-zA-Z0-9_-]{1,100}$', self.name):
+            if NAME_PATTERN.search(self.name):
                 pass
             else:
                 raise KeyError('Valid name required for DataSource')
@@ -222,7 +243,8 @@ class DataSource(Base):
         
         Warning:
             Don't create a situation where this gets called for every
-            datasource as it will not scale.
+            datasource as it will not scale. Use DevTree.details() to
+            fetch details for many datasources.
         """
         self._method, self._data = self._get_params('ds_details')
         return self.post(self._method, self._data)
@@ -248,16 +270,178 @@ class DataSource(Base):
             return False
             
             
+class DataSourceView(object):
+    """
+    Read-only view of a datasource in the device tree.
+    
+    'DevTree' hands these out from iteration and searches instead of 
+    full DataSource objects. A view holds a reference to the tree record
+    and nothing else, so creating one costs no HTTP session, thread pool
+    or nested DevTree. The full DataSource is only built when it is 
+    needed to change something on the ESM.
+    
+    Public Methods:
+        datasource()    Returns a full DataSource object for the view.
+        
+        add()           Builds the DataSource and adds it to the ESM.
+        
+        delete()        Builds the DataSource and deletes it from the ESM.
+        
+        edit(**kwargs)  Returns a DataSource with the given attributes
+                        changed, ready to be submitted.
+        
+        props()         Returns a dict of datasource properties.
+        
+    Datasource attributes are read as attributes, ds.name, or as items,
+    ds['name'].
+    """
+    __slots__ = ('_record',)
+    
+    def __init__(self, record):
+        """
+        Args:
+            record (dict): device tree record for the datasource
+        """
+        object.__setattr__(self, '_record', record)
+        
+    def __getattr__(self, attr):
+        try:
+            return self._record[attr]
+        except KeyError:
+            raise AttributeError(attr)
+            
+    def __setattr__(self, attr, value):
+        raise AttributeError('DataSourceView is read-only. Use edit() or '
+                             'datasource() to change: {}'.format(attr))
+                             
+    def __getitem__(self, field):
+        return self._record[field]
+        
+    def get(self, field, default=None):
+        """
+        Returns:
+            Datasource field value or the default
+        """
+        return self._record.get(field, default)
+        
+    def __len__(self):
+        """
+        Returns:
+            int: Number of DataSource attributes set
+        """
+        return len(self._record)
+        
+    def __repr__(self):
+        """
+        Returns:
+            str: Datasource attributes as JSON
+        """
+        return json.dumps(self.props())
+        
+    def props(self):
+        """
+        Returns:
+            dict (str: str) of the datasource attributes
+        """
+        return dict(self._record)
+        
+    def datasource(self):
+        """
+        Returns:
+            DataSource object built from the view
+        """
+        return DataSource(**self.props())
+        
+    def add(self, client=False):
+        """
+        Adds the datasource to the ESM. See DataSource.add()
+        """
+        return self.datasource().add(client=client)
+        
+    def delete(self):
+        """
+        Deletes the datasource from the ESM. See DataSource.delete()
+        """
+        return self.datasource().delete()
+        
+    def edit(self, **kwargs):
+        """
+        Args:
+            kwargs: datasource attributes to change
+            
+        Returns:
+            DataSource object with the changes applied
+        """
+        ds_props = self.props()
+        ds_props.update(kwargs)
+        return DataSource(**ds_props)
+            
+            
+class _ClientFetcher(Base):
+    """
+    Fetches raw client files for DevTree builds.
+    
+    Base.post keeps each request's state on the instance, so every 
+    worker thread fetching clients gets a fetcher of its own.
+    """
+    _local = threading.local()
+
+    @classmethod
+    def fetch(cls, ds_id):
+        """
+        Args:
+            ds_id (str): client container ds_id
+        
+        Returns:
+            str: raw client file, using the calling thread's fetcher
+        """
+        fetcher = getattr(cls._local, 'fetcher', None)
+        if fetcher is None:
+            fetcher = cls._local.fetcher = cls()
+        return fetcher._get_raw_clients(ds_id)
+
+    def _get_raw_clients(self, ds_id):
+        """
+        Get list of raw client strings.
+        
+        Args:
+            ds_id (str): Parent ds_id(s) are collected on init
+            ftoken (str): Set and used after requesting clients for ds_id
+            
+        Returns:
+            List of strings representing unparsed client datasources
+        """
+        self._ds_id = ds_id
+        self._method, self._data = self._get_params('req_client_str')
+        self._resp = self.post(self._method, self._data)
+
+        self._ftoken = self._resp['FTOKEN']
+        return self._get_file(self._ftoken)
+
+    def _get_file(self, ftoken):
+        """
+        Exchanges token for file
+        
+        Args:
+            ftoken (str): instance name set by 
+        
+        """
+        self.ftoken = ftoken
+        self._method, self._data = self._get_params('get_rfile')
+        self._resp = self.post(self._method, self._data)
+        return self._resp['DATA']
+
+
 class DevTree(Base):
     """
     Interface to the ESM device tree.
     
     Public Methods:
     
-        search('term')      Returns a DataSource object matching the name,
+        search('term')      Returns a DataSourceView matching the name,
                         IPv4/IPv6 address, hostname or device ID.
 
-        search_group(field='term')    Returns a list of DataSource objects that match 
+        search_group(field='term')    Returns a list of DataSourceViews that match 
                                   the given term for the given field. 
                                   Valid field options include:
                                     - parent_id = '144119615532826624'
@@ -269,6 +453,33 @@ class DevTree(Base):
                                     - tz_id = '51'
                                     - tz_name = 'Darwin'
                                     - zone_id = '7'
+
+        query(kind=None,    Returns a generator of datasource dicts that
+              **criteria)   match every criteria. Uses the indexes on
+                            type_id, vendor, model, parent_id, zone_id,
+                            tz_id, port and syslog_tls. e.g.
+                                query(kind='datasource', vendor='Microsoft',
+                                      port__in=['514', '6514'],
+                                      name__prefix='exch',
+                                      last_time__lt=datetime(2017, 7, 1))
+                            See DevIndex for the supported operators.
+
+        search_cidr(network)    Returns list of datasource dicts with an
+                                IPv4/IPv6 address inside the network.
+
+        search_ip_range(start,  Returns list of datasource dicts with an
+                        end)    address between start and end inclusive.
+
+        longest_prefix(addr)    Returns tuple (network, list of dicts) for
+                                the datasources sharing the longest prefix
+                                with addr.
+
+        search_substring('exch',    Returns list of datasource dicts with
+                         limit=)    the text in the name or hostname.
+
+        fuzzy_search('exchange',    Returns list of datasource dicts ranked
+                     limit=10)      by trigram similarity of the name or
+                                    hostname.
                                     
         steptree()  Returns an ordered list of lists representing the 
                        default 'Physical Display' device tree on the ESM.
@@ -288,6 +499,13 @@ class DevTree(Base):
                                 2 = ERC/ADM/DEM/ACE/ELM/ELS
                                 3 = Datasources including EPO/NSM
                                 4 = Children and Clients
+
+        subtree(ds_id)  Returns list of datasource dicts below a 
+                        Receiver, client container or other device.
+
+        subtree_count(ds_id)    Returns count of devices below it.
+
+        receiver(ds_id)     Returns the Receiver dict a device is under.
                         
         last_times(days=,       Returns a list of DataSource objects that 
                    hours=,      the ESM has NOT heard from since the
@@ -295,53 +513,194 @@ class DevTree(Base):
                                   args are cummulative, 
                                e.g. (days=30, hours=5) will added together
 
+        silent_since(since)     Returns list of datasource dicts last 
+                                heard from before since, oldest first.
+
+        heard_between(start,    Returns list of datasource dicts last
+                      end)      heard from between start and end.
+
+        oldest(count=10)        Returns list of the count datasource 
+                                dicts heard from longest ago.
+
+        staleness(groupings=)   Returns list of report rows counting
+                                datasources per silence bucket for each
+                                Receiver, vendor/model and zone.
+
+        aggregate(by, metrics=) Returns dict of counts per group for 
+                                each of the by fields in one pass.
+
+        details(ds_ids=None)    Returns generator of DetailResult tuples
+                                with the datasource details, fetched
+                                concurrently and cached on disk.
+
 
-        refresh()   Rebuilds the tree
+        refresh(full=False,     Rebuilds the tree. Only the sections 
+                recs=None)      whose payload changed are re-fetched and
+                                re-parsed unless full=True.
+                                Returns dict of reused and rebuilt 
+                                section names.
                             
         __len__     Returns the total number of devices in the tree
         
-        __iter__    Interates through each DataSource object in the tree. 
+        __iter__    Interates through each datasource in the tree as a
+                    read-only DataSourceView. 
         
         __contains__    Returns bool as to whether a datasource name, IP,
                         hostname or ds_id exist in the device tree.
+
+        age()           Returns seconds since the tree being served was
+                        built.
+
+        mark_dirty()    Flags the tree as out of date for a background
+                        DevTreeRefresher.
+
+        diff(other)     Returns list of TreeChange tuples describing
+                        what changed from other to this tree.
+
+        changes()       Returns a generator of TreeChange tuples for 
+                        every refresh published after it is started.
+
+        save_snapshot()     Writes the tree and indexes to disk for the
+                            current ESM host.
+
+        load_snapshot(max_age=)     Loads a snapshot saved for the current
+                                    ESM host if it is newer than max_age
+                                    seconds. Returns True on success.
                         
+    Storage backends:
+    
+        By default the tree is held in memory. DevTree(db_path='file.db')
+        switches every DevTree to the SQLite backend, which streams the
+        tree into an indexed SQLite file as it is parsed. It supports 
+        search, search_ds_group, recs, steptree, len, iteration and 
+        refresh; the in-memory indexes (query, search_cidr, 
+        fuzzy_search...) are not available with it.
+        
+    The built tree and its indexes are published together as one
+    TreeSnapshot shared by every DevTree. A rebuild assembles a new 
+    snapshot and swaps it in with a single assignment, so readers in 
+    other threads keep using the snapshot they started with. Published
+    trees are frozen, records handed out can't be changed under another
+    reader, and reader methods keep their state in locals so one DevTree
+    can be shared between threads. A DevTree created with recs serves
+    its own view of the published snapshot with only those Receivers.
     """
-    _DevTree = []
+    _Snapshot = TreeSnapshot()
+    _DevTree = _Snapshot.tree
+    _DevIndex = None
+    _BuildLock = threading.Lock()
+    _Dirty = threading.Event()
+    _Backend = None
+    _Subscribers = []
 
-    def __init__(self):
+    def __init__(self, max_age=None, db_path=None, recs=None):
         """
         Initalize the DevTree object
+        
+        Args:
+            max_age (int): Optional. Seconds a snapshot saved on disk 
+                           for this ESM may be used for instead of 
+                           building the tree. Trees built or refreshed 
+                           by this object are saved when it is set.
+                           
+            db_path (str): Optional. SQLite file to use as the storage
+                           backend for all DevTree objects.
+                           
+            recs (list): Optional. Receiver names or ds_ids to serve
+                         the tree for. This DevTree only serves the ESM,
+                         other top level devices, DBMs and ACEs and the 
+                         devices under them and under these Receivers.
+                         The published tree still holds every Receiver,
+                         other DevTrees are unaffected. With the SQLite
+                         backend the backend is built for these 
+                         Receivers instead.
+                         
+        Raises:
+            ValueError: if one of recs isn't a Receiver on the ESM
         """
         super().__init__()
         if Base._baseurl == None:
             raise ESMException('ESM URL not set. Are you logged in?')
         self._esm = ESM()    
-        if not DevTree._DevTree:
-            self._build_devtree()
+        self._max_age = max_age
+        self._rec_ids = self._resolve_recs(recs)
+        self._view = None
+        if db_path:
+            DevTree._Backend = SQLiteStore(db_path)
+        if DevTree._Backend is not None:
+            with DevTree._BuildLock:
+                if not DevTree._Backend.built():
+                    self._build_sqlite(self._rec_ids)
+        elif self._needs_build():
+            with DevTree._BuildLock:
+                if self._needs_build():
+                    if (self._max_age is None 
+                            or not self.load_snapshot(self._max_age)):
+                        self._build_devtree()
+                        self._save_cached()
+        self._served = self._snapshot()
+
+    @staticmethod
+    def _needs_build():
+        """
+        Returns:
+            bool: True if no tree has been published
+        """
+        return DevTree._Snapshot.built is None
+
+    def _resolve_recs(self, recs):
+        """
+        Args:
+            recs (list): Receiver names or ds_ids, None for all
+            
+        Returns:
+            tuple of sorted Receiver ds_ids or None for all Receivers
+            
+        Raises:
+            ValueError: if one of recs isn't a Receiver on the ESM
+        """
+        if recs is None or recs == 'all':
+            return None
+        if isinstance(recs, str):
+            recs = [recs]
+        self._known_recs = {}
+        for name, rec_id in self._esm.recs():
+            self._known_recs[name] = self._known_recs[str(rec_id)] = str(rec_id)
+        self._unknown = [str(rec) for rec in recs 
+                            if str(rec) not in self._known_recs]
+        if self._unknown:
+            raise ValueError('Receiver not found: {}'
+                                .format(', '.join(self._unknown)))
+        return tuple(sorted({self._known_recs[str(rec)] for rec in recs}))
 
     def __len__(self):
         """
         Returns the count of devices in the device tree.
         """
-        return len(DevTree._DevTree)
+        if DevTree._Backend is not None:
+            return len(DevTree._Backend)
+        return len(self._snapshot().tree)
         
     def __iter__(self):
         """
         Returns:
-            Generator with datasource objects.
-        """
-        self._ds_desc_ids = ['3', '256']
-        for self._ds in DevTree._DevTree:
-            if self._ds['desc_id'] in self._ds_desc_ids:
-                yield DataSource(**self._ds)
+            Generator with DataSourceView objects.
+        """
+        if DevTree._Backend is not None:
+            for ds in DevTree._Backend:
+                if ds['desc_id'] in DESC_CLASSES['datasource']:
+                    yield DataSourceView(ds)
+            return
+        snap = self._snapshot()
+        for pos in snap.index.select(kind='datasource'):
+            yield DataSourceView(snap.tree[pos])
 
     def __contains__(self, term):
         """
         Returns:
             bool: True/False the name or IP matches the provided search term.
         """
-        self._cterm = term
-        if self.search(self._cterm):
+        if self.search(term):
             return True
         else:
             return None
@@ -354,26 +713,26 @@ class DevTree(Base):
             zone_id (int): Provide zone_id to limit search to a specific zone
 
         Returns:
-            Datasource object that matches the provided search term or None.
+            DataSourceView that matches the provided search term or None.
 
         """
-        self._term = term.lower()
-        self._rec_id = rec_id
-        self._zone_id = zone_id
-
-        self._search_fields = ['ds_ip', 'name', 'hostname', 'ds_id']
-
-        self._found = [self._ds for self._ds in DevTree._DevTree 
-                            for self._field in self._search_fields 
-                            if self._ds[self._field].lower() == self._term 
-                            if self._ds['zone_id'] == self._zone_id]
+        if DevTree._Backend is not None:
+            ds = DevTree._Backend.search(term, rec_id, zone_id)
+            return DataSourceView(ds) if ds else None
+            
+        snap = self._snapshot()
+        if snap.index is None:
+            return None
+        tree = snap.tree
+        found = [pos for pos in snap.index.lookup(term)
+                    if tree[pos].get('zone_id') == zone_id]
 
-        if self._rec_id and len(self._found) > 1:
-            self._found = [self._ds for self._ds in self._found 
-                            if self._ds['parent_id'] == self._rec_id]
+        if rec_id and len(found) > 1:
+            found = [pos for pos in found
+                        if tree[pos].get('parent_id') == rec_id]
         
-        if self._found:
-            return DataSource(**self._found[0])
+        if found:
+            return DataSourceView(tree[found[0]])
         else:
             return None
 
@@ -384,24 +743,111 @@ class DevTree(Base):
             term (str): Data to search for in specified field
             
         Returns:
-            Generator containing any matching DataSource objects or None
+            Generator containing any matching DataSourceView objects.
             Result must be iterated through.
             
         Raises:
             ValueError: if field or term are None
         """
-        self._field = field
-        self._term = term
-        self._zone_id = zone_id
-        
-        if not self._field:
+        if not field:
             raise ValueError('DataSource field required')
 
-        if not self._term:
+        if not term:
             raise ValueError('DataSource field value required')
 
-        return (DataSource(self._ds) for self._ds in DevTree._DevTree
-                        if self._ds.get(self._field) == self._term)
+        if DevTree._Backend is not None:
+            return (DataSourceView(ds) 
+                        for ds in DevTree._Backend.select(field, term))
+
+        return (DataSourceView(ds) for ds in self.query(**{field: term}))
+
+    def query(self, kind=None, **criteria):
+        """
+        Args:
+            kind (str): Optional device class, e.g. 'datasource', 'client',
+                        'receiver'. See mfe_saw.devindex.DESC_CLASSES
+            criteria: field=value or field__op=value where op is one of
+                      in, prefix, gt, gte, lt or lte.
+                      
+        Returns:
+            Generator of matching datasource dicts in device tree order.
+            
+        Raises:
+            ValueError: if the kind, field or operator is invalid
+        """
+        snap = self._snapshot()
+        return (snap.tree[pos] for pos in snap.index.select(kind=kind, **criteria))
+
+    def search_cidr(self, network):
+        """
+        Args:
+            network (str): IPv4/IPv6 network, e.g. '10.1.0.0/16'
+            
+        Returns:
+            List of datasource dicts in address order, includes clients.
+            
+        Raises:
+            ValueError: if the network is not valid
+        """
+        snap = self._snapshot()
+        return [snap.tree[pos] for pos in snap.index.ips.cidr(network)]
+
+    def search_ip_range(self, start, end):
+        """
+        Args:
+            start (str): first IPv4/IPv6 address of the range
+            end (str): last IPv4/IPv6 address of the range
+            
+        Returns:
+            List of datasource dicts in address order, includes clients.
+            
+        Raises:
+            ValueError: if the addresses are not valid
+        """
+        snap = self._snapshot()
+        return [snap.tree[pos] for pos in snap.index.ips.range(start, end)]
+
+    def longest_prefix(self, addr):
+        """
+        Args:
+            addr (str): IPv4/IPv6 address
+            
+        Returns:
+            Tuple (network, list of datasource dicts) for the longest 
+            network addr shares with any datasource. An exact match
+            returns a /32 or /128 network. (None, []) if no datasource
+            has an address of the same version.
+        """
+        snap = self._snapshot()
+        net, positions = snap.index.ips.longest_prefix(addr)
+        if net is None:
+            return (None, [])
+        return (net, [snap.tree[pos] for pos in positions])
+
+    def search_substring(self, term, limit=None):
+        """
+        Args:
+            term (str): Case insensitive text to find in the datasource
+                        name or hostname
+            limit (int): Max number of results
+            
+        Returns:
+            List of datasource dicts in device tree order.
+        """
+        snap = self._snapshot()
+        return [snap.tree[pos] for pos in snap.index.names.substring(term, limit)]
+
+    def fuzzy_search(self, term, limit=10):
+        """
+        Args:
+            term (str): Approximate datasource name or hostname
+            limit (int): Max number of results
+            
+        Returns:
+            List of datasource dicts, closest match first.
+        """
+        snap = self._snapshot()
+        return [snap.tree[pos] for _, pos in snap.index.names.fuzzy(term, limit)]
                        
     def steptree(self):
         """
@@ -417,204 +863,942 @@ class DevTree(Base):
         Returns:
             List of tuples (int,str,str,str) (step, name, ip, parent_id)        
         """
-        self._steptree = []
-        self._ones = ['14']
-        self._twos = ['2', '4', '10', '12', '15', '25']
-        self._threes = ['3', '5', '7', '17', '19', '20', '21', '24', '254']
-        self._fours = ['7','17', '23', '256']
-
-        for self._ds in DevTree._DevTree:
-            if self._ds['desc_id'] in self._ones:
-                self._ds['depth'] = '1'
-            elif self._ds['desc_id'] in self._twos:
-                self._ds['depth'] = '2'
-            elif self._ds['desc_id'] in self._threes:
-                self._ds['depth'] = '3'
-            else:
-                self._ds['depth'] = '4'
-            self._steptree.append((self._ds['idx'], self._ds['name'], 
-                                    self._ds['ds_ip'], self._ds['depth'],))
-        return self._steptree
+        if DevTree._Backend is not None:
+            return DevTree._Backend.steptree()
+            
+        snap = self._snapshot()
+        topology = snap.index.topology
+        return [(idx, name, ds_ip, str(topology.depth(pos)))
+                    for pos, (idx, name, ds_ip) in enumerate(zip(
+                        snap.tree.column('idx'), snap.tree.column('name'),
+                        snap.tree.column('ds_ip')))]
 
-                    
-    def refresh(self):
-        """
-        Rebuilds the devtree
-        """
-        self._build_devtree()
-        
-    def get_ds_times(self):
+    def last_times(self, days=0, hours=0, minutes=0):
         """
-        """
-        self._last_times = self._get_last_event_times()
-        self._insert_ds_last_times(self._last_times)
+        Args:
+            days, hours, minutes (int): added together into the 
+                                        timeframe to look back
         
-    def recs(self):
-        """
         Returns:
-            list of Receiver dicts (str:str)
-        """
-        return [self._rec for self._rec in DevTree._DevTree 
-                    if self._rec['desc_id'] == '2']
-    
-    def _build_devtree(self):
-        """
-        Coordinates assembly of the devtree object
+            List of DataSourceView objects for the datasources the ESM 
+            has not heard from within the timeframe, oldest first.
         """
-        self._devtree = self._get_devtree()
-        self._devtree = self._devtree_to_lod()
-        self._devtree = self._insert_rec_info()
-        self._client_containers = self._get_client_containers()
+        since = datetime.now() - timedelta(days=days, hours=hours,
+                                           minutes=minutes)
+        return [DataSourceView(ds) for ds in self.silent_since(since)]
 
+    def silent_since(self, since, kind='datasource'):
         """
-        This next bit of code gets and formats the clients for each
-        container and inserts them back into the devtree.
-        
-        The tricky part is keeping the devtree in order and keeping 
-        index labels consistent for all of the devices while 
-        inserting new devices into the middle with their own index
-        labels. Kind of like changing a tire on a moving car...
-        
-        pidx - parent idx is the original index value of the parent
-                this does not increment
-                
-        cidx - client idx is incremented starting after the pidx
-        
-        didx - stores the delta between different containers to 
-               keep it all in sync.
-        """
-        self._cidx = 0
-        self._didx = 0
-        for self._container in self._client_containers:
-            self._raw_clients = self._get_raw_clients(self._container['ds_id'])
-            self._clients_lod = self._clients_to_lod(self._raw_clients)
-            self._container['idx'] = self._container['idx'] + self._didx
-            self._pidx = self._container['idx']
-            self._cidx = self._pidx + 1 
-            for self._client in self._clients_lod:
-                self._client['parent_id'] = self._container['ds_id']
-                self._client['idx'] = self._cidx 
-                self._cidx += 1 
-                self._didx += 1
-            self._devtree[self._pidx:self._pidx] = self._clients_lod 
-            
-        self._zonetree = self._get_zonetree()
-        self._devtree = self._insert_zone_names()
-        self._zone_map = self._get_zone_map()
-        self._devtree = self._insert_zone_ids()            
-        self._devtree = self._insert_venmods()
-        self._devtree = self._insert_desc_names()
-        self._last_times = self._get_last_event_times()
-        self._insert_ds_last_times()
-        DevTree._DevTree = self._devtree
-               
-    def _get_devtree(self):
-        """
+        Args:
+            since: datetime, epoch seconds or '%m/%d/%Y %H:%M:%S' string
+            kind (str): device class from DESC_CLASSES, None for all
+            
         Returns:
-            ESM device tree; raw, but ordered, string.
-            Does not include client datasources.
+            List of datasource dicts last heard from before since, 
+            oldest first. Datasources the ESM has no last event time 
+            for are not included.
         """
-        self._method, self._data = self._get_params('get_devtree')
-        self._resp = self.post(self._method, self._data)
-        return dehexify(self._resp['ITEMS'])
+        snap = self._snapshot()
+        return self._by_last_time(snap, snap.index.last_times.before(since),
+                                    kind)
 
-    def _devtree_to_lod(self):
-        """
-        Parse key fields from raw device strings into datasource dicts
-        
-        Returns: 
-            List of datasource dicts
+    def heard_between(self, start, end, kind='datasource'):
         """
-        self._devtree_io = StringIO(self._devtree)
-        self._devtree_csv = csv.reader(self._devtree_io, delimiter=',')
-        self._devtree_lod = []
-
-        for self._idx, self._row in enumerate(self._devtree_csv, start=1):
-            if len(self._row) == 0:
-                continue
-            
-            if self._row[0] == '16':  # Get rid of duplicate 'asset' devices
-                continue
+        Args:
+            start: datetime, epoch seconds or '%m/%d/%Y %H:%M:%S' string
+            end: datetime, epoch seconds or '%m/%d/%Y %H:%M:%S' string
+            kind (str): device class from DESC_CLASSES, None for all
             
-            if self._row[2] == "3":  # Client group datasource group containers
-                self._row.pop(0)     # are fake datasources that seemingly have
-                self._row.pop(0)     # two uneeded fields at the beginning.
+        Returns:
+            List of datasource dicts last heard from between start and 
+            end inclusive, oldest first.
+        """
+        snap = self._snapshot()
+        return self._by_last_time(snap, 
+                                    snap.index.last_times.between(start, end),
+                                    kind)
 
-            if self._row[16] == 'TTTTTTTTTTTTTTTTTTTTTTTTTTTTTTTT':
-                self._row[16] = '0'  # Get rid of weird type-id for N/A devices
-                
-            self._ds_fields = {'idx': self._idx,
-                                'desc_id': self._row[0],
-                                'name': self._row[1],
-                                'ds_id': self._row[2],
-                                'enabled': self._row[15],
-                                'ds_ip': self._row[27],
-                                'hostname' : self._row[28],
-                                'type_id': self._row[16],
-                                'vendor': '',
-                                'model': '',
-                                'tz_id': '',
-                                'date_order': '',
-                                'port': '',
-                                'syslog_tls': '',
-                                'client_groups': self._row[29],
-                                'zone_name': '',
-                                'zone_id': '',
-                                'client': False
-                              }
-            self._devtree_lod.append(self._ds_fields)
-        return self._devtree_lod
-
-    def _insert_rec_info(self):
+    def oldest(self, count=10, kind='datasource'):
         """
-        Adds parent_ids to datasources in the tree based upon the 
-        ordered list provided by the ESM. All the datasources below
-        a Receiver row have it's id set as their parent ID.
-        
+        Args:
+            count (int): max number of results
+            kind (str): device class from DESC_CLASSES, None for all
+            
         Returns:
-            List of datasource dicts
+            List of the count datasource dicts heard from longest ago.
+        """
+        snap = self._snapshot()
+        if kind is None:
+            return self._by_last_time(snap, 
+                                        snap.index.last_times.oldest(count),
+                                        None)
+        return self._by_last_time(snap, 
+                                    snap.index.last_times.oldest(len(snap.tree)),
+                                    kind, count)
+
+    def staleness(self, groupings=None, buckets=None, now=None,
+                    kind='datasource'):
         """
-        self._pid = '0'
-        self._rec_name = ''
-        for self._ds in self._devtree:
-            if self._ds['desc_id'] in ['2', '4', '15']:
-                self._pid = self._ds['ds_id']
-                self._rec_name = self._ds['name']
-                continue
+        Args:
+            groupings (list): tuples of fields to group by, defaults to
+                              rec_name, vendor/model and zone_name
+            buckets (list): (label, max age seconds) tuples, defaults to
+                            staleness.BUCKETS
+            now: datetime or epoch seconds the ages are measured from
+            kind (str): device class from DESC_CLASSES, None for all
             
-            if self._ds['desc_id'] in ['3', '5', '7', '17']:
-                self._ds['parent_id'] = self._pid
-                self._ds['rec_name'] = self._rec_name
-        return self._devtree
+        Returns:
+            List of report rows, see staleness.staleness(). They can be
+            written with staleness.write_csv() or write_ndjson().
+        """
+        if isinstance(now, datetime):
+            now = now.timestamp()
+        snap = self._snapshot()
+        return staleness(snap.tree, snap.index, groupings=groupings,
+                         buckets=buckets, now=now, kind=kind)
 
-    def _get_client_containers(self):
+    def aggregate(self, by, metrics=None, kind='datasource'):
         """
-        Filters DevTree for datasources that have client datasources.
-        
+        Args:
+            by (list): fields or tuples of fields to group by, e.g. 
+                       ['rec_name', ('vendor', 'model'), 'type_id', 
+                        'zone_name', 'enabled', 'client']
+            metrics (list): any of 'count', 'enabled', 'clients' and 
+                            'heard', defaults to ['count']
+            kind (str): device class from DESC_CLASSES, None for all
+            
         Returns:
-            List of datasource dicts that have clients
-        """
-        return [self._ds for self._ds in self._devtree
-                                if self._ds['desc_id'] == "3" 
-                                if int(self._ds['client_groups']) > 0]
+            dict of each grouping to a dict of its values to a dict of
+            metric counts, see aggregate.aggregate()
         
-    def _get_raw_clients(self, ds_id):
+        Note:
+            For datasource counts per type_id without building the 
+            tree use ESM().ds_count_by_type().
         """
-        Get list of raw client strings.
+        snap = self._snapshot()
+        return aggregate(snap.tree, snap.index, by, metrics=metrics, 
+                         kind=kind)
+
+    def details(self, ds_ids=None, kind='datasource', cache_path=None, 
+                max_workers=None):
+        """
+        Fetches datasource details for many datasources, see 
+        details.fetch_details().
         
         Args:
-            ds_id (str): Parent ds_id(s) are collected on init
-            ftoken (str): Set and used after requesting clients for ds_id
+            ds_ids (iterable): ds_ids or datasource dicts, e.g. from 
+                               query(). Defaults to every device of kind.
+            kind (str): device class from DESC_CLASSES, None for all
+            cache_path (str): SQLite detail cache, defaults to 
+                              details_path(). ':memory:' for none.
+            max_workers (int): requests in flight at once
             
         Returns:
-            List of strings representing unparsed client datasources
-        """
-        self._ds_id = ds_id
-        self._method, self._data = self._get_params('req_client_str')
+            Generator of DetailResult tuples, cached details first and 
+            then the rest as they are fetched. The cache is closed when
+            the generator is finished or closed.
+        """
+        cache_path = cache_path or self.details_path()
+        if cache_path != ':memory:':
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        snap = self._snapshot()
+        cache = DetailCache(cache_path)
+        try:
+            yield from fetch_details(snap.tree, snap.index, ds_ids=ds_ids, 
+                                     kind=kind, cache=cache, 
+                                     max_workers=max_workers)
+        finally:
+            cache.close()
+
+    @staticmethod
+    def _by_last_time(snap, positions, kind, limit=None):
+        """
+        Args:
+            snap (TreeSnapshot): snapshot the positions are from
+            positions (iterable): positions from the LastTimeIndex
+            kind (str): device class from DESC_CLASSES, None for all
+            limit (int): max number of results
+            
+        Returns:
+            List of datasource dicts for the positions of the kind
+            
+        Raises:
+            ValueError: if the kind is invalid
+        """
+        if kind is not None:
+            if kind not in DESC_CLASSES:
+                raise ValueError('Invalid device kind: {}'.format(kind))
+            desc_ids = snap.index.values('desc_id')
+            members = set()
+            for desc_id in DESC_CLASSES[kind]:
+                members.update(desc_ids.get(desc_id, []))
+            positions = (pos for pos in positions if pos in members)
+        return [snap.tree[pos] for pos in islice(positions, limit)]
+
+    def subtree(self, ds_id):
+        """
+        Args:
+            ds_id (str): ds_id of a Receiver, client container or any
+                         other device
+            
+        Returns:
+            List of datasource dicts below the device in device tree 
+            order. Empty if the ds_id isn't in the tree.
+        """
+        snap = self._snapshot()
+        pos = snap.index.topology.position(ds_id)
+        if pos is None:
+            return []
+        return [snap.tree[sub] for sub in snap.index.topology.subtree(pos)]
+
+    def subtree_count(self, ds_id):
+        """
+        Returns:
+            int: count of devices below the ds_id, 0 if it isn't in 
+            the tree
+        """
+        topology = self._snapshot().index.topology
+        pos = topology.position(ds_id)
+        return 0 if pos is None else topology.subtree_size(pos)
+
+    def receiver(self, ds_id):
+        """
+        Returns:
+            Receiver dict the ds_id is under or None
+        """
+        snap = self._snapshot()
+        pos = snap.index.topology.position(ds_id)
+        if pos is None:
+            return None
+        rec = snap.index.topology.receiver(pos)
+        return None if rec is None else snap.tree[rec]
+
+                    
+    def refresh(self, full=False, recs=None):
+        """
+        Rebuilds the devtree
+        
+        The top level tree, zone tree and each container's client file 
+        are kept with a digest of the payload they were parsed from. 
+        A container's clients are only re-fetched when its advertised 
+        client count changes and any payload with an unchanged digest 
+        is not parsed again. Last event times are always re-fetched.
+        
+        Args:
+            full (bool): ignore the digests and rebuild everything
+            recs (list): Receiver names or ds_ids this DevTree serves
+                         from now on, 'all' for every Receiver. Defaults
+                         to the Receivers it already serves. See 
+                         DevTree(recs=).
+        
+        Returns:
+            dict (str: list) with 'reused' and 'rebuilt' section names.
+            Sections are 'devtree', 'zonetree' and 'clients:<ds_id>'.
+            
+        Raises:
+            ValueError: if one of recs isn't a Receiver on the ESM
+        """
+        if recs is not None:
+            self._rec_ids = self._resolve_recs(recs)
+        with DevTree._BuildLock:
+            if DevTree._Backend is not None:
+                return self._build_sqlite(self._rec_ids)
+            self._report = self._build_devtree(full=full)
+            self._served = self._snapshot()
+            self._save_cached()
+            return self._report
+
+    def age(self):
+        """
+        Returns:
+            float: seconds since the tree being served was built
+        """
+        return DevTree._Snapshot.age()
+
+    @staticmethod
+    def snapshot_path(host=None):
+        """
+        Args:
+            host (str): ESM host, defaults to the logged in ESM
+            
+        Returns:
+            str: path of the on disk snapshot for the host
+        """
+        return DevTree._cache_path('devtree-{}.snap', host)
+
+    @staticmethod
+    def details_path(host=None):
+        """
+        Args:
+            host (str): ESM host, defaults to the logged in ESM
+            
+        Returns:
+            str: path of the on disk datasource detail cache for the host
+        """
+        return DevTree._cache_path('details-{}.db', host)
+
+    @staticmethod
+    def _cache_path(template, host=None):
+        """
+        Returns:
+            str: path of a file in the mfe_saw cache directory, named 
+            from the template and the host
+        """
+        if not host:
+            host = urlparse(Base._baseurl).netloc
+        if 'LOCALAPPDATA' in os.environ:
+            cache_dir = os.path.join(os.environ['LOCALAPPDATA'], 'mfe_saw')
+        elif 'XDG_CACHE_HOME' in os.environ:
+            cache_dir = os.path.join(os.environ['XDG_CACHE_HOME'], 'mfe_saw')
+        else:
+            cache_dir = os.path.join(os.path.expanduser('~'), '.cache', 'mfe_saw')
+        return os.path.join(cache_dir, template.format(
+                                re.sub('[^A-Za-z0-9_.-]', '_', host)))
+
+    def save_snapshot(self, path=None):
+        """
+        Writes the current tree and its indexes to disk.
+        
+        Args:
+            path (str): Optional file, defaults to snapshot_path()
+        """
+        self._path = path or self.snapshot_path()
+        os.makedirs(os.path.dirname(self._path), exist_ok=True)
+        DevTree._Snapshot.save(self._path, urlparse(Base._baseurl).netloc)
+
+    def load_snapshot(self, max_age=None, path=None):
+        """
+        Loads and publishes a snapshot saved by save_snapshot().
+        
+        Args:
+            max_age (int): Seconds. Older snapshots are not loaded.
+            path (str): Optional file, defaults to snapshot_path()
+            
+        Returns:
+            bool: True if a snapshot was loaded. Snapshots built for 
+            only some Receivers are not loaded.
+        """
+        self._path = path or self.snapshot_path()
+        self._snap = TreeSnapshot.load(self._path, 
+                                        urlparse(Base._baseurl).netloc,
+                                        max_age=max_age)
+        if self._snap is None or self._snap.recs is not None:
+            return False
+        self._publish(self._snap)
+        self._served = self._snapshot()
+        return True
+
+    def _save_cached(self):
+        """
+        Saves the snapshot if this DevTree was created with max_age.
+        """
+        if self._max_age is None:
+            return
+        try:
+            self.save_snapshot()
+        except OSError as err:
+            logging.warning('Unable to save DevTree snapshot: %s', err)
+
+    def diff(self, other, fields=None):
+        """
+        Args:
+            other: Older DevTree, TreeSnapshot, TreeStore or list of 
+                   datasource dicts to compare against
+            fields (list): Optional fields to compare. See 
+                           mfe_saw.treediff.DIFF_FIELDS
+            
+        Returns:
+            List of TreeChange tuples (kind, ds_id, name, field, old, new)
+            from other to this tree. kind is 'added', 'removed', 
+            'changed' or 'moved'.
+            
+        Note:
+            Both this DevTree and another DevTree compare as the 
+            snapshot each was created, loaded or last refreshed with,
+            so one kept from before a refresh diffs against the tree 
+            from before it. With the SQLite backend there is only the
+            current tree.
+        """
+        if DevTree._Backend is not None:
+            tree = self._tree()
+            if isinstance(other, DevTree):
+                other = tree
+        else:
+            tree = self._served.tree
+            if isinstance(other, DevTree):
+                other = other._served
+        other = getattr(other, 'tree', other)
+        return list(diff_trees(other, tree, fields))
+
+    def _tree(self):
+        """
+        Returns:
+            The device tree being served, from the backend if one is set
+        """
+        if DevTree._Backend is not None:
+            return list(DevTree._Backend)
+        return self._snapshot().tree
+
+    def changes(self, timeout=None):
+        """
+        Streams the changes made by each refresh, including refreshes 
+        by a DevTreeRefresher in another thread. Changes are collected
+        from the time changes() is called.
+        
+        Args:
+            timeout (float): Seconds to wait for the next change before
+                             the generator ends. None waits forever.
+        
+        Returns:
+            Generator of TreeChange tuples
+        """
+        changes = queue.Queue()
+        DevTree._Subscribers.append(changes)
+        stream = self._stream_changes(changes, timeout)
+        weakref.finalize(stream, DevTree._unsubscribe, changes)
+        return stream
+
+    @staticmethod
+    def _stream_changes(changes, timeout):
+        """
+        Returns:
+            Generator of TreeChange tuples from a subscriber queue
+        """
+        try:
+            while True:
+                try:
+                    yield changes.get(timeout=timeout)
+                except queue.Empty:
+                    return
+        finally:
+            DevTree._unsubscribe(changes)
+
+    @staticmethod
+    def _unsubscribe(changes):
+        """
+        Stops sending changes to a subscriber queue.
+        """
+        if changes in DevTree._Subscribers:
+            DevTree._Subscribers.remove(changes)
+
+    @staticmethod
+    def mark_dirty():
+        """
+        Flags the tree as out of date. A running DevTreeRefresher will
+        rebuild it without waiting for its interval.
+        """
+        DevTree._Dirty.set()
+        
+    def get_ds_times(self):
+        """
+        Refreshes the last event times only and publishes them as a new
+        snapshot.
+        """
+        with DevTree._BuildLock:
+            self._snap = DevTree._Snapshot
+            self._devtree = self._snap.tree.copy()
+            self._last_times = self._get_last_event_times()
+            self._insert_ds_last_times()
+            self._publish(TreeSnapshot(self._devtree, DevIndex(self._devtree),
+                                        self._snap.sections, 
+                                        recs=self._snap.recs))
+            self._served = self._snapshot()
+        
+    def recs(self):
+        """
+        Returns:
+            list of Receiver dicts (str:str). They are copies, changing
+            them doesn't change the tree.
+        """
+        if DevTree._Backend is not None:
+            return DevTree._Backend.recs()
+        snap = self._snapshot()
+        return [snap.tree[pos].copy() for pos in snap.index.topology.receivers]
+    
+    def _build_devtree(self, full=True):
+        """
+        Coordinates assembly of the devtree object
+        
+        The build is a pipeline of generators. Each payload is decoded
+        and split a row at a time, rows are mapped to datasource dicts, 
+        clients are spliced in behind their container and every device
+        is enriched on its way into the TreeStore. Only the parsed 
+        sections kept for the next incremental build are held as lists.
+        
+        Args:
+            full (bool): ignore the section digests from the last build
+        
+        Returns:
+            dict (str: list) with 'reused' and 'rebuilt' section names
+        """
+        DevTree._Dirty.clear()
+        self._old_sections = {} if full else DevTree._Snapshot.sections
+        self._sections = {}
+        self._reused = []
+        self._rebuilt = []
+
+        self._devtree = self._section('devtree', self._get_devtree(), 
+                                        self._parse_devtree)
+        with ThreadPoolExecutor(max_workers=Base._max_workers) as self._pool:
+            self._prefetched = self._prefetch_clients(
+                                    ds['ds_id'] for ds in self._devtree 
+                                    if self._has_clients(ds)
+                                    and not self._cached_clients(ds))
+            self._zone_names, self._zone_map = self._section('zonetree', 
+                                                    self._get_zonetree(),
+                                                    self._parse_zonetree)
+            self._meth, self._type_map = self._get_params('_dev_types')
+            self._last_times_map = dict(self._iter_last_times(
+                                            self._get_last_event_times()))
+            self._devices = self._splice_clients(
+                                (dict(ds) for ds in self._devtree),
+                                self._get_container_clients)
+            self._devtree = TreeStore(self._enrich_ds(ds) 
+                                        for ds in self._devices)
+        self._publish(TreeSnapshot(self._devtree, DevIndex(self._devtree), 
+                                    self._sections))
+        return {'reused': self._reused, 'rebuilt': self._rebuilt}
+
+    def _build_sqlite(self, rec_ids=None):
+        """
+        Streams the device tree into the SQLite backend.
+        
+        Args:
+            rec_ids (tuple): Receiver shards to build, None for all
+        
+        Returns:
+            dict (str: list) with 'reused' and 'rebuilt' section names
+        """
+        DevTree._Dirty.clear()
+        self._last_times = self._get_last_event_times()
+        DevTree._Backend.load(self._stream_devtree(rec_ids), 
+                                self._iter_last_times(self._last_times))
+        return {'reused': [], 'rebuilt': ['devtree', 'zonetree', 'clients']}
+
+    def _stream_devtree(self, rec_ids=None):
+        """
+        Assembles the device tree one device at a time. Client files 
+        are fetched a few containers ahead of the one being passed on, 
+        so only those containers' client payloads are held at a time.
+        
+        Args:
+            rec_ids (tuple): Receiver shards to build, None for all
+        
+        Returns:
+            Generator of enriched datasource dicts in device tree order
+            with consecutive idx values.
+        """
+        self._zone_names, self._zone_map = self._parse_zonetree(
+                                                self._get_zonetree())
+        self._meth, self._type_map = self._get_params('_dev_types')
+        self._last_times_map = {}
+        raw = self._get_devtree()
+        containers = (ds['ds_id'] for ds in self._select_shards(
+                                        self._iter_devtree(raw), rec_ids)
+                        if self._has_clients(ds))
+        with ThreadPoolExecutor(max_workers=Base._max_workers) as self._pool:
+            self._prefetched = self._prefetch_clients(containers)
+            devices = self._select_shards(self._iter_rec_info(
+                                        self._iter_devtree(raw)), rec_ids)
+            for ds in self._splice_clients(devices, self._stream_clients):
+                yield self._enrich_ds(ds)
+
+    def _stream_clients(self, container):
+        """
+        Returns:
+            Generator of client datasource dicts for a container
+        """
+        return self._iter_clients(self._next_fetched(container))
+
+    def _prefetch_clients(self, ds_ids, window=None):
+        """
+        Fetches client files on _pool while keeping them in device tree
+        order. Up to window fetches run ahead of the container being 
+        spliced; files that come back early wait in their future.
+        
+        Args:
+            ds_ids (iterable): container ds_ids in device tree order
+            window (int): fetches kept in flight, defaults to twice
+                          Base._max_workers
+        
+        Returns:
+            Generator of (ds_id, Future) tuples in ds_ids order. Each
+            Future's result is the raw client file.
+        """
+        window = window or Base._max_workers * 2
+        pending = deque()
+        for ds_id in ds_ids:
+            pending.append((ds_id, self._pool.submit(_ClientFetcher.fetch, 
+                                                     ds_id)))
+            if len(pending) >= window:
+                yield pending.popleft()
+        while pending:
+            yield pending.popleft()
+
+    def _next_fetched(self, container):
+        """
+        Returns:
+            str: raw client file for container from _prefetched
+        
+        Raises:
+            ESMException: if the prefetched files are out of step with 
+                          the device tree
+        """
+        ds_id, future = next(self._prefetched, (None, None))
+        if ds_id != container['ds_id']:
+            raise ESMException('Client fetch out of order for {}'
+                                .format(container['ds_id']))
+        return future.result()
+
+    @staticmethod
+    def _select_shards(devices, rec_ids):
+        """
+        Splits the device tree into shards and passes on the ones to 
+        build.
+        
+        Each Receiver starts a shard holding it and the devices below 
+        it. The ESM and other top level devices, DBMs and ACEs included,
+        and the devices below them form shards that are always built.
+        
+        Args:
+            devices (iterable): datasource dicts in device tree order
+            rec_ids (tuple): Receiver ds_ids of the shards to build, 
+                             None for all
+        
+        Returns:
+            Generator of datasource dicts in device tree order
+        """
+        if rec_ids is None:
+            yield from devices
+            return
+        keep = True
+        for ds in devices:
+            keep = DevTree._in_shard(keep, ds['desc_id'], ds['ds_id'], 
+                                     rec_ids)
+            if keep:
+                yield ds
+
+    @staticmethod
+    def _in_shard(keep, desc_id, ds_id, rec_ids):
+        """
+        Steps the shard selection of _select_shards() by one device.
+        
+        Args:
+            keep (bool): whether the device before it was kept
+            desc_id (str): the device's desc_id
+            ds_id (str): the device's ds_id
+            rec_ids (tuple): Receiver ds_ids of the shards to keep
+        
+        Returns:
+            bool: True if the device is kept
+        """
+        if desc_id in DESC_CLASSES['receiver']:
+            return ds_id in rec_ids
+        if desc_depth(desc_id) in ['1', '2']:
+            return True
+        return keep
+
+    @staticmethod
+    def _shard_view(snap, rec_ids):
+        """
+        Args:
+            snap (TreeSnapshot): published snapshot of every Receiver
+            rec_ids (tuple): Receiver ds_ids of the shards to keep
+        
+        Returns:
+            TreeSnapshot with only the devices _select_shards() keeps,
+            renumbered, and its own indexes
+        """
+        keep = True
+        kept = []
+        for pos, (desc_id, ds_id) in enumerate(zip(snap.tree.column('desc_id'),
+                                                   snap.tree.column('ds_id'))):
+            keep = DevTree._in_shard(keep, desc_id, ds_id, rec_ids)
+            if keep:
+                kept.append(pos)
+        tree = snap.tree.subset(kept)
+        if 'idx' in tree.fields():
+            for pos in range(len(tree)):
+                tree.set(pos, 'idx', pos + 1)
+        tree.freeze()
+        return TreeSnapshot(tree, DevIndex(tree), snap.sections, 
+                            built=snap.built, recs=rec_ids)
+
+    def _snapshot(self):
+        """
+        Returns:
+            TreeSnapshot this DevTree serves. It is the published 
+            snapshot, or a view of it with only the shards of the 
+            Receivers the DevTree was created for. Views are built once
+            per published snapshot.
+        """
+        snap = DevTree._Snapshot
+        if self._rec_ids is None or snap.built is None:
+            return snap
+        view = self._view
+        if view is None or view[0] is not snap:
+            view = self._view = (snap, self._shard_view(snap, self._rec_ids))
+        return view[1]
+
+    @staticmethod
+    def _has_clients(ds):
+        """
+        Returns:
+            bool: True if the datasource is a client container
+        """
+        return ds['desc_id'] == '3' and int(ds['client_groups'] or 0) > 0
+
+    @staticmethod
+    def _splice_clients(devices, get_clients):
+        """
+        Passes on each device followed by its clients, numbering them 
+        with consecutive idx values.
+        
+        Args:
+            devices (iterable): datasource dicts in device tree order
+            get_clients (func): called with a client container, returns
+                                its client datasource dicts
+        
+        Returns:
+            Generator of datasource dicts in device tree order
+        """
+        idx = 0
+        for ds in devices:
+            idx += 1
+            ds['idx'] = idx
+            yield ds
+            if not DevTree._has_clients(ds):
+                continue
+            for client in get_clients(ds):
+                idx += 1
+                client['idx'] = idx
+                client['parent_id'] = ds['ds_id']
+                yield client
+
+    def _enrich_ds(self, ds):
+        """
+        Adds zone, vendor/model, desc and last_time fields to a single 
+        datasource. Uses _zone_names, _zone_map, _type_map and 
+        _last_times_map set by the caller.
+        
+        Returns:
+            The datasource dict
+        """
+        if ds['ds_id'] in self._zone_names:
+            ds['zone_name'] = self._zone_names[ds['ds_id']]
+        ds['zone_id'] = self._zone_map.get(ds['zone_name'], '0')
+        if not ds['vendor'] and ds['desc_id'] == '3':
+            self._venmod = self._esm.type_id_to_venmod(ds['type_id'])
+            if self._venmod:
+                ds['vendor'], ds['model'] = self._venmod
+        if ds['desc_id'] in self._type_map:
+            ds['desc'] = self._type_map[ds['desc_id']]
+        ds['last_time'] = self._last_times_map.get(ds['ds_id'], '')
+        return ds
+
+    @staticmethod
+    def _iter_last_times(last_times):
+        """
+        Args:
+            last_times (str): raw payload from _get_last_event_times()
+        
+        Returns:
+            Generator of (ds_id, last_time) tuples
+        """
+        for row in dehexify_rows(last_times):
+            if len(row) > 3:
+                yield (row[0], row[3])
+
+    @staticmethod
+    def _publish(snapshot):
+        """
+        Swaps in a newly built snapshot. 
+        
+        The snapshot's tree is frozen and published with one assignment.
+        _DevTree and _DevIndex are kept pointing at it for older callers.
+        Anyone following changes() is sent the diff from the old 
+        snapshot.
+        """
+        snapshot.tree.freeze()
+        old = DevTree._Snapshot
+        DevTree._Snapshot = snapshot
+        DevTree._DevTree = snapshot.tree
+        DevTree._DevIndex = snapshot.index
+        if DevTree._Subscribers and old.built is not None:
+            for change in diff_trees(old.tree, snapshot.tree):
+                for subscriber in list(DevTree._Subscribers):
+                    subscriber.put(change)
+
+    @staticmethod
+    def _digest(raw):
+        """
+        Returns:
+            str: digest of a raw payload string
+        """
+        digest = hashlib.sha1()
+        for start in range(0, len(raw), 1 << 20):
+            digest.update(raw[start:start + (1 << 20)].encode('utf-8'))
+        return digest.hexdigest()
+
+    def _section(self, name, raw, parse):
+        """
+        Parses a raw payload unless it is unchanged since the last build.
+        
+        Args:
+            name (str): section name
+            raw (str): payload from the ESM
+            parse (func): called with raw to parse it
+            
+        Returns:
+            Parsed section. Cached results are shared with the next 
+            build so callers must copy anything they change.
+        """
+        self._sdigest = self._digest(raw)
+        self._cached = self._old_sections.get(name)
+        if self._cached and self._cached['digest'] == self._sdigest:
+            self._reused.append(name)
+            self._parsed = self._cached['parsed']
+        else:
+            self._rebuilt.append(name)
+            self._parsed = parse(raw)
+        self._sections[name] = {'digest': self._sdigest, 
+                                'parsed': self._parsed}
+        return self._parsed
+
+    def _get_container_clients(self, container):
+        """
+        Gets the clients for a container, re-using the last build's 
+        clients if the container still advertises the same client count.
+        
+        Args:
+            container (dict): client container datasource
+            
+        Returns:
+            Generator of client datasource dicts (copies)
+        """
+        self._sname = 'clients:{}'.format(container['ds_id'])
+        self._cached = self._cached_clients(container)
+        if self._cached:
+            self._reused.append(self._sname)
+            self._sections[self._sname] = self._cached
+        else:
+            self._section(self._sname, self._next_fetched(container),
+                            self._clients_to_lod)
+            self._sections[self._sname]['count'] = container['client_groups']
+        return (dict(client) 
+                    for client in self._sections[self._sname]['parsed'])
+
+    def _cached_clients(self, container):
+        """
+        Returns:
+            The last build's clients section for the container if it 
+            still advertises the same client count, else None
+        """
+        cached = self._old_sections.get('clients:{}'.format(container['ds_id']))
+        if cached and cached['count'] == container['client_groups']:
+            return cached
+        return None
+
+    def _parse_devtree(self, devtree):
+        """
+        Args:
+            devtree (str): raw device tree from _get_devtree()
+            
+        Returns:
+            List of datasource dicts with receiver info
+        """
+        return list(self._iter_rec_info(self._iter_devtree(devtree)))
+
+    def _parse_zonetree(self, zonetree):
+        """
+        Args:
+            zonetree (str): raw zone device tree from _get_zonetree()
+            
+        Returns:
+            tuple (dict, dict) of ds_id to zone name and zone name 
+            to zone id
+        """
+        self._zonetree = zonetree
+        return (self._zonetree_to_names(), self._get_zone_map())
+
+    def _get_devtree(self):
+        """
+        Returns:
+            ESM device tree; raw, but ordered, string as sent by the ESM.
+            Does not include client datasources.
+        """
+        self._method, self._data = self._get_params('get_devtree')
         self._resp = self.post(self._method, self._data)
+        return self._resp['ITEMS']
 
-        self._ftoken = self._resp['FTOKEN']
-        return self._get_file(self._ftoken)
+    @staticmethod
+    def _iter_devtree(devtree):
+        """
+        Parse key fields from raw device strings into datasource dicts
+        
+        Args:
+            devtree (str): raw device tree from _get_devtree()
+        
+        Returns: 
+            Generator of datasource dicts
+        """
+        for idx, row in enumerate(dehexify_rows(devtree), start=1):
+            if len(row) == 0:
+                continue
+            
+            if row[0] == '16':  # Get rid of duplicate 'asset' devices
+                continue
+            
+            if row[2] == "3":  # Client group datasource group containers
+                row.pop(0)     # are fake datasources that seemingly have
+                row.pop(0)     # two uneeded fields at the beginning.
+
+            if row[16] == 'TTTTTTTTTTTTTTTTTTTTTTTTTTTTTTTT':
+                row[16] = '0'  # Get rid of weird type-id for N/A devices
+                
+            yield {'idx': idx,
+                    'desc_id': row[0],
+                    'name': row[1],
+                    'ds_id': row[2],
+                    'enabled': row[15],
+                    'ds_ip': row[27],
+                    'hostname' : row[28],
+                    'type_id': row[16],
+                    'vendor': '',
+                    'model': '',
+                    'tz_id': '',
+                    'date_order': '',
+                    'port': '',
+                    'syslog_tls': '',
+                    'client_groups': row[29],
+                    'zone_name': '',
+                    'zone_id': '',
+                    'client': False
+                  }
+
+    @staticmethod
+    def _iter_rec_info(devices):
+        """
+        Adds parent_ids to datasources in the tree based upon the 
+        ordered list provided by the ESM. All the datasources below
+        a Receiver row have it's id set as their parent ID.
+        
+        Args:
+            devices (iterable): datasource dicts in device tree order
+        
+        Returns:
+            Generator of datasource dicts
+        """
+        pid = '0'
+        rec_name = ''
+        for ds in devices:
+            if ds['desc_id'] in ['2', '4', '15']:
+                pid = ds['ds_id']
+                rec_name = ds['name']
+            elif ds['desc_id'] in ['3', '5', '7', '17']:
+                ds['parent_id'] = pid
+                ds['rec_name'] = rec_name
+            yield ds
 
     def _get_client_list(self, group_id):
         """
@@ -632,93 +1816,80 @@ class DevTree(Base):
         self._resp = self.post(self._method, self._data)
         return self._resp
 
-    def _get_file(self, ftoken):
+    def _clients_to_lod(self, clients):
         """
-        Exchanges token for file
-        
-        Args:
-            ftoken (str): instance name set by 
+        Parse key fields from _get_raw_clients() output.
         
+        Returns:
+            list of dicts
         """
-        self.ftoken = ftoken
-        self._method, self._data = self._get_params('get_rfile')
-        self._resp = self.post(self._method, self._data)
-        self._resp = dehexify(self._resp['DATA'])
-        return self._resp
+        return list(self._iter_clients(clients))
 
-    def _clients_to_lod(self, clients):
+    @staticmethod
+    def _iter_clients(clients):
         """
-        Parse key fields from _get_clients() output.
+        Args:
+            clients (str): raw client file from _get_raw_clients()
         
         Returns:
-            list of dicts
+            Generator of client datasource dicts
         """
-        self._clients = clients
-
-        self._clients_io = StringIO(self._clients)
-        self._clients_csv = csv.reader(self._clients_io, delimiter=',')
-
-        self._clients_lod = []
-        for self._row in self._clients_csv:
-            if len(self._row) < 2:
+        for row in dehexify_rows(clients):
+            if len(row) < 2:
                 continue
 
-            self._ds_fields = {'desc_id': "256",
-                              'name': self._row[1],
-                              'ds_id': self._row[0],
-                              'enabled': self._row[2],
-                              'ds_ip': self._row[3],
-                              'hostname' : self._row[4],
-                              'type_id': self._row[5],
-                              'vendor': self._row[6],
-                              'model': self._row[7],
-                              'tz_id': self._row[8],
-                              'date_order': self._row[9],
-                              'port': self._row[11],
-                              'syslog_tls': self._row[12],
-                              'client_groups': "0",
-                              'zone_name': '',
-                              'zone_id': '',
-                              'client': True
-                              }
-            self._clients_lod.append(self._ds_fields)
-        return self._clients_lod
+            yield {'desc_id': "256",
+                    'name': row[1],
+                    'ds_id': row[0],
+                    'enabled': row[2],
+                    'ds_ip': row[3],
+                    'hostname' : row[4],
+                    'type_id': row[5],
+                    'vendor': row[6],
+                    'model': row[7],
+                    'tz_id': row[8],
+                    'date_order': row[9],
+                    'port': row[11],
+                    'syslog_tls': row[12],
+                    'client_groups': "0",
+                    'zone_name': '',
+                    'zone_id': '',
+                    'client': True
+                  }
             
     def _get_zonetree(self):
         """
         Abuses the device tree for zone data.
         
         Returns:
-            str: device tree string sorted by zones
+            str: raw device tree string sorted by zones
         """
         
         self._method, self._data = self._get_params('get_zones_devtree')
         self._resp = self.post(self._method, self._data)
-        return dehexify(self._resp['ITEMS'])
+        return self._resp['ITEMS']
         
-    def _insert_zone_names(self):
+    def _zonetree_to_names(self):
         """
         Args:
-            _zonetree (str): set in __init__
+            _zonetree (str): set in _parse_zonetree
         
         Returns:
-            List of dicts (str: str) devices by zone
+            dict (str: str) ds_id to zone name
         """
         self._zone_name = None
-        self._zonetree_io = StringIO(self._zonetree)
-        self._zonetree_csv = csv.reader(self._zonetree_io, delimiter=',')
-        self._zonetree_lod = []
+        self._zone_names = {}
 
-        for self._row in self._zonetree_csv:
+        for self._row in dehexify_rows(self._zonetree):
+            if len(self._row) < 3:
+                continue
             if self._row[0] == '1':
                 self._zone_name = self._row[1]
                 if self._zone_name == 'Undefined':
                     self._zone_name = ''
                 continue
-            for self._dev in self._devtree:
-                if self._dev['ds_id'] == self._row[2]:
-                    self._dev['zone_name'] = self._zone_name
-        return self._devtree
+            self._zone_names[self._row[2]] = self._zone_name
+        return self._zone_names
 
     def _get_zone_map(self):
         """
@@ -736,60 +1907,25 @@ class DevTree(Base):
                 self._zone_map[self._szone['name']] = self._szone['id']['value']
         return self._zone_map
         
-    def _insert_zone_ids(self):
-        """
-        """
-        for self._dev in self._devtree:
-            if self._dev['zone_name'] in self._zone_map.keys():
-                self._dev['zone_id'] = self._zone_map.get(self._dev['zone_name'])
-            else:
-                self._dev['zone_id'] = '0'
-        return self._devtree
-        
-    def _insert_venmods(self):
-        """
-        Populates vendor/model fields for any datasources 
-        
-        Returns:
-            List of datasource dicts - devtree
-        """
-        for self._ds in self._devtree:
-            if not self._ds['vendor'] and self._ds['desc_id'] == '3': 
-                self._ds['vendor'], self._ds['model'] = self._esm.type_id_to_venmod(self._ds['type_id'])
-        return self._devtree_lod
-    
-    def _insert_desc_names(self):
-        """
-        Populates the devtree with desc_names matching the desc_ids
-        
-        Returns:
-            List of datasource dicts - devtree
-        
-        """
-        self._meth, self._type_map = self._get_params('_dev_types')
-        for self._ds in self._devtree:
-            if self._ds['desc_id'] in self._type_map:
-                self._ds['desc'] = self._type_map[self._ds['desc_id']]
-        return self._devtree
-        
     def _get_client_grps(self):
         """
         Returns:
             dict (str:str) fake datasource dicts that represent client 
             containers on the device tree.
         """
-        return [self._dev for self._dev in DevTree._DevTree 
-                        if int(self._dev['client_groups']) > 0 
-                        and self._dev['desc_id'] == '3']
+        if DevTree._Backend is not None:
+            return DevTree._Backend.client_groups()
+        snap = self._snapshot()
+        return [snap.tree[pos] for pos in snap.index.topology.containers]
                         
     def _get_last_event_times(self):
         """
         Returns:
-            string with datasource names and last event times.
+            raw string with datasource names and last event times.
         """
         self._method, self._data = self._get_params('ds_last_times')
         self._resp = self.post(self._method, self._data)
-        return dehexify(self._resp['ITEMS'])
+        return self._resp['ITEMS']
 
     def _insert_ds_last_times(self):
         """
@@ -798,11 +1934,7 @@ class DevTree(Base):
         Returns: 
             List of datasource dicts - the devtree
         """
-        self._last_times_io = StringIO(self._last_times)
-        self._last_times_csv = csv.reader(self._last_times_io, delimiter=',')
-        for self._row in self._last_times_csv:
-            for self._ds in self._devtree:
-                self._ds['last_time'] = self._row[3]
-            else: 
-                self._ds['last_time'] = ''
-        return self._devtree
\ No newline at end of file
+        self._last_times_map = dict(self._iter_last_times(self._last_times))
+        for self._ds in self._devtree:
+            self._ds['last_time'] = self._last_times_map.get(self._ds['ds_id'], '')
+        return self._devtree
@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+"""
+    mfe_saw.details
+    ~~~~~~~~~~~~~
+
+    This module imports into 'DevTree' to fetch datasource details for
+    many datasources at once.
+
+    Details come from dsGetDataSourceDetail, one request per datasource,
+    posted concurrently under the Base limiter. They are kept in a
+    SQLite cache file keyed by ds_id together with a digest of the
+    datasource's device tree fields, so a datasource is only fetched
+    again once its entry in the tree changes.
+"""
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from mfe_saw.aggregate import kind_positions
+from mfe_saw.base import Base
+from mfe_saw.exceptions import ESMException
+
+# Device tree fields a datasource's details depend on. last_time and idx
+# change without the datasource changing and are left out.
+STAMP_FIELDS = ['name', 'ds_ip', 'hostname', 'type_id', 'enabled',
+                'parent_id', 'zone_id', 'tz_id', 'date_order', 'port',
+                'syslog_tls', 'client_groups']
+
+DetailResult = namedtuple('DetailResult', ['ds_id', 'name', 'status',
+                                           'detail', 'error'])
+DetailResult.__doc__ = """
+    Details of one datasource.
+
+    status is one of:
+        cached      detail is from the cache, the tree entry is unchanged
+        fetched     detail was fetched from the ESM and cached
+        missing     the ds_id isn't in the device tree
+        failed      the ESM request failed, see error
+    """
+
+
+def tree_stamp(values):
+    """
+    Args:
+        values (iterable): the datasource's STAMP_FIELDS values
+
+    Returns:
+        str: digest of the values
+    """
+    return hashlib.sha1('\x1f'.join('' if value is None else str(value)
+                                    for value in values)
+                        .encode('utf-8')).hexdigest()
+
+
+class DetailCache(object):
+    """
+    Datasource details kept in a SQLite file.
+
+    Public Methods:
+
+        get(ds_id, stamp)   Returns the detail dict cached for the ds_id
+                            with the stamp or None.
+
+        put(ds_id, stamp,   Caches a detail dict. Written on the next
+            detail)         commit().
+
+        commit()    Writes cached details to the file.
+
+        prune(keep)     Drops every ds_id not in keep.
+
+        close()     Commits and closes the database.
+
+        __len__     Returns the count of cached details.
+
+    One connection is shared by every thread under a lock, so a
+    ':memory:' cache is the same database in all of them.
+    """
+    def __init__(self, path):
+        """
+        Args:
+            path (str): SQLite database file, ':memory:' for none
+        """
+        self._path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute('CREATE TABLE IF NOT EXISTS details '
+                               '(ds_id TEXT PRIMARY KEY, stamp TEXT, '
+                               'detail TEXT)')
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM details'
+                                      ).fetchone()[0]
+
+    def get(self, ds_id, stamp):
+        """
+        Returns:
+            dict: cached detail or None if there is none for the stamp
+        """
+        with self._lock:
+            row = self._conn.execute('SELECT detail FROM details WHERE '
+                                     'ds_id = ? AND stamp = ?',
+                                     (ds_id, stamp)).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def put(self, ds_id, stamp, detail):
+        detail = json.dumps(detail)
+        with self._lock:
+            self._conn.execute('INSERT OR REPLACE INTO details '
+                               'VALUES (?, ?, ?)', (ds_id, stamp, detail))
+
+    def commit(self):
+        with self._lock:
+            self._conn.commit()
+
+    def prune(self, keep):
+        """
+        Args:
+            keep (iterable): ds_ids to keep
+
+        Returns:
+            int: count of details dropped
+        """
+        keep = set(keep)
+        with self._lock:
+            gone = [(ds_id,) for ds_id,
+                    in self._conn.execute('SELECT ds_id FROM details')
+                    if ds_id not in keep]
+            self._conn.executemany('DELETE FROM details WHERE ds_id = ?', gone)
+            self._conn.commit()
+        return len(gone)
+
+    def close(self):
+        with self._lock:
+            self._conn.commit()
+            self._conn.close()
+
+
+class _DetailFetcher(Base):
+    """
+    Posts dsGetDataSourceDetail for fetch_details(), one per worker
+    thread.
+    """
+    _local = threading.local()
+
+    @classmethod
+    def fetch(cls, ds_id):
+        """
+        Args:
+            ds_id (str): datasource ds_id
+
+        Returns:
+            dict of the datasource's details
+        """
+        fetcher = getattr(cls._local, 'fetcher', None)
+        if fetcher is None:
+            fetcher = cls._local.fetcher = cls()
+        return fetcher._fetch(ds_id)
+
+    def _fetch(self, ds_id):
+        """
+        Raises:
+            ESMException: if the ESM didn't return details
+        """
+        self._method, self._data = self._get_params('ds_details',
+                                                    {'ds_id': ds_id})
+        self._resp = self.post(self._method, self._data)
+        if not isinstance(self._resp, dict):
+            raise ESMException('No details for datasource {}: {}'
+                               .format(ds_id, self._resp))
+        return self._resp
+
+
+def fetch_details(devtree, index, ds_ids=None, kind='datasource', cache=None,
+                  max_workers=None, commit_every=100):
+    """
+    Fetches the details of many datasources.
+
+    Args:
+        devtree (TreeStore): built device tree
+        index (DevIndex): indexes over devtree
+        ds_ids (iterable): ds_ids or datasource dicts, defaults to every
+                           device of the kind
+        kind (str): device class from DESC_CLASSES, None for all. Only
+                    used without ds_ids.
+        cache (DetailCache): cache to read and update, None for none
+        max_workers (int): requests in flight at once, defaults to
+                           Base._max_workers
+        commit_every (int): fetched details per cache commit
+
+    Returns:
+        Generator of DetailResult tuples, cached details and missing
+        ds_ids in the order given and then fetched details as they
+        complete.
+
+    Raises:
+        ValueError: if the kind is invalid
+    """
+    topology = index.topology
+    if ds_ids is None:
+        positions = kind_positions(index, kind, len(devtree))
+    else:
+        positions = []
+        for ds_id in ds_ids:
+            ds_id = ds_id if isinstance(ds_id, str) else ds_id['ds_id']
+            pos = topology.position(ds_id)
+            if pos is None:
+                yield DetailResult(ds_id, None, 'missing', None,
+                                   'Not in the device tree.')
+            else:
+                positions.append(pos)
+
+    columns = [devtree.column(field) for field in STAMP_FIELDS]
+    tree_ids = devtree.column('ds_id')
+    names = devtree.column('name')
+    pending = []
+    for pos in positions:
+        stamp = tree_stamp(column[pos] for column in columns)
+        detail = None if cache is None else cache.get(tree_ids[pos], stamp)
+        if detail is None:
+            pending.append((pos, stamp))
+        else:
+            yield DetailResult(tree_ids[pos], names[pos], 'cached', detail,
+                               None)
+    if not pending:
+        return
+
+    max_workers = max_workers or Base._max_workers
+    fetched = 0
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = {}
+            queued = iter(pending)
+            while True:
+                for pos, stamp in queued:
+                    futures[pool.submit(_DetailFetcher.fetch,
+                                        tree_ids[pos])] = (pos, stamp)
+                    if len(futures) >= 2 * max_workers:
+                        break
+                if not futures:
+                    break
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    pos, stamp = futures.pop(future)
+                    try:
+                        detail = future.result()
+                    except Exception as err:
+                        logging.warning('Details not fetched: %s: %s',
+                                        names[pos], err)
+                        yield DetailResult(tree_ids[pos], names[pos],
+                                           'failed', None, str(err))
+                        continue
+                    if cache is not None:
+                        cache.put(tree_ids[pos], stamp, detail)
+                        fetched += 1
+                        if fetched % commit_every == 0:
+                            cache.commit()
+                    yield DetailResult(tree_ids[pos], names[pos], 'fetched',
+                                       detail, None)
+    finally:
+        if cache is not None:
+            cache.commit()
@@ -0,0 +1,784 @@
+# -*- coding: utf-8 -*-
+"""
+    mfe_saw.devindex
+    ~~~~~~~~~~~~~
+
+    This module imports into 'DevTree' to provide secondary indexes
+    over the device tree so lookups don't have to scan every device.
+
+    Indexes store positions into the device tree list rather than the
+    datasource dicts themselves. Positions are kept in ascending order
+    so results come back in device tree order. Once built, position
+    lists are packed into array('I') which keeps them small and quick
+    to save and load with a snapshot.
+"""
+import ipaddress
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from collections import Counter
+from heapq import merge, nlargest
+
+INDEXED_FIELDS = ['desc_id', 'type_id', 'vendor', 'model', 'parent_id',
+                  'zone_id', 'tz_id', 'port', 'syslog_tls']
+
+# Fields DevTree.search() matches a term against, case insensitive.
+SEARCH_FIELDS = ['ds_ip', 'name', 'hostname', 'ds_id']
+
+DESC_CLASSES = {'esm': ['14'],
+                'receiver': ['2'],
+                'device': ['2', '4', '10', '12', '15', '25'],
+                'datasource': ['3', '256'],
+                'client': ['256'],
+                'client_group': ['254']}
+
+DESC_DEPTHS = {'1': ['14'],
+               '2': ['2', '4', '10', '12', '15', '25'],
+               '3': ['3', '5', '7', '17', '19', '20', '21', '24', '254']}
+
+LAST_TIME_FORMAT = '%m/%d/%Y %H:%M:%S'
+
+_OPERATORS = ['eq', 'in', 'prefix', 'gt', 'gte', 'lt', 'lte']
+_RANGE_OPERATORS = ['gt', 'gte', 'lt', 'lte']
+
+
+def desc_depth(desc_id):
+    """
+    Args:
+        desc_id (str): device desc_id
+
+    Returns:
+        str: steps from the root of the ESM 'Physical Display' tree.
+             1 = ESM, 2 = ERC/ADM/DEM/ACE/ELM/ELS,
+             3 = Datasources including EPO/NSM, 4 = Children and Clients
+    """
+    for depth in ('1', '2', '3'):
+        if desc_id in DESC_DEPTHS[depth]:
+            return depth
+    return '4'
+
+
+def last_time_to_epoch(last_time):
+    """
+    Converts an ESM last event time string into epoch seconds.
+
+    Args:
+        last_time (str): '%m/%d/%Y %H:%M:%S' formatted time
+
+    Returns:
+        float: epoch seconds or None if the time is empty or invalid
+    """
+    if not last_time:
+        return None
+    try:
+        date, _, clock = last_time.partition(' ')
+        month, day, year = date.split('/')
+        hour, minute, second = clock.split(':')
+        return datetime(int(year), int(month), int(day), int(hour),
+                        int(minute), int(second)).timestamp()
+    except ValueError:
+        return None
+
+
+def _to_epoch(value):
+    """
+    Normalizes a range query bound into epoch seconds.
+    """
+    if isinstance(value, datetime):
+        return value.timestamp()
+    if isinstance(value, str):
+        return last_time_to_epoch(value)
+    return float(value)
+
+
+def column(devtree, field):
+    """
+    Args:
+        devtree: list of datasource dicts or a TreeStore
+        field (str): field name
+
+    Returns:
+        list of the field's value for every device, None if missing
+    """
+    try:
+        return devtree.column(field)
+    except AttributeError:
+        return [ds.get(field) for ds in devtree]
+
+
+class DevIndex(object):
+    """
+    Secondary indexes over a built device tree.
+
+    Public Methods:
+
+        select(kind=None, **criteria)   Returns a generator of device
+                                        tree positions matching every
+                                        given criteria.
+
+        postings(field, value)  Returns the list of positions for an
+                                indexed field value.
+
+        lookup(term)    Returns the positions whose ds_ip, name,
+                        hostname or ds_id equals the term.
+
+    Criteria are given as field=value for equality or as field__op=value
+    where op is one of:
+
+        in          value is any member of the given iterable
+        prefix      value starts with the given string (case insensitive)
+        gt, gte,    range on 'last_time'. Bounds may be datetime objects,
+        lt, lte     epoch seconds or '%m/%d/%Y %H:%M:%S' strings.
+
+    kind limits the results to a class of device from DESC_CLASSES,
+    e.g. 'datasource', 'client' or 'receiver'.
+    """
+    def __init__(self, devtree):
+        """
+        Builds the indexes
+
+        Args:
+            devtree (list): list of datasource dicts
+        """
+        self._devtree = devtree
+        self._fields = {}
+        self.ips = IPIndex(devtree)
+        self.names = NameIndex(devtree)
+        self.topology = TopologyIndex(devtree)
+
+        for field in INDEXED_FIELDS:
+            postings = {}
+            for pos, val in enumerate(column(devtree, field)):
+                if val is None:
+                    continue
+                posting = postings.get(val)
+                if posting is None:
+                    postings[val] = [pos]
+                else:
+                    posting.append(pos)
+            self._fields[field] = {val: array('I', posting)
+                                   for val, posting in postings.items()}
+        terms = {}
+        for field in SEARCH_FIELDS:
+            for pos, val in enumerate(column(devtree, field)):
+                if not isinstance(val, str):
+                    continue
+                val = val.lower()
+                posting = terms.get(val)
+                if posting is None:
+                    terms[val] = pos
+                elif isinstance(posting, int):
+                    if posting != pos:
+                        terms[val] = [posting, pos]
+                elif posting[-1] != pos:
+                    posting.append(pos)
+        self._terms = {val: (posting if isinstance(posting, int)
+                             else array('I', sorted(set(posting))))
+                       for val, posting in terms.items()}
+        self._epochs = [last_time_to_epoch(last_time)
+                        for last_time in column(devtree, 'last_time')]
+        self.last_times = LastTimeIndex(self._epochs)
+
+    def __len__(self):
+        """
+        Returns the count of indexed devices.
+        """
+        return len(self._epochs)
+
+    def postings(self, field, value):
+        """
+        Args:
+            field (str): indexed field name
+            value (str): field value
+
+        Returns:
+            list of positions that have the value or an empty list
+        """
+        return self._fields[field].get(value, [])
+
+    def lookup(self, term):
+        """
+        Args:
+            term (str): ds_ip, name, hostname or ds_id, case insensitive
+
+        Returns:
+            list of positions with a SEARCH_FIELDS value equal to the
+            term, in device tree order
+        """
+        posting = self._terms.get(term.lower(), [])
+        return [posting] if isinstance(posting, int) else posting
+
+    def values(self, field):
+        """
+        Args:
+            field (str): indexed field name
+
+        Returns:
+            dict (str: list) of field value to positions
+        """
+        return self._fields[field]
+
+    def epoch(self, pos):
+        """
+        Returns:
+            float: last event time for the position as epoch or None
+        """
+        return self._epochs[pos]
+
+    def select(self, kind=None, **criteria):
+        """
+        Finds devices matching all of the criteria.
+
+        The most selective indexed criteria provides the candidates which
+        are then checked against the rest of the criteria.
+
+        Args:
+            kind (str): Optional device class from DESC_CLASSES
+            criteria: field=value or field__op=value, see class docstring
+
+        Returns:
+            Generator of matching device tree positions.
+
+        Raises:
+            ValueError: if the kind, field or operator is invalid
+        """
+        preds = self._parse_criteria(criteria)
+        if kind:
+            try:
+                preds.append(('desc_id', 'in', DESC_CLASSES[kind]))
+            except KeyError:
+                raise ValueError('Invalid device kind: {}'.format(kind))
+        return self._select(preds)
+
+    @staticmethod
+    def _parse_criteria(criteria):
+        """
+        Returns:
+            list of tuples (field, op, value)
+        """
+        parsed = []
+        for key, val in criteria.items():
+            field, _, op = key.partition('__')
+            if not op:
+                op = 'eq'
+            if op not in _OPERATORS:
+                raise ValueError('Invalid query operator: {}'.format(key))
+            if op in _RANGE_OPERATORS:
+                if field != 'last_time':
+                    raise ValueError('Range queries are only supported '
+                                     'on last_time: {}'.format(key))
+                val = _to_epoch(val)
+            elif op == 'in':
+                val = list(val)
+            elif op == 'prefix':
+                val = val.lower()
+            parsed.append((field, op, val))
+        return parsed
+
+    def _select(self, preds):
+        """
+        Generator behind select()
+        """
+        best = None
+        best_cost = len(self._epochs) + 1
+        for pred in preds:
+            field, op, val = pred
+            if field not in self._fields or op not in ('eq', 'in'):
+                continue
+            postings = self._fields[field]
+            if op == 'eq':
+                cost = len(postings.get(val, []))
+            else:
+                cost = sum(len(postings.get(v, [])) for v in set(val))
+            if cost < best_cost:
+                best, best_cost = pred, cost
+
+        ranges = [pred for pred in preds if pred[1] in _RANGE_OPERATORS]
+        if best is None and ranges:
+            candidates = sorted(self.last_times.select(ranges))
+        elif best is None:
+            candidates = range(len(self._epochs))
+        else:
+            preds = [pred for pred in preds if pred is not best]
+            field, op, val = best
+            postings = self._fields[field]
+            if op == 'eq':
+                candidates = postings.get(val, [])
+            else:
+                candidates = merge(*[postings[v] for v in set(val)
+                                     if v in postings])
+
+        checks = [self._compile(pred) for pred in preds]
+        devtree = self._devtree
+        for pos in candidates:
+            if checks:
+                ds = devtree[pos]
+                if not all(check(pos, ds) for check in checks):
+                    continue
+            yield pos
+
+    def _compile(self, pred):
+        """
+        Returns:
+            function (pos, ds) -> bool for a single predicate
+        """
+        field, op, val = pred
+        if field == 'last_time' and op in _RANGE_OPERATORS:
+            epochs = self._epochs
+            if op == 'gt':
+                return lambda pos, ds: (epochs[pos] is not None
+                                        and epochs[pos] > val)
+            if op == 'gte':
+                return lambda pos, ds: (epochs[pos] is not None
+                                        and epochs[pos] >= val)
+            if op == 'lt':
+                return lambda pos, ds: (epochs[pos] is not None
+                                        and epochs[pos] < val)
+            return lambda pos, ds: (epochs[pos] is not None
+                                    and epochs[pos] <= val)
+        if op == 'in':
+            val = set(val)
+            return lambda pos, ds: ds.get(field) in val
+        if op == 'prefix':
+            return lambda pos, ds: (ds.get(field) or '').lower().startswith(val)
+        return lambda pos, ds: ds.get(field) == val
+
+
+class LastTimeIndex(object):
+    """
+    Devices sorted by last event time.
+
+    Epochs are kept in a sorted array with the matching positions in a
+    parallel array, so every query is a binary search and a slice.
+    Results are oldest first. Devices without a last event time are
+    left out of every query and listed in never.
+
+    Public Methods:
+
+        before(end)         Returns positions last heard from before end.
+
+        between(start, end) Returns positions last heard from between
+                            start and end, inclusive.
+
+        oldest(count)       Returns the count positions heard from
+                            longest ago.
+
+    Attributes:
+        never (array): positions with no last event time
+    """
+    def __init__(self, epochs):
+        """
+        Builds the index
+
+        Args:
+            epochs (list): epoch or None for every position
+        """
+        pairs = sorted((epoch, pos) for pos, epoch in enumerate(epochs)
+                       if epoch is not None)
+        self._keys = array('d', [epoch for epoch, _ in pairs])
+        self._positions = array('I', [pos for _, pos in pairs])
+        self.never = array('I', [pos for pos, epoch in enumerate(epochs)
+                                 if epoch is None])
+
+    def __len__(self):
+        """
+        Returns the count of devices with a last event time.
+        """
+        return len(self._keys)
+
+    def before(self, end):
+        """
+        Args:
+            end: datetime, epoch seconds or '%m/%d/%Y %H:%M:%S' string
+
+        Returns:
+            array of positions, oldest first
+        """
+        return self._positions[:bisect_left(self._keys, _to_epoch(end))]
+
+    def between(self, start, end):
+        """
+        Args:
+            start: datetime, epoch seconds or '%m/%d/%Y %H:%M:%S' string
+            end: datetime, epoch seconds or '%m/%d/%Y %H:%M:%S' string
+
+        Returns:
+            array of positions, oldest first
+        """
+        return self._positions[bisect_left(self._keys, _to_epoch(start)):
+                               bisect_right(self._keys, _to_epoch(end))]
+
+    def oldest(self, count):
+        """
+        Returns:
+            array of up to count positions, oldest first
+        """
+        return self._positions[:count]
+
+    def select(self, preds):
+        """
+        Args:
+            preds (list): (field, op, epoch) range predicates on
+                          last_time as parsed by DevIndex.select()
+
+        Returns:
+            array of positions matching every predicate, oldest first
+        """
+        low, high = 0, len(self._keys)
+        for _, op, val in preds:
+            if op == 'gt':
+                low = max(low, bisect_right(self._keys, val))
+            elif op == 'gte':
+                low = max(low, bisect_left(self._keys, val))
+            elif op == 'lt':
+                high = min(high, bisect_left(self._keys, val))
+            else:
+                high = min(high, bisect_right(self._keys, val))
+        return self._positions[low:max(low, high)]
+
+
+class IPIndex(object):
+    """
+    Sorted interval index over the datasource IP addresses.
+
+    Addresses are converted to integers once and kept in sorted lists,
+    one per IP version, so lookups are a binary search.
+
+    Public Methods:
+
+        cidr('10.0.0.0/16')     Returns list of positions with an address
+                                inside the network.
+
+        range(start, end)       Returns list of positions with an address
+                                between start and end, inclusive.
+
+        longest_prefix(addr)    Returns tuple (network, positions) for the
+                                longest network shared by addr and any
+                                address in the tree.
+    """
+    def __init__(self, devtree):
+        """
+        Builds the index
+
+        Args:
+            devtree (list): list of datasource dicts
+        """
+        pairs = {4: [], 6: []}
+        for pos, ds_ip in enumerate(column(devtree, 'ds_ip')):
+            try:
+                ip = ipaddress.ip_address(ds_ip)
+            except ValueError:
+                continue
+            pairs[ip.version].append((int(ip), pos))
+
+        self._keys = {}
+        self._positions = {}
+        for ver, vpairs in pairs.items():
+            vpairs.sort()
+            self._keys[ver] = [key for key, _ in vpairs]
+            self._positions[ver] = array('I', [pos for _, pos in vpairs])
+        self._keys[4] = array('I', self._keys[4])
+
+    def __len__(self):
+        """
+        Returns the count of indexed addresses.
+        """
+        return len(self._keys[4]) + len(self._keys[6])
+
+    def _slice(self, version, low, high):
+        """
+        Returns:
+            list of positions with addresses in [low, high]
+        """
+        keys = self._keys[version]
+        return self._positions[version][bisect_left(keys, low):
+                                        bisect_right(keys, high)].tolist()
+
+    def cidr(self, network):
+        """
+        Args:
+            network (str): IPv4/IPv6 network, e.g. '10.1.0.0/16'. Host
+                           bits are ignored.
+
+        Returns:
+            list of positions in address order
+
+        Raises:
+            ValueError: if the network is not valid
+        """
+        net = ipaddress.ip_network(network, strict=False)
+        return self._slice(net.version, int(net.network_address),
+                           int(net.broadcast_address))
+
+    def range(self, start, end):
+        """
+        Args:
+            start (str): first IPv4/IPv6 address
+            end (str): last IPv4/IPv6 address, same version as start
+
+        Returns:
+            list of positions in address order
+
+        Raises:
+            ValueError: if the addresses are not valid or of mixed versions
+        """
+        start = ipaddress.ip_address(start)
+        end = ipaddress.ip_address(end)
+        if start.version != end.version:
+            raise ValueError('IP range must not mix IPv4 and IPv6')
+        return self._slice(start.version, int(start), int(end))
+
+    def longest_prefix(self, addr):
+        """
+        The closest addresses by prefix are always next to where addr
+        would sort so only the two neighbours need to be checked.
+
+        Args:
+            addr (str): IPv4/IPv6 address
+
+        Returns:
+            tuple (ipaddress network, list of positions). Both are None
+            when no address of that version is indexed.
+
+        Raises:
+            ValueError: if the address is not valid
+        """
+        addr = ipaddress.ip_address(addr)
+        keys = self._keys[addr.version]
+        if not keys:
+            return (None, None)
+        bits = addr.max_prefixlen
+        key = int(addr)
+        idx = bisect_left(keys, key)
+        prefixlen = max(bits - (key ^ keys[nidx]).bit_length()
+                        for nidx in (idx - 1, idx)
+                        if 0 <= nidx < len(keys))
+        net = ipaddress.ip_network((addr, prefixlen), strict=False)
+        return (net, self._slice(addr.version, int(net.network_address),
+                                 int(net.broadcast_address)))
+
+
+class TopologyIndex(object):
+    """
+    Parent/child structure of the device tree.
+
+    The ESM sends the tree in preorder, each device followed by the
+    devices below it. A device's parent is the closest device before it
+    with a smaller depth, so the tree is built in one pass with a stack
+    and every subtree is a contiguous run of positions. The end of each
+    run is stored, which makes subtree iteration and counts a range and
+    lets children() step from one child straight to the next.
+
+    Public Methods:
+
+        depth(pos)          Returns int steps from the root, see
+                            desc_depth().
+
+        parent(pos)         Returns the parent position or None.
+
+        children(pos)       Returns generator of child positions.
+
+        subtree(pos)        Returns range of the positions below pos.
+
+        subtree_size(pos)   Returns count of the devices below pos.
+
+        receiver(pos)       Returns position of the Receiver pos is under
+                            or None.
+
+        position(ds_id)     Returns position of the ds_id or None.
+
+    Attributes:
+        receivers (array): positions of Receivers in device tree order
+        containers (array): positions of client containers
+    """
+    def __init__(self, devtree):
+        """
+        Builds the index
+
+        Args:
+            devtree (list): list of datasource dicts
+        """
+        desc_ids = column(devtree, 'desc_id')
+        size = len(desc_ids)
+        self._depths = array('B', bytes(size))
+        self._parents = array('i', [-1]) * size
+        self._ends = array('I', bytes(4 * size))
+        self._receivers = array('i', [-1]) * size
+        self._positions = {ds_id: pos for pos, ds_id 
+                           in enumerate(column(devtree, 'ds_id'))}
+        self.receivers = array('I')
+        self.containers = array('I')
+
+        stack = []
+        for pos, (desc_id, groups) in enumerate(
+                zip(desc_ids, column(devtree, 'client_groups'))):
+            depth = int(desc_depth(desc_id))
+            while stack and self._depths[stack[-1]] >= depth:
+                self._ends[stack.pop()] = pos
+            if stack:
+                self._parents[pos] = stack[-1]
+                self._receivers[pos] = self._receivers[stack[-1]]
+            if desc_id in DESC_CLASSES['receiver']:
+                self._receivers[pos] = pos
+                self.receivers.append(pos)
+            elif desc_id == '3' and int(groups or 0) > 0:
+                self.containers.append(pos)
+            self._depths[pos] = depth
+            stack.append(pos)
+        for pos in stack:
+            self._ends[pos] = size
+
+    def __len__(self):
+        """
+        Returns the count of devices in the tree.
+        """
+        return len(self._depths)
+
+    def depth(self, pos):
+        return self._depths[pos]
+
+    def parent(self, pos):
+        parent = self._parents[pos]
+        return None if parent < 0 else parent
+
+    def children(self, pos):
+        child = pos + 1
+        end = self._ends[pos]
+        while child < end:
+            yield child
+            child = self._ends[child]
+
+    def subtree(self, pos):
+        return range(pos + 1, self._ends[pos])
+
+    def subtree_size(self, pos):
+        return self._ends[pos] - pos - 1
+
+    def receiver(self, pos):
+        rec = self._receivers[pos]
+        return None if rec < 0 else rec
+
+    def position(self, ds_id):
+        return self._positions.get(ds_id)
+
+
+def trigrams(text, pad=True):
+    """
+    Splits text into a set of lowercase three character grams.
+
+    Args:
+        text (str): text to split
+        pad (bool): pad with a space on each side so short strings and
+                    the start/end of the text get grams of their own
+
+    Returns:
+        set of str
+    """
+    text = text.lower()
+    if pad:
+        text = ' {} '.format(text)
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class NameIndex(object):
+    """
+    Trigram index over datasource name and hostname.
+
+    Public Methods:
+
+        substring('exch', limit=None)   Returns list of positions with
+                                        the text in the name or hostname.
+
+        fuzzy('exchange', limit=10)     Returns list of (score, position)
+                                        tuples ranked by trigram
+                                        similarity, best first.
+    """
+    def __init__(self, devtree):
+        """
+        Builds the index
+
+        Args:
+            devtree (list): list of datasource dicts
+        """
+        self._devtree = devtree
+        self._grams = {}
+        self._sizes = []
+        grams = self._grams
+        sizes = self._sizes
+        names = column(devtree, 'name')
+        hostnames = column(devtree, 'hostname')
+        for pos, (name, hostname) in enumerate(zip(names, hostnames)):
+            dsgrams = trigrams(name or '') | trigrams(hostname or '')
+            for gram in dsgrams:
+                posting = grams.get(gram)
+                if posting is None:
+                    grams[gram] = [pos]
+                else:
+                    posting.append(pos)
+            sizes.append(len(dsgrams))
+        self._grams = {gram: array('I', posting) 
+                        for gram, posting in grams.items()}
+        self._sizes = array('I', sizes)
+
+    def _matches(self, pos, text):
+        """
+        Returns:
+            bool: True if the text is in the name or hostname
+        """
+        ds = self._devtree[pos]
+        return (text in (ds.get('name') or '').lower()
+                or text in (ds.get('hostname') or '').lower())
+
+    def substring(self, text, limit=None):
+        """
+        Args:
+            text (str): case insensitive text to find in name or hostname
+            limit (int): max number of results
+
+        Returns:
+            list of positions in device tree order
+        """
+        text = text.lower()
+        grams = trigrams(text, pad=False)
+        if grams:
+            postings = sorted((self._grams.get(gram, []) for gram in grams),
+                              key=len)
+            candidates = set(postings[0])
+            for posting in postings[1:]:
+                candidates.intersection_update(posting)
+                if not candidates:
+                    break
+            candidates = sorted(candidates)
+        else:
+            candidates = range(len(self._sizes))
+
+        found = []
+        for pos in candidates:
+            if self._matches(pos, text):
+                found.append(pos)
+                if limit and len(found) >= limit:
+                    break
+        return found
+
+    def fuzzy(self, text, limit=10, threshold=0.25):
+        """
+        Ranks names by the share of the text's trigrams found in the
+        name or hostname. Ties go to the shorter name.
+
+        Args:
+            text (str): case insensitive text to look for
+            limit (int): max number of results
+            threshold (float): minimum score (0 - 1) to be included
+
+        Returns:
+            list of tuples (score, position), best match first
+        """
+        grams = trigrams(text)
+        shared = Counter()
+        for gram in grams:
+            shared.update(self._grams.get(gram, []))
+        qsize = len(grams)
+        sizes = self._sizes
+        scored = ((count / qsize, pos) for pos, count in shared.items())
+        return nlargest(limit, (hit for hit in scored if hit[0] >= threshold),
+                        key=lambda hit: (hit[0], -sizes[hit[1]], -hit[1]))
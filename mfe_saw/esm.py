@@ -7,6 +7,7 @@ import json
 from functools import lru_cache
 
 from mfe_saw.base import Base
+from mfe_saw.utils import dehexify_rows
 
 class ESM(Base):
     """
@@ -56,6 +57,9 @@ class ESM(Base):
                                        provided type_id.
         
         venmod_to_type_id(vendor, model)    Returns string of matching type_id
+
+        ds_count_by_type()      Returns dict (str, int)
+                                    type_id: datasource count
         
     """
     def __init__(self):
@@ -293,6 +297,18 @@ class ESM(Base):
                     return str(self.venmod[0])
         
      
+    def ds_count_by_type(self):
+        """
+        Counts datasources per type with one query and no device tree.
+        
+        Returns:
+            dict (str: int) of type_id to datasource count
+        """
+        self.method, self.data = self._get_params('ds_by_type')
+        self._resp = self.post(self.method, self.data)
+        return {row[0]: int(row[-1]) for row in dehexify_rows(self._resp['ITEMS'])
+                    if len(row) > 1 and row[-1].isdigit()}
+     
     @lru_cache(maxsize=None)   
     def _get_ds_types(self):
         """
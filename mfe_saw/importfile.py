@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+    mfe_saw.importfile
+    ~~~~~~~~~~~~~
+
+    This module writes datasources in the ESM's native '#version#'
+    datasource import format, the format cli.get_csv_headers() reads.
+
+    The first line is the version marker and the second the column
+    headers, followed by one row per datasource. Datasources are written
+    in chunks of a bounded number of rows, each chunk a complete import
+    file with its own header, so one onboarding job can be split over
+    several imports without holding more than a chunk in memory.
+"""
+import csv
+import io
+
+from mfe_saw.datasource import DS_FIELDS
+
+IMPORT_VERSION = '1'
+
+IMPORT_OP = 'add'
+
+# (import column, datasource field) in the order the columns are written.
+# Datasource fields that aren't listed, other than DS_FIELDS, are
+# written as extra columns after these, as the ESM exports parameters.
+IMPORT_COLUMNS = [('op', None),
+                  ('rec_id', 'parent_id'),
+                  ('dsname', 'name'),
+                  ('linked_ipsid', 'ds_id'),
+                  ('vendor', 'vendor'),
+                  ('model', 'model'),
+                  ('ip', 'ds_ip'),
+                  ('hostname', 'hostname'),
+                  ('parsing', 'enabled'),
+                  ('tz_id', 'tz_id'),
+                  ('syslog_port', 'port'),
+                  ('require_tls', 'syslog_tls'),
+                  ('zoneID', 'zone_id')]
+
+_MAPPED = {field for _, field in IMPORT_COLUMNS} | set(DS_FIELDS)
+
+
+def _yes_no(value):
+    """
+    Returns:
+        'yes' or 'no' for the import file
+    """
+    return 'yes' if str(value).lower() in ['t', 'true', '1', 'yes'] else 'no'
+
+
+def import_row(ds, venmods=None):
+    """
+    Args:
+        ds (dict): datasource fields as DataSource() takes them
+        venmods (dict): type_id (str) to (vendor, model), used when the
+                        datasource doesn't have them
+
+    Returns:
+        dict of import column to value for the datasource
+    """
+    values = dict(ds)
+    if not (values.get('vendor') and values.get('model')) and venmods:
+        values['vendor'], values['model'] = venmods.get(
+                                                str(ds.get('type_id')),
+                                                ('', ''))
+    values['enabled'] = _yes_no(ds.get('enabled', True))
+    values['syslog_tls'] = _yes_no(ds.get('syslog_tls', False))
+    values['zone_id'] = ds.get('zone_id') or '0'
+    values['ds_id'] = ''
+    row = {column: ('' if values.get(field) is None else values[field])
+           for column, field in IMPORT_COLUMNS if field}
+    row['op'] = IMPORT_OP
+    row.update((field, value) for field, value in ds.items()
+               if field not in _MAPPED)
+    return row
+
+
+def write_import(rows, out):
+    """
+    Writes one import file.
+
+    Args:
+        rows (list): dicts from import_row()
+        out (file): text file to write to
+    """
+    columns = [column for column, _ in IMPORT_COLUMNS]
+    extras = sorted({column for row in rows for column in row} - set(columns))
+    writer = csv.writer(out, lineterminator='\n')
+    writer.writerow(['#version#', IMPORT_VERSION])
+    writer.writerow(columns + extras)
+    for row in rows:
+        writer.writerow([row.get(column, '') for column in columns + extras])
+
+
+def import_chunks(datasources, chunk_size=5000, venmods=None):
+    """
+    Splits datasources into import files.
+
+    Args:
+        datasources (iterable): datasource dicts
+        chunk_size (int): most datasources per file
+        venmods (dict): see import_row()
+
+    Returns:
+        Generator of tuples (datasources, text), the datasources in a
+        chunk and the import file for them
+    """
+    chunk = []
+    for ds in datasources:
+        chunk.append(ds)
+        if len(chunk) == chunk_size:
+            yield chunk, _chunk_text(chunk, venmods)
+            chunk = []
+    if chunk:
+        yield chunk, _chunk_text(chunk, venmods)
+
+
+def _chunk_text(chunk, venmods):
+    """
+    Returns:
+        str: import file for the datasources
+    """
+    out = io.StringIO()
+    write_import([import_row(ds, venmods) for ds in chunk], out)
+    return out.getvalue()
+
+
+def write_import_files(datasources, prefix, chunk_size=5000, venmods=None):
+    """
+    Writes datasources to numbered import files, prefix-001.csv and on.
+
+    Args:
+        datasources (iterable): datasource dicts, see bulk.validate()
+        prefix (str): path and name the files start with
+        chunk_size (int): most datasources per file
+        venmods (dict): see import_row()
+
+    Returns:
+        list of the paths written
+    """
+    paths = []
+    for num, (_, text) in enumerate(import_chunks(datasources, chunk_size,
+                                                  venmods), start=1):
+        paths.append('{}-{:03d}.csv'.format(prefix, num))
+        with open(paths[-1], 'w', newline='') as open_f:
+            open_f.write(text)
+    return paths
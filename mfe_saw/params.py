@@ -43,6 +43,30 @@
             vars:
                 ftoken
 
+        get_wfile: Write a chunk of a file to the ESM. An empty ftoken
+                   starts a new file, later chunks append to it.
+            vars:
+                ftoken
+                chunk
+            callback vars:
+                ftoken
+
+        import_clients: Import a client file written with get_wfile into
+                        a client container
+            vars:
+                ds_id
+                ftoken
+
+        import_ds: Import a '#version#' datasource import file written
+                   with get_wfile
+            vars:
+                ftoken
+
+        del_client: Delete client datasources from a client container
+            vars:
+                parent_id
+                client_ids: comma separated client ds_ids
+
 """
 
 PARAMS = {
@@ -79,11 +103,25 @@ PARAMS = {
                  """),
 
     'get_wfile': ("MISC_WRITEFILE",
-                 """{'DATA1': '%(_ds_id)s',
+                 """{'FNAME': '%(_ftoken)s',
+                 'DATA1': '%(_chunk)s'}
                  """),
 
-                 
-                 
+    # UNVERIFIED: the client import method and parameter names are inferred
+    # from the client list export and have not been confirmed against an
+    # ESM. Only used by bulk.bulk_add_clients(unverified=True).
+    'import_clients': ("DS_IMPORTDSCLIENTS",
+                       """{'DSID': '%(_ds_id)s',
+                           'FNAME': '%(_ftoken)s'}
+                       """),
+
+    # UNVERIFIED: the datasource import method and parameter names have not
+    # been confirmed against an ESM. Only used by
+    # bulk.bulk_import(unverified=True).
+    'import_ds': ("DS_IMPORTDATASOURCES",
+                  """{'FNAME': '%(_ftoken)s'}
+                  """),
+
     'map_dtree': ("map_dtree",
                   """{'dev_type': '%(dev_type)s',
                   'name': '%(ds_name)s',
@@ -148,7 +186,8 @@ PARAMS = {
                  """),
                  
     'del_client': ("DS_DELETEDSCLIENTS",
-                    """{}
+                    """{'DSID': '%(parent_id)s',
+                        'CLIENTIDS': '%(client_ids)s'}
                     """
                     ),
                     
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+    mfe_saw.refresher
+    ~~~~~~~~~~~~~
+
+    This module provides a background thread that keeps the shared
+    'DevTree' up to date so readers never wait on a rebuild.
+"""
+import logging
+import threading
+
+from mfe_saw.datasource import DevTree
+
+
+class DevTreeRefresher(threading.Thread):
+    """
+    Rebuilds the shared device tree in the background.
+
+    The tree is rebuilt every interval seconds or as soon as
+    DevTree.mark_dirty() is called. Each rebuild is assembled into a new
+    snapshot and swapped in when complete; until then readers keep
+    serving the previous snapshot. DevTree.age() tells them how old it is.
+
+    Public Methods:
+
+        start()     Starts the refresher thread.
+
+        stop()      Stops the refresher after any rebuild in progress.
+
+        refresh_now()   Wakes the refresher to rebuild immediately.
+
+    Attributes:
+        last_report (dict): result of the last DevTree.refresh()
+        last_error (Exception): error from the last failed rebuild or None
+
+    Example:
+        >>> refresher = DevTreeRefresher(interval=300)
+        >>> refresher.start()
+        >>> devtree = DevTree()
+        >>> devtree.search('10.0.0.1')   # never blocks on the rebuild
+    """
+    def __init__(self, interval=300, full=False):
+        """
+        Args:
+            interval (int): seconds between rebuilds
+            full (bool): passed to DevTree.refresh()
+
+        Note:
+            The first build, if there is none yet, happens in the
+            calling thread so there is always a snapshot to serve.
+        """
+        super().__init__(name='DevTreeRefresher', daemon=True)
+        self._interval = interval
+        self._full = full
+        self._stop_event = threading.Event()
+        self._devtree = DevTree()
+        self.last_report = None
+        self.last_error = None
+
+    def run(self):
+        """
+        Refresh loop
+        """
+        while not self._stop_event.is_set():
+            DevTree._Dirty.wait(self._interval)
+            if self._stop_event.is_set():
+                break
+            try:
+                self.last_report = self._devtree.refresh(full=self._full)
+                self.last_error = None
+            except Exception as err:
+                self.last_error = err
+                logging.exception('Background DevTree refresh failed. '
+                                  'Serving the previous snapshot.')
+
+    def refresh_now(self):
+        """
+        Wakes the refresher to rebuild without waiting for the interval.
+        """
+        DevTree.mark_dirty()
+
+    def stop(self, timeout=None):
+        """
+        Stops the refresher thread.
+
+        Args:
+            timeout (float): seconds to wait for the thread to finish
+        """
+        self._stop_event.set()
+        DevTree._Dirty.set()
+        self.join(timeout)
+        DevTree._Dirty.clear()
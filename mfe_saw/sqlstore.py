@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+"""
+    mfe_saw.sqlstore
+    ~~~~~~~~~~~~~
+
+    This module imports into 'DevTree' to provide a SQLite storage
+    backend for device trees too large to hold in memory.
+
+    Devices are streamed into the database in batched transactions as
+    they are parsed and searches run as indexed queries, so memory use
+    doesn't grow with the number of client datasources.
+"""
+import sqlite3
+import threading
+from itertools import islice
+
+from mfe_saw.devindex import INDEXED_FIELDS, desc_depth
+
+FIELDS = ['idx', 'desc_id', 'name', 'ds_id', 'enabled', 'ds_ip', 'hostname',
+          'type_id', 'vendor', 'model', 'tz_id', 'date_order', 'port',
+          'syslog_tls', 'client_groups', 'zone_name', 'zone_id', 'client',
+          'parent_id', 'rec_name', 'desc', 'last_time', 'depth']
+
+_NOCASE_FIELDS = ['name', 'ds_id', 'ds_ip', 'hostname']
+
+_SEARCH_FIELDS = ['ds_ip', 'name', 'hostname', 'ds_id']
+
+
+def _schema(table):
+    """
+    Returns:
+        str: CREATE TABLE statement for a devices table
+    """
+    columns = []
+    for field in FIELDS:
+        if field == 'idx':
+            columns.append('idx INTEGER PRIMARY KEY')
+        elif field == 'client':
+            columns.append('client INTEGER')
+        elif field in _NOCASE_FIELDS:
+            columns.append('"{}" TEXT COLLATE NOCASE'.format(field))
+        else:
+            columns.append('"{}" TEXT'.format(field))
+    return 'CREATE TABLE {} ({})'.format(table, ', '.join(columns))
+
+
+class SQLiteStore(object):
+    """
+    Device tree kept in an indexed SQLite file.
+
+    Public Methods:
+
+        load(devices, last_times)   Replaces the tree with the devices
+                                    from an iterable.
+
+        search(term, rec_id, zone_id)   Returns first device dict matching
+                                        the name, IP, hostname or ds_id.
+
+        select(field, term)     Returns generator of device dicts where
+                                field equals term.
+
+        recs()          Returns list of Receiver dicts.
+
+        client_groups()     Returns list of client container dicts.
+
+        steptree()      Returns list of tuples (idx, name, ds_ip, depth).
+
+        __len__         Returns the count of devices.
+
+        __iter__        Returns generator of every device dict in order.
+    """
+    def __init__(self, path, batch_size=1000):
+        """
+        Args:
+            path (str): SQLite database file
+            batch_size (int): devices inserted per transaction
+        """
+        self._path = path
+        self._batch_size = batch_size
+        self._local = threading.local()
+        self._conn().execute('CREATE TABLE IF NOT EXISTS devices_meta '
+                             '(key TEXT PRIMARY KEY, value TEXT)')
+
+    def _conn(self):
+        """
+        Returns:
+            sqlite3 connection for the calling thread
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self._path)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def built(self):
+        """
+        Returns:
+            bool: True if a tree has been loaded
+        """
+        row = self._conn().execute("SELECT value FROM devices_meta "
+                                   "WHERE key = 'built'").fetchone()
+        return row is not None
+
+    def load(self, devices, last_times=()):
+        """
+        Builds a new devices table and swaps it in when complete so
+        readers see either the old or the new tree.
+
+        Args:
+            devices (iterable): device dicts in device tree order
+            last_times (iterable): (ds_id, last_time) tuples
+        """
+        conn = self._conn()
+        conn.execute('DROP TABLE IF EXISTS devices_new')
+        conn.execute(_schema('devices_new'))
+        insert = 'INSERT INTO devices_new ({}) VALUES ({})'.format(
+                    ', '.join('"{}"'.format(f) for f in FIELDS),
+                    ', '.join('?' * len(FIELDS)))
+        rows = (self._row(ds) for ds in devices)
+        while True:
+            batch = list(islice(rows, self._batch_size))
+            if not batch:
+                break
+            with conn:
+                conn.executemany(insert, batch)
+
+        conn.execute('CREATE TEMP TABLE IF NOT EXISTS last_times '
+                     '(ds_id TEXT PRIMARY KEY, last_time TEXT)')
+        conn.execute('DELETE FROM last_times')
+        last_times = iter(last_times)
+        while True:
+            batch = list(islice(last_times, self._batch_size))
+            if not batch:
+                break
+            with conn:
+                conn.executemany('INSERT OR REPLACE INTO last_times '
+                                 'VALUES (?, ?)', batch)
+
+        with conn:
+            conn.execute("UPDATE devices_new SET last_time = "
+                         "COALESCE((SELECT last_time FROM last_times "
+                         "WHERE last_times.ds_id = devices_new.ds_id), '')")
+            conn.execute('DROP TABLE IF EXISTS devices')
+            conn.execute('ALTER TABLE devices_new RENAME TO devices')
+            for field in _SEARCH_FIELDS + INDEXED_FIELDS:
+                conn.execute('CREATE INDEX IF NOT EXISTS "devices_{0}" '
+                             'ON devices ("{0}")'.format(field))
+            conn.execute("INSERT OR REPLACE INTO devices_meta "
+                         "VALUES ('built', datetime('now'))")
+        conn.execute('DELETE FROM last_times')
+
+    @staticmethod
+    def _row(ds):
+        """
+        Returns:
+            tuple of the device's FIELDS values
+        """
+        if ds.get('depth') is None:
+            ds['depth'] = desc_depth(ds.get('desc_id'))
+        return tuple(ds.get(field) for field in FIELDS)
+
+    @staticmethod
+    def _to_dict(row):
+        """
+        Returns:
+            dict of the row's fields, leaving out empty optional fields
+        """
+        ds = {key: row[key] for key in row.keys() if row[key] is not None}
+        ds['client'] = bool(ds.get('client'))
+        return ds
+
+    def _query(self, where='', params=()):
+        """
+        Returns:
+            Generator of device dicts in device tree order.
+        """
+        cursor = self._conn().execute('SELECT * FROM devices {} ORDER BY idx'
+                                      .format(where), params)
+        while True:
+            rows = cursor.fetchmany(self._batch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield self._to_dict(row)
+
+    def __len__(self):
+        return self._conn().execute('SELECT count(*) FROM devices').fetchone()[0]
+
+    def __iter__(self):
+        return self._query()
+
+    def search(self, term, rec_id=None, zone_id='0'):
+        """
+        Args:
+            term (str): Datasource name, IP, hostname or ds_id
+            rec_id (str): Prefer matches under this Receiver
+            zone_id (str): zone to search
+
+        Returns:
+            dict of the first matching device or None
+        """
+        where = 'WHERE zone_id = ? AND ({})'.format(
+                    ' OR '.join('"{}" = ?'.format(f) for f in _SEARCH_FIELDS))
+        found = list(self._query(where, [zone_id] + [term] * len(_SEARCH_FIELDS)))
+        if rec_id and len(found) > 1:
+            found = [ds for ds in found if ds.get('parent_id') == rec_id]
+        return found[0] if found else None
+
+    def select(self, field, term):
+        """
+        Args:
+            field (str): device field
+            term (str): value the field must equal
+
+        Returns:
+            Generator of matching device dicts
+
+        Raises:
+            ValueError: if field is not a device field
+        """
+        if field not in FIELDS:
+            raise ValueError('Invalid DataSource field: {}'.format(field))
+        return self._query('WHERE "{}" = ?'.format(field), (term,))
+
+    def recs(self):
+        """
+        Returns:
+            list of Receiver dicts
+        """
+        return list(self._query("WHERE desc_id = '2'"))
+
+    def client_groups(self):
+        """
+        Returns:
+            list of datasource dicts that contain client datasources
+        """
+        return list(self._query("WHERE desc_id = '3' "
+                                "AND CAST(client_groups AS INTEGER) > 0"))
+
+    def steptree(self):
+        """
+        Returns:
+            list of tuples (idx, name, ds_ip, depth)
+        """
+        return [tuple(row) for row in self._conn().execute(
+                    'SELECT idx, name, ds_ip, depth FROM devices ORDER BY idx')]
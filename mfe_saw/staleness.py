@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+    mfe_saw.staleness
+    ~~~~~~~~~~~~~
+
+    This module imports into 'DevTree' to report how long datasources
+    have been silent.
+
+    Every datasource is put in a bucket by the age of its last event and
+    the buckets are counted per group, e.g. per Receiver, vendor/model
+    and zone, in a single pass over the columns of a built tree.
+"""
+import csv
+import json
+import time
+from bisect import bisect_right
+
+from mfe_saw.aggregate import group_columns, kind_positions
+
+# (label, max age in seconds) in ascending order, ages below max age are
+# in the bucket. None is the catch all.
+BUCKETS = [('<1h', 3600),
+           ('<1d', 86400),
+           ('<7d', 7 * 86400),
+           ('<30d', 30 * 86400),
+           ('30d+', None)]
+
+NEVER = 'never'
+
+GROUPINGS = [('rec_name',), ('vendor', 'model'), ('zone_name',)]
+
+
+def bucket_labels(buckets=None):
+    """
+    Returns:
+        list of the bucket labels in report order
+    """
+    return [label for label, _ in buckets or BUCKETS] + [NEVER]
+
+
+def staleness(devtree, index, groupings=None, buckets=None, now=None,
+              kind='datasource'):
+    """
+    Counts datasources per silence bucket for each group.
+
+    Args:
+        devtree (TreeStore): built device tree
+        index (DevIndex): indexes over devtree
+        groupings (list): tuples of fields to group by. Defaults to
+                          GROUPINGS.
+        buckets (list): (label, max age) tuples, see BUCKETS
+        now (float): epoch the ages are measured from, defaults to now
+        kind (str): device class from DESC_CLASSES, None for all
+
+    Returns:
+        List of report rows, dicts with 'group' (the field names joined
+        by '/'), 'key' (the values joined by '/'), a count for each
+        bucket label and 'total'. The first row is group 'all'.
+
+    Raises:
+        ValueError: if a field or the kind is invalid
+    """
+    groupings = [tuple(grouping) for grouping in groupings or GROUPINGS]
+    buckets = buckets or BUCKETS
+    labels = bucket_labels(buckets)
+    bounds = [age for _, age in buckets if age is not None]
+    never = len(labels) - 1
+    now = time.time() if now is None else now
+
+    positions = kind_positions(index, kind, len(devtree))
+    columns = group_columns(devtree, index, {field for grouping in groupings
+                                             for field in grouping})
+    counts = [{} for _ in groupings]
+    totals = [0] * len(labels)
+    for pos in positions:
+        epoch = index.epoch(pos)
+        if epoch is None:
+            bucket = never
+        else:
+            bucket = bisect_right(bounds, now - epoch)
+        totals[bucket] += 1
+        for gcounts, grouping in zip(counts, groupings):
+            key = tuple(columns[field][pos] or '' for field in grouping)
+            row = gcounts.get(key)
+            if row is None:
+                row = gcounts[key] = [0] * len(labels)
+            row[bucket] += 1
+
+    report = [_row('all', 'all', labels, totals)]
+    for gcounts, grouping in zip(counts, groupings):
+        for key in sorted(gcounts):
+            report.append(_row('/'.join(grouping), '/'.join(key), labels,
+                               gcounts[key]))
+    return report
+
+
+def _row(group, key, labels, counts):
+    """
+    Returns:
+        dict report row
+    """
+    row = {'group': group, 'key': key}
+    row.update(zip(labels, counts))
+    row['total'] = sum(counts)
+    return row
+
+
+def write_csv(rows, out, buckets=None):
+    """
+    Writes report rows as CSV with a header line.
+
+    Args:
+        rows (iterable): rows from staleness()
+        out (file): text file to write to
+        buckets (list): the buckets the rows were counted with
+    """
+    writer = csv.DictWriter(out, ['group', 'key'] + bucket_labels(buckets)
+                            + ['total'], lineterminator='\n')
+    writer.writeheader()
+    for row in rows:
+        writer.writerow(row)
+
+
+def write_ndjson(rows, out):
+    """
+    Writes report rows as newline delimited JSON, one object per row.
+
+    Args:
+        rows (iterable): rows from staleness()
+        out (file): text file to write to
+    """
+    for row in rows:
+        out.write(json.dumps(row))
+        out.write('\n')
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""
+    mfe_saw.treediff
+    ~~~~~~~~~~~~~
+
+    This module imports into 'DevTree' to compare two builds of the
+    device tree.
+
+    Devices are matched on ds_id with one dict lookup each so a diff is
+    linear in the size of the trees.
+"""
+from collections import namedtuple
+
+from mfe_saw.devindex import column
+
+TreeChange = namedtuple('TreeChange', ['kind', 'ds_id', 'name', 'field',
+                                       'old', 'new'])
+TreeChange.__doc__ = """
+    A single difference between two device trees.
+
+    kind is one of:
+        added       device is only in the new tree
+        removed     device is only in the old tree
+        changed     field changed from old to new
+        moved       parent_id changed, e.g. a client moved to another
+                    container. old and new are the parent ids.
+    """
+
+DIFF_FIELDS = ['name', 'ds_ip', 'hostname', 'enabled', 'zone_id',
+               'zone_name', 'type_id']
+
+
+def diff_trees(old, new, fields=None):
+    """
+    Compares two device trees.
+
+    Args:
+        old: list of datasource dicts or TreeStore
+        new: list of datasource dicts or TreeStore
+        fields (list): fields to compare, defaults to DIFF_FIELDS
+
+    Returns:
+        Generator of TreeChange tuples. Removed devices come first then
+        the rest in new tree order.
+    """
+    fields = fields or DIFF_FIELDS
+    cols = ['ds_id', 'parent_id'] + [f for f in fields if f != 'parent_id']
+    old_cols = {field: column(old, field) for field in cols}
+    new_cols = {field: column(new, field) for field in cols}
+    old_pos = {ds_id: pos for pos, ds_id in enumerate(old_cols['ds_id'])}
+    new_ids = set(new_cols['ds_id'])
+    old_names = column(old, 'name')
+    new_names = column(new, 'name')
+
+    for ds_id, pos in old_pos.items():
+        if ds_id not in new_ids:
+            yield TreeChange('removed', ds_id, old_names[pos], None, None, None)
+
+    for npos, ds_id in enumerate(new_cols['ds_id']):
+        opos = old_pos.get(ds_id)
+        if opos is None:
+            yield TreeChange('added', ds_id, new_names[npos], None, None, None)
+            continue
+        old_parent = old_cols['parent_id'][opos]
+        new_parent = new_cols['parent_id'][npos]
+        if old_parent != new_parent:
+            yield TreeChange('moved', ds_id, new_names[npos], 'parent_id',
+                             old_parent, new_parent)
+        for field in cols[2:]:
+            old_val = old_cols[field][opos]
+            new_val = new_cols[field][npos]
+            if old_val != new_val:
+                yield TreeChange('changed', ds_id, new_names[npos], field,
+                                 old_val, new_val)
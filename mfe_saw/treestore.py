@@ -0,0 +1,547 @@
+# -*- coding: utf-8 -*-
+"""
+    mfe_saw.treestore
+    ~~~~~~~~~~~~~
+
+    This module imports into 'DevTree' to provide compact, column
+    oriented storage for the device tree.
+
+    Each field is kept in its own column instead of every device holding
+    a dict of ~20 keys. Fields that repeat heavily (vendor, model,
+    zone_name, desc, enabled, rec_name...) are interned into a table of
+    unique values and stored as integer ids in an array. Fields that are
+    unique per device (idx, name, ds_id, ds_ip, hostname, last_time) are
+    kept as plain lists.
+
+    'DevRecord' is a lazy dict-like view of a single device so existing
+    code that expects datasource dicts keeps working.
+
+    A published store is frozen. Readers can hold it and its records by
+    reference without locks, and changes are made to a copy() whose
+    columns are shared with the frozen store until they are written.
+"""
+import mmap
+import os
+import pickle
+import struct
+import sys
+import time
+from array import array
+from collections.abc import MutableMapping, Sequence
+
+UNIQUE_FIELDS = ['idx', 'name', 'ds_id', 'ds_ip', 'hostname', 'last_time']
+
+SNAPSHOT_MAGIC = b'MFESAWTS'
+SNAPSHOT_VERSION = 5
+_SNAPSHOT_HEADER = struct.Struct('<8sHdH')
+
+
+class _Missing(object):
+    """
+    Marks a device that doesn't have a field. Pickles by reference so a
+    loaded snapshot's missing cells are still the one _MISSING.
+    """
+    __slots__ = ()
+
+    def __reduce__(self):
+        return '_MISSING'
+
+    def __repr__(self):
+        return '_MISSING'
+
+
+_MISSING = _Missing()
+
+
+class _InternedColumn(object):
+    """
+    Column of repeated values stored as ids into a table of unique values.
+
+    Id 0 is reserved for devices that don't have the field.
+    """
+    __slots__ = ('ids', 'values', 'lookup')
+
+    def __init__(self, size=0):
+        self.ids = array('I', bytes(4 * size))
+        self.values = [_MISSING]
+        self.lookup = {}
+
+    def _id(self, value):
+        vid = self.lookup.get(value)
+        if vid is None:
+            vid = len(self.values)
+            if isinstance(value, str):
+                value = sys.intern(value)
+            self.values.append(value)
+            self.lookup[value] = vid
+        return vid
+
+    def append(self, value):
+        self.ids.append(self._id(value))
+
+    def append_missing(self):
+        self.ids.append(0)
+
+    def get(self, pos):
+        return self.values[self.ids[pos]]
+
+    def set(self, pos, value):
+        self.ids[pos] = self._id(value)
+
+    def delete(self, pos):
+        self.ids[pos] = 0
+
+    def to_list(self):
+        values = self.values
+        return [values[vid] for vid in self.ids]
+
+    def copy(self):
+        new = _InternedColumn()
+        new.ids = array('I', self.ids)
+        new.values = list(self.values)
+        new.lookup = dict(self.lookup)
+        return new
+
+    def subset(self, positions):
+        new = _InternedColumn()
+        ids = self.ids
+        new.ids = array('I', [ids[pos] for pos in positions])
+        new.values = list(self.values)
+        new.lookup = dict(self.lookup)
+        return new
+
+
+class _PlainColumn(object):
+    """
+    Column of values that are mostly unique or not hashable.
+    """
+    __slots__ = ('values',)
+
+    def __init__(self, size=0):
+        self.values = [_MISSING] * size
+
+    def append(self, value):
+        self.values.append(value)
+
+    def append_missing(self):
+        self.values.append(_MISSING)
+
+    def get(self, pos):
+        return self.values[pos]
+
+    def set(self, pos, value):
+        self.values[pos] = value
+
+    def delete(self, pos):
+        self.values[pos] = _MISSING
+
+    def to_list(self):
+        return list(self.values)
+
+    def copy(self):
+        new = _PlainColumn()
+        new.values = list(self.values)
+        return new
+
+    def subset(self, positions):
+        new = _PlainColumn()
+        values = self.values
+        new.values = [values[pos] for pos in positions]
+        return new
+
+
+class TreeStore(Sequence):
+    """
+    Column oriented device tree.
+
+    Behaves like the list of datasource dicts it replaces: len(), index
+    access and iteration return 'DevRecord' views.
+
+    Public Methods:
+
+        column(field)   Returns a list of the field's value for every
+                        device, None where the device doesn't have it.
+
+        fields()        Returns list of field names in the store.
+
+        freeze()        Makes the store read-only and returns it.
+
+        copy()          Returns a writable copy of the store.
+
+        subset(positions)   Returns a writable store with only the
+                            devices at positions.
+
+    Writes to a frozen store or its records raise TypeError.
+    """
+    _frozen = False
+    _shared = frozenset()
+
+    def __init__(self, devtree=()):
+        """
+        Args:
+            devtree (iterable): datasource dicts to load into the store
+        """
+        self._columns = {}
+        self._shared = set()
+        self._size = 0
+        for ds in devtree:
+            self.append(ds)
+
+    def __len__(self):
+        """
+        Returns the count of devices in the store.
+        """
+        return self._size
+
+    def __getitem__(self, pos):
+        """
+        Returns:
+            DevRecord for the position or a list of them for a slice.
+        """
+        if isinstance(pos, slice):
+            return [DevRecord(self, idx) for idx in range(*pos.indices(self._size))]
+        if pos < 0:
+            pos += self._size
+        if not 0 <= pos < self._size:
+            raise IndexError('TreeStore index out of range')
+        return DevRecord(self, pos)
+
+    def __iter__(self):
+        """
+        Returns:
+            Generator of DevRecord views in device tree order.
+        """
+        for pos in range(self._size):
+            yield DevRecord(self, pos)
+
+    def freeze(self):
+        """
+        Makes the store read-only. DevTree freezes every tree it
+        publishes.
+
+        Returns:
+            the store
+        """
+        self._frozen = True
+        return self
+
+    def _writable(self, field=None):
+        """
+        Returns:
+            the field's column, copied first if it is shared with a
+            frozen store, or None if there is no such column
+
+        Raises:
+            TypeError: if the store is frozen
+        """
+        if self._frozen:
+            raise TypeError('TreeStore is read-only. Make changes to a '
+                            'copy() of it.')
+        column = self._columns.get(field)
+        if field in self._shared:
+            column = self._columns[field] = column.copy()
+            self._shared.discard(field)
+        return column
+
+    def _add_column(self, field, value):
+        """
+        Creates an empty column sized to the store.
+        """
+        if field in UNIQUE_FIELDS:
+            column = _PlainColumn(self._size)
+        else:
+            try:
+                hash(value)
+                column = _InternedColumn(self._size)
+            except TypeError:
+                column = _PlainColumn(self._size)
+        self._columns[field] = column
+        return column
+
+    def append(self, ds):
+        """
+        Adds a datasource to the end of the store.
+
+        Args:
+            ds (dict): datasource fields
+        """
+        self._writable()
+        for field in list(self._shared):
+            self._writable(field)
+        for field, column in self._columns.items():
+            if field not in ds:
+                column.append_missing()
+        for field, value in ds.items():
+            column = self._columns.get(field)
+            if column is None:
+                column = self._add_column(field, value)
+            self._set_new(column, field, value)
+        self._size += 1
+
+    def _set_new(self, column, field, value):
+        """
+        Appends a value, converting interned columns if it can't be hashed.
+        """
+        try:
+            column.append(value)
+        except TypeError:
+            column = self._to_plain(field)
+            column.append(value)
+
+    def _to_plain(self, field):
+        """
+        Converts an interned column into a plain one.
+        """
+        old = self._columns[field]
+        column = _PlainColumn()
+        column.values = old.to_list()
+        self._columns[field] = column
+        return column
+
+    def get(self, pos, field, default=_MISSING):
+        """
+        Returns:
+            value of the field for the device at pos
+
+        Raises:
+            KeyError: if the device doesn't have the field and no
+                      default is given
+        """
+        column = self._columns.get(field)
+        value = _MISSING if column is None else column.get(pos)
+        if value is _MISSING:
+            if default is _MISSING:
+                raise KeyError(field)
+            return default
+        return value
+
+    def set(self, pos, field, value):
+        """
+        Sets the value of the field for the device at pos.
+        """
+        column = self._writable(field)
+        if column is None:
+            column = self._add_column(field, value)
+        try:
+            column.set(pos, value)
+        except TypeError:
+            self._to_plain(field).set(pos, value)
+
+    def delete(self, pos, field):
+        """
+        Removes the field from the device at pos.
+        """
+        column = self._writable(field)
+        if column is None or column.get(pos) is _MISSING:
+            raise KeyError(field)
+        column.delete(pos)
+
+    def has(self, pos, field):
+        """
+        Returns:
+            bool: True if the device at pos has the field
+        """
+        column = self._columns.get(field)
+        return column is not None and column.get(pos) is not _MISSING
+
+    def copy(self):
+        """
+        Returns:
+            writable TreeStore with the same devices. The columns of a
+            frozen store are shared and each is copied the first time
+            it is written, other stores' columns are copied now.
+        """
+        store = TreeStore()
+        store._size = self._size
+        if self._frozen:
+            store._columns = dict(self._columns)
+            store._shared = set(self._columns)
+        else:
+            store._columns = {field: column.copy()
+                              for field, column in self._columns.items()}
+        return store
+
+    def subset(self, positions):
+        """
+        Args:
+            positions (iterable): positions of the devices to keep, in
+                                  the order to keep them
+
+        Returns:
+            writable TreeStore with only those devices. Columns are
+            filtered whole rather than a device at a time.
+        """
+        positions = list(positions)
+        store = TreeStore()
+        store._size = len(positions)
+        store._columns = {field: column.subset(positions)
+                          for field, column in self._columns.items()}
+        return store
+
+    def fields(self):
+        """
+        Returns:
+            list of field names in the store
+        """
+        return list(self._columns)
+
+    def column(self, field):
+        """
+        Args:
+            field (str): field name
+
+        Returns:
+            list of values in device tree order, None for devices that
+            don't have the field
+        """
+        column = self._columns.get(field)
+        if column is None:
+            return [None] * self._size
+        return [None if value is _MISSING else value
+                for value in column.to_list()]
+
+
+class TreeSnapshot(object):
+    """
+    A built device tree published together with its indexes.
+
+    Attributes:
+        tree (TreeStore): the device tree
+        index (DevIndex): indexes over tree
+        sections (dict): payload digests from the build, see
+                         DevTree.refresh()
+        built (float): epoch the snapshot was built or None if it is the
+                       empty placeholder
+        recs (tuple): ds_ids of the Receivers the tree was restricted
+                      to or None if it has all of them
+    """
+    __slots__ = ('tree', 'index', 'sections', 'built', 'recs')
+
+    def __init__(self, tree=None, index=None, sections=None, built=None,
+                 recs=None):
+        self.tree = TreeStore() if tree is None else tree
+        self.index = index
+        self.sections = sections or {}
+        if built is None and tree is not None:
+            built = time.time()
+        self.built = built
+        self.recs = recs
+
+    def age(self):
+        """
+        Returns:
+            float: seconds since the snapshot was built, None if never
+        """
+        if self.built is None:
+            return None
+        return time.time() - self.built
+
+    def save(self, path, host):
+        """
+        Writes the snapshot to disk.
+
+        The file is a fixed header (magic, format version, build time and
+        ESM host) followed by the pickled snapshot. It is written to a
+        temp file first and renamed into place.
+
+        Args:
+            path (str): file to write
+            host (str): ESM host the tree was built from
+        """
+        hostb = host.encode('utf-8')
+        tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tmp_path, 'wb') as open_f:
+            open_f.write(_SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION,
+                                               self.built, len(hostb)))
+            open_f.write(hostb)
+            pickle.dump((self.tree, self.index, self.sections, self.recs), 
+                        open_f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, host, max_age=None):
+        """
+        Reads a snapshot written by save(). The file is memory-mapped
+        and unpickled straight from the map.
+
+        Args:
+            path (str): file to read
+            host (str): ESM host the snapshot must have been built from
+            max_age (float): max age in seconds, None for no limit
+
+        Returns:
+            TreeSnapshot or None if the file is missing, from another
+            format version or host, older than max_age or can't be
+            unpickled, such as a corrupt file or one pickled by other code
+        """
+        try:
+            with open(path, 'rb') as open_f:
+                with mmap.mmap(open_f.fileno(), 0,
+                               access=mmap.ACCESS_READ) as mapped:
+                    return cls._from_buffer(mapped, host, max_age)
+        except (OSError, ValueError, EOFError, pickle.UnpicklingError,
+                AttributeError, ImportError, IndexError, TypeError):
+            return None
+
+    @classmethod
+    def _from_buffer(cls, buf, host, max_age):
+        """
+        Parses the header and payload of a snapshot file.
+        """
+        magic, version, built, hostlen = _SNAPSHOT_HEADER.unpack_from(buf)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            return None
+        start = _SNAPSHOT_HEADER.size
+        if bytes(buf[start:start + hostlen]).decode('utf-8') != host:
+            return None
+        if max_age is not None and time.time() - built > max_age:
+            return None
+        view = memoryview(buf)
+        try:
+            tree, index, sections, recs = pickle.loads(view[start + hostlen:])
+        finally:
+            view.release()
+        return cls(tree, index, sections, built, recs)
+
+
+class DevRecord(MutableMapping):
+    """
+    Lazy dict view of one device in a 'TreeStore'.
+
+    Reads and writes go straight to the store's columns, so records of a
+    frozen store are read-only. copy() returns a plain dict.
+    """
+    __slots__ = ('_store', '_pos')
+
+    def __init__(self, store, pos):
+        self._store = store
+        self._pos = pos
+
+    def __getitem__(self, field):
+        return self._store.get(self._pos, field)
+
+    def get(self, field, default=None):
+        return self._store.get(self._pos, field, default)
+
+    def __setitem__(self, field, value):
+        self._store.set(self._pos, field, value)
+
+    def __delitem__(self, field):
+        self._store.delete(self._pos, field)
+
+    def __contains__(self, field):
+        return self._store.has(self._pos, field)
+
+    def __iter__(self):
+        store, pos = self._store, self._pos
+        return (field for field in store.fields() if store.has(pos, field))
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def copy(self):
+        return dict(self)
+
+    def __repr__(self):
+        return repr(dict(self))
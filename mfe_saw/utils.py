@@ -4,57 +4,118 @@
 
 """
 
+import csv
+import re
 import time
 from functools import wraps
 
+_ROW_END = re.compile('%12|\x11|\n')
+
+
+# The ESM also sends '\x22', '\x23', '\x27' ... '\x7c' but those are the
+# characters '"', '#', "'" ... '|' already so they need no decoding.
+_HEXEN = (
+    ('\x1c', ','),  # Replacing Device Control 1 with a comma.
+    ('\x11', '\n'),  # Replacing Device Control 2 with a new line.
+    ('\x12', ' '),  # Space
+)
+
+_URI = (
+    ('%11', ','),  # Replacing Device Control 1 with a comma.
+    ('%12', '\n'),  # Replacing Device Control 2 with a new line.
+    ('%20', ' '),  # Space
+    ('%22', '"'),  # Double Quotes
+    ('%23', '#'),  # Number Symbol
+    ('%27', '\''),  # Single Quote
+    ('%28', '('),  # Open Parenthesis
+    ('%29', ')'),  # Close Parenthesis
+    ('%2B', '+'),  # Plus Symbol
+    ('%2D', '-'),  # Hyphen Symbol
+    ('%2E', '.'),  # Period, dot, or full stop.
+    ('%2F', '/'),  # Forward Slash or divide symbol.
+    ('%3A', ':'),  # Colon
+    ('%7C', '|'),  # Vertical bar or pipe.
+    ('%09', '\t'),  # Tab
+    ('%0D', '\r'),  # Carriage return
+    ('%5C', '\\'),  # Backslash
+    ('%25', '%'),  # Percent sign. Decoded last so it isn't decoded twice.
+)
+
+_CODES = _HEXEN + _URI
+_CODES_BYTES = tuple((enc.encode(), dec.encode()) for enc, dec in _CODES)
+
+# Encodes every _URI character in one pass, so the '%' of a code is
+# never encoded again.
+_HEXIFY_TABLE = str.maketrans({dec: enc for enc, dec in _URI})
+
 
 def dehexify(data):
     """
     A URL and Hexadecimal Decoding Library.
 
+    Args:
+        data (str or bytes): payload as sent by the ESM
+
+    Returns:
+        Decoded str, or bytes for bytes input
+
     Credit: Larry Dewey
     """
-
-    hexen = {
-        '\x1c': ',',  # Replacing Device Control 1 with a comma.
-        '\x11': '\n',  # Replacing Device Control 2 with a new line.
-        '\x12': ' ',  # Space
-        '\x22': '"',  # Double Quotes
-        '\x23': '#',  # Number Symbol
-        '\x27': '\'',  # Single Quote
-        '\x28': '(',  # Open Parenthesis
-        '\x29': ')',  # Close Parenthesis
-        '\x2b': '+',  # Plus Symbol
-        '\x2d': '-',  # Hyphen Symbol
-        '\x2e': '.',  # Period, dot, or full stop.
-        '\x2f': '/',  # Forward Slash or divide symbol.
-        '\x7c': '|',  # Vertical bar or pipe.
-    }
-
-    uri = {
-        '%11': ',',  # Replacing Device Control 1 with a comma.
-        '%12': '\n',  # Replacing Device Control 2 with a new line.
-        '%20': ' ',  # Space
-        '%22': '"',  # Double Quotes
-        '%23': '#',  # Number Symbol
-        '%27': '\'',  # Single Quote
-        '%28': '(',  # Open Parenthesis
-        '%29': ')',  # Close Parenthesis
-        '%2B': '+',  # Plus Symbol
-        '%2D': '-',  # Hyphen Symbol
-        '%2E': '.',  # Period, dot, or full stop.
-        '%2F': '/',  # Forward Slash or divide symbol.
-        '%3A': ':',  # Colon
-        '%7C': '|',  # Vertical bar or pipe.
-    }
-
-    for (enc, dec) in hexen.items():
+    codes = _CODES if isinstance(data, str) else _CODES_BYTES
+    for enc, dec in codes:
         data = data.replace(enc, dec)
+    return data
 
-    for (enc, dec) in uri.items():
-        data = data.replace(enc, dec)
 
-    return data
+def hexify(text):
+    """
+    Encodes text for the ESM private API, the reverse of dehexify().
+
+    Args:
+        text (str): plain text, e.g. a client file to upload
+
+    Returns:
+        str encoded with the URI codes the ESM sends. '%', backslash,
+        quotes and whitespace are all encoded so the text can be put in
+        a request param as is.
+    """
+    return text.translate(_HEXIFY_TABLE)
+
+
+def dehexify_lines(data, block_size=65536):
+    """
+    Splits an encoded payload into rows and decodes it a block of rows
+    at a time, so the whole payload is never copied.
+
+    Args:
+        data (str): payload as sent by the ESM
+        block_size (int): approximate characters decoded at once
+
+    Returns:
+        Generator of decoded rows without their line endings
+    """
+    start = 0
+    size = len(data)
+    while start < size:
+        match = _ROW_END.search(data, min(start + block_size, size))
+        end = match.end() if match else size
+        lines = dehexify(data[start:end]).split('\n')
+        if lines[-1] == '':
+            lines.pop()
+        yield from lines
+        start = end
+
+
+def dehexify_rows(data):
+    """
+    Args:
+        data (str): comma separated payload as sent by the ESM
+
+    Returns:
+        Generator of rows, each a list of decoded field strings.
+        Blank rows are empty lists.
+    """
+    return csv.reader(dehexify_lines(data), delimiter=',')
 
 
 def timethis(func):
@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+"""
+    mfe_saw.watcher
+    ~~~~~~~~~~~~~
+
+    This module provides a background thread that reports datasources
+    going silent and coming back without rebuilding the 'DevTree'.
+"""
+import heapq
+import logging
+import queue
+import threading
+import time
+from collections import namedtuple
+
+from mfe_saw.datasource import DevTree
+from mfe_saw.devindex import DESC_CLASSES, last_time_to_epoch
+
+SilenceEvent = namedtuple('SilenceEvent', ['kind', 'ds_id', 'name', 'type_id',
+                                           'last_time', 'seconds'])
+SilenceEvent.__doc__ = """
+    A datasource crossing its silence threshold.
+
+    kind is one of:
+        silent      nothing heard for longer than the threshold
+        back        a silent datasource sent an event again
+
+    last_time is the ESM last event time string and seconds the time
+    between it and the poll.
+    """
+
+
+class SilenceWatcher(threading.Thread):
+    """
+    Polls the ESM last event times and reports silent datasources.
+
+    Each poll is the single ds_last_times query. Only the rows whose
+    last event time changed since the previous poll are parsed, and the
+    time each datasource will go silent is kept in a heap, so a poll
+    doesn't look at datasources that neither sent events nor crossed
+    their threshold. The current deadline of each datasource is kept in
+    a dict. Heap entries it has replaced are skipped when they are
+    popped, and the heap is rebuilt from the dict once it holds more
+    than twice as many entries. The device tree is only refreshed when the query
+    returns a ds_id it doesn't know, e.g. a datasource added since the
+    last build.
+
+    Datasources the ESM has never heard from have no last event time and
+    are not reported.
+
+    Public Methods:
+
+        start()     Starts polling every interval seconds.
+
+        stop()      Stops the watcher after any poll in progress.
+
+        poll()      Polls once. Returns list of SilenceEvent tuples.
+
+        silent()    Returns set of ds_ids currently silent.
+
+    Attributes:
+        events (queue.Queue): SilenceEvent tuples found by the thread
+        last_error (Exception): error from the last failed poll or None
+
+    Example:
+        >>> watcher = SilenceWatcher(interval=60, threshold=3600,
+        ...                          thresholds={'65': 600})
+        >>> watcher.start()
+        >>> event = watcher.events.get()
+    """
+    def __init__(self, interval=300, threshold=86400, thresholds=None,
+                 kind='datasource', callback=None):
+        """
+        Args:
+            interval (int): seconds between polls
+            threshold (int): seconds without events before a datasource
+                             is silent
+            thresholds (dict): type_id (str) to seconds, overrides
+                               threshold for those types
+            kind (str): device class from DESC_CLASSES to watch
+            callback (callable): called with each SilenceEvent from the
+                                 thread, as well as queuing it
+
+        Raises:
+            ValueError: if the kind is invalid
+
+        Note:
+            The first build, if there is none yet, happens in the
+            calling thread.
+        """
+        super().__init__(name='SilenceWatcher', daemon=True)
+        if kind not in DESC_CLASSES:
+            raise ValueError('Invalid device kind: {}'.format(kind))
+        self._interval = interval
+        self._threshold = threshold
+        self._thresholds = thresholds or {}
+        self._desc_ids = set(DESC_CLASSES[kind])
+        self._callback = callback
+        self._stop_event = threading.Event()
+        self._devtree = DevTree()
+        self._snap = None
+        self._times = {}
+        self._due = {}
+        self._deadlines = []
+        self._silent = set()
+        self._unknown = set()
+        self.events = queue.Queue()
+        self.last_error = None
+
+    def run(self):
+        """
+        Poll loop
+        """
+        while not self._stop_event.is_set():
+            try:
+                for event in self.poll():
+                    self.events.put(event)
+                    if self._callback:
+                        self._callback(event)
+                self.last_error = None
+            except Exception as err:
+                self.last_error = err
+                logging.exception('SilenceWatcher poll failed.')
+            self._stop_event.wait(self._interval)
+
+    def stop(self, timeout=None):
+        """
+        Stops the watcher thread.
+
+        Args:
+            timeout (float): seconds to wait for the thread to finish
+        """
+        self._stop_event.set()
+        self.join(timeout)
+
+    def silent(self):
+        """
+        Returns:
+            set of ds_ids that are silent as of the last poll
+        """
+        return set(self._silent)
+
+    def poll(self, now=None):
+        """
+        Fetches the last event times and compares them with the last poll.
+
+        Args:
+            now (float): epoch seconds the ages are measured from,
+                         defaults to now
+
+        Returns:
+            list of SilenceEvent tuples in the order they were found
+        """
+        now = time.time() if now is None else now
+        changed = [(ds_id, last_time) for ds_id, last_time
+                   in DevTree._iter_last_times(
+                       self._devtree._get_last_event_times())
+                   if self._times.get(ds_id) != last_time]
+        self._check_unknown(ds_id for ds_id, _ in changed)
+
+        events = []
+        for ds_id, last_time in changed:
+            if ds_id in self._unknown:
+                continue
+            self._times[ds_id] = last_time
+            info = self._info(ds_id)
+            epoch = last_time_to_epoch(last_time)
+            if info is None or epoch is None:
+                continue
+            self._push(ds_id, epoch + self._limit(info[1]), epoch)
+            if ds_id in self._silent and now - epoch <= self._limit(info[1]):
+                self._silent.discard(ds_id)
+                events.append(SilenceEvent('back', ds_id, info[0], info[1],
+                                           last_time, now - epoch))
+
+        while self._deadlines and self._deadlines[0][0] < now:
+            deadline, ds_id, epoch = heapq.heappop(self._deadlines)
+            if self._due.get(ds_id) != (deadline, epoch):
+                continue
+            del self._due[ds_id]
+            info = self._info(ds_id)
+            if info is None or ds_id in self._silent:
+                continue
+            self._silent.add(ds_id)
+            events.append(SilenceEvent('silent', ds_id, info[0], info[1],
+                                       self._times[ds_id], now - epoch))
+        return events
+
+    def _push(self, ds_id, deadline, epoch):
+        """
+        Makes deadline the datasource's current deadline, compacting the
+        heap if replaced entries have piled up.
+        """
+        self._due[ds_id] = (deadline, epoch)
+        heapq.heappush(self._deadlines, (deadline, ds_id, epoch))
+        if len(self._deadlines) > 2 * len(self._due) + 64:
+            self._deadlines = [(due, due_id, due_epoch) for due_id,
+                               (due, due_epoch) in self._due.items()]
+            heapq.heapify(self._deadlines)
+
+    def _limit(self, type_id):
+        """
+        Returns:
+            int: silence threshold seconds for the type_id
+        """
+        return self._thresholds.get(type_id, self._threshold)
+
+    def _check_unknown(self, ds_ids):
+        """
+        Refreshes the device tree when the poll has ds_ids that aren't
+        in it and weren't already missing after an earlier refresh.
+        ds_ids still missing, e.g. outside the Receivers the tree was
+        built for, are skipped until a refresh finds them.
+
+        Args:
+            ds_ids (iterable): changed ds_ids from the poll. Unknown
+                               ds_ids are never recorded, so they are
+                               always among them.
+        """
+        topology = DevTree._Snapshot.index.topology
+        new = {ds_id for ds_id in ds_ids
+               if topology.position(ds_id) is None}
+        if new <= self._unknown:
+            self._unknown = new
+            return
+        logging.info('%d unknown datasources in last event times. '
+                     'Refreshing the device tree.', len(new))
+        self._devtree.refresh()
+        topology = DevTree._Snapshot.index.topology
+        self._unknown = {ds_id for ds_id in new
+                         if topology.position(ds_id) is None}
+
+    def _info(self, ds_id):
+        """
+        Returns:
+            tuple (name, type_id) if the ds_id is a watched device in the
+            current snapshot, else None
+        """
+        snap = DevTree._Snapshot
+        if snap is not self._snap:
+            self._snap = snap
+            self._names = snap.tree.column('name')
+            self._type_ids = snap.tree.column('type_id')
+            self._desc = snap.tree.column('desc_id')
+        pos = snap.index.topology.position(ds_id)
+        if pos is None or self._desc[pos] not in self._desc_ids:
+            return None
+        return self._names[pos], self._type_ids[pos]
@@ -2,12 +2,17 @@
 """
     mfe_saw utils test
 """
+import csv
+import time
+
 import pytest
 import requests
 
 try:
+    from mfe_saw.exceptions import ESMException
     from mfe_saw.utils import dehexify
 except ModuleNotFoundError:
+    from .utils.mfe_saw.exceptions import ESMException
     from .utils.mfe_saw.utils import dehexify
 
 BASE_URL = 'https://22.22.22.60'
@@ -21,4 +26,156 @@ def get_login():
         return resp
     else:
         return None
-    
\ No newline at end of file
+
+
+def hexify(text):
+    """
+    Encodes text the way the ESM private API sends it.
+    """
+    return (text.replace(',', '%11').replace('\n', '%12')
+                .replace(' ', '%20').replace('.', '%2E'))
+
+
+class FakeESM(object):
+    """
+    Stands in for Base.post with canned device tree payloads.
+
+    Attributes hold the dehexified payloads and can be changed between
+    builds. delays holds seconds to wait before returning a container's
+    client file. calls records every method posted.
+    """
+    def __init__(self):
+        self.devtree = (
+            '14,Local ESM,144115188075855872,0,T,T,T,T,T,T,T,T,TTT,1,0,T,306,,F,F,F,TTT,,syslog,0,T,F,22.22.26.15,,3,1,\n'
+            '2,ERC-1,144117387099111424,0,T,T,T,T,T,T,T,T,TTT,3,0,F,TTTTTTTTTTTTTTTTTTTTTTTTTTTTTTTT,10001000,ERC-VM4,F,F,TTT,,syslog,0,T,F,22.22.26.17,,9,1,\n'
+            '3,app,144117387182997504,6,T,T,T,T,T,T,T,T,TTT,0,0,T,65,syslog,F,F,F,TTT,0,gsyslog,0,T,F,22.22.26.3,,0,0,\n'
+            '3,Test-Parent-1,144117388424511488,78,T,T,T,T,T,T,T,T,TTT,6,0,T,65,syslog,F,F,F,TTT,6,gsyslog,0,T,F,12.0.0.0,,2,1,\n'
+            '3,Tool,144117387149443072,4,T,T,T,T,T,T,T,T,TTT,0,0,T,65,syslog,F,F,F,TTT,0,gsyslog,0,T,F,22.22.26.6,,0,0,\n'
+            '2,ERC-2,144117387099111999,0,T,T,T,T,T,T,T,T,TTT,3,0,F,TTTTTTTTTTTTTTTTTTTTTTTTTTTTTTTT,10001000,ERC-VM4,F,F,TTT,,syslog,0,T,F,22.22.27.17,,9,1,\n'
+            '3,Mail,144117387199774720,7,T,T,T,T,T,T,T,T,TTT,0,0,T,348,syslog,F,F,F,TTT,0,gsyslog,0,T,F,22.22.27.4,,0,0,\n')
+        self.clients = {
+            '144117388424511488': (
+                '144117388424511744,client-1,T,12.0.0.1,c1.corp,65,UNIX,Linux,51,0,0,514,F\n'
+                '144117388424577024,client-2,T,12.0.0.2,c2.corp,65,UNIX,Linux,51,0,0,514,F\n')}
+        self.zonetree = ('1,HQ,1,\n'
+                         '3,Mail,144117387199774720,\n')
+        self.zones = [{'name': 'HQ', 'id': {'value': '7'}, 'subZones': []}]
+        self.last_times = ('144117387182997504,,,07/01/2017 10:00:00\n'
+                           '144117387199774720,,,07/05/2017 10:00:00\n')
+        self.type_counts = '65,5\n348,1\n'
+        self.delays = {}
+        self.added = []
+        self.files = {}
+        self.rejects = set()
+        self.deleted = []
+        self.imports = []
+        self.calls = []
+
+    def post(self, method, data=None, callback=None, raw=False):
+        self.calls.append(method)
+        if method == 'GRP_GETVIRTUALGROUPIPSLISTDATA':
+            if data['DID'] == '3':
+                resp = {'ITEMS': hexify(self.zonetree)}
+            else:
+                resp = {'ITEMS': hexify(self.devtree)}
+        elif method == 'DS_GETDSCLIENTLIST':
+            resp = {'FTOKEN': data['DSID']}
+        elif method == 'MISC_READFILE':
+            time.sleep(self.delays.get(data['FNAME'], 0))
+            resp = {'DATA': hexify(self.clients.get(data['FNAME'], ''))}
+        elif method == 'dsAddDataSource':
+            name = data['datasource']['name']
+            if name in self.rejects:
+                return None
+            self.added.append(name)
+            resp = {'id': {'id': str(144117390000000000 + len(self.added))}}
+        elif method == 'DS_ADDDSCLIENT':
+            self.added.append(data['NAME'])
+            resp = {'EC': '0'}
+        elif method == 'MISC_WRITEFILE':
+            fname = data['FNAME'] or 'upload-{}'.format(len(self.files) + 1)
+            self.files[fname] = self.files.get(fname, '') + data['DATA1']
+            resp = {'FTOKEN': fname}
+        elif method == 'DS_IMPORTDSCLIENTS':
+            rows = dehexify(self.files.pop(data['FNAME'])).splitlines()
+            clients = self.clients.get(data['DSID'], '')
+            for row in rows:
+                self.added.append(row.split(',')[1])
+                ds_id = str(144117390000000000 + len(self.added))
+                clients += ds_id + row + '\n'
+            self.clients[data['DSID']] = clients
+            resp = {'EC': '0'}
+        elif method == 'DS_IMPORTDATASOURCES':
+            text = dehexify(self.files.pop(data['FNAME']))
+            self.imports.append(text)
+            rows = list(csv.reader(text.splitlines()))
+            header = rows[1]
+            for row in map(lambda row: dict(zip(header, row)), rows[2:]):
+                if row['dsname'] in self.rejects:
+                    continue
+                self.added.append(row['dsname'])
+                line = ('3,{},{},4,T,T,T,T,T,T,T,T,TTT,0,0,T,65,syslog,F,F,F,'
+                        'TTT,0,gsyslog,0,T,F,{},,0,0,\n'.format(
+                            row['dsname'],
+                            144117390000000000 + len(self.added), row['ip']))
+                lines = self.devtree.splitlines(True)
+                pos = next(num for num, old in enumerate(lines)
+                           if old.split(',')[2] == row['rec_id'])
+                lines.insert(pos + 1, line)
+                self.devtree = ''.join(lines)
+            resp = {'EC': '0'}
+        elif method == 'dsGetDataSourceDetail':
+            ds_id = data['datasourceId']['id']
+            if ds_id in self.rejects:
+                return None
+            resp = {'id': {'id': ds_id}, 'parameters': [
+                        {'key': 'calls', 'value': str(len(self.calls))}]}
+        elif method == 'dsDeleteDataSource':
+            ds_id = data['datasourceId']['id']
+            if ds_id in self.rejects:
+                raise ESMException('Datasource not deleted: {}'.format(ds_id))
+            self.deleted.append(ds_id)
+            resp = None
+        elif method == 'DS_DELETEDSCLIENTS':
+            self.deleted.extend(data['CLIENTIDS'].split(','))
+            resp = {'EC': '0'}
+        elif method == 'zoneGetZoneTree':
+            resp = self.zones
+        elif method == 'QRY_GETDEVICECOUNTBYTYPE':
+            resp = {'ITEMS': hexify(self.type_counts)}
+        elif method.startswith('QRY'):
+            resp = {'ITEMS': hexify(self.last_times)}
+        elif method.startswith('devGetDeviceList'):
+            resp = [{'name': 'ERC-1', 'id': {'id': '144117387099111424'}},
+                    {'name': 'ERC-2', 'id': {'id': '144117387099111999'}}]
+        elif method == 'dsGetDataSourceTypes':
+            resp = {'vendors': [
+                {'name': 'UNIX', 'models': [{'id': {'id': 65}, 'name': 'Linux'}]},
+                {'name': 'Microsoft', 'models': [{'id': {'id': 348}, 'name': 'Exchange'}]}]}
+        else:
+            resp = {}
+        if callback:
+            resp = callback(resp)
+        return resp
+
+
+@pytest.fixture
+def fake_esm(monkeypatch):
+    """
+    Patches Base.post with a FakeESM and resets the shared DevTree.
+    """
+    from mfe_saw.base import Base
+    from mfe_saw.datasource import DevTree
+    from mfe_saw.esm import ESM
+    from mfe_saw.treestore import TreeSnapshot
+    esm = FakeESM()
+    monkeypatch.setattr(Base, 'post', lambda self, *args, **kwargs: esm.post(*args, **kwargs))
+    monkeypatch.setattr(Base, '_baseurl', 'https://22.22.22.60/rs/esm/')
+    monkeypatch.setattr(DevTree, '_Snapshot', TreeSnapshot())
+    monkeypatch.setattr(DevTree, '_DevTree', DevTree._Snapshot.tree)
+    monkeypatch.setattr(DevTree, '_DevIndex', None)
+    monkeypatch.setattr(DevTree, '_Backend', None)
+    monkeypatch.setattr(DevTree, '_Subscribers', [])
+    ESM._get_ds_types.cache_clear()
+    ESM.recs.cache_clear()
+    return esm
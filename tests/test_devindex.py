@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+    mfe_saw devindex test
+"""
+import pytest
+from datetime import datetime
+
+try:
+    from mfe_saw.devindex import DevIndex
+except ModuleNotFoundError:
+    from .utils.mfe_saw.devindex import DevIndex
+
+
+devtree = [
+    {'desc_id': '2', 'name': 'ERC-1', 'ds_id': '100', 'type_id': '0',
+     'vendor': '', 'model': '', 'zone_id': '0', 'port': '',
+     'last_time': ''},
+    {'desc_id': '3', 'name': 'Exchange-1', 'ds_id': '101', 'type_id': '348',
+     'vendor': 'Microsoft', 'model': 'Exchange', 'parent_id': '100',
+     'zone_id': '0', 'port': '514', 'last_time': '07/01/2017 10:00:00'},
+    {'desc_id': '3', 'name': 'linux-1', 'ds_id': '102', 'type_id': '65',
+     'vendor': 'UNIX', 'model': 'Linux', 'parent_id': '100',
+     'zone_id': '7', 'port': '514', 'last_time': '07/05/2017 10:00:00'},
+    {'desc_id': '256', 'name': 'EXCH-PRD-01', 'ds_id': '103', 'type_id': '348',
+     'vendor': 'Microsoft', 'model': 'Exchange', 'parent_id': '101',
+     'zone_id': '0', 'port': '6514', 'last_time': ''},
+]
+
+
+def test_select_equality_and_membership():
+    idx = DevIndex(devtree)
+    assert list(idx.select(vendor='Microsoft')) == [1, 3]
+    assert list(idx.select(port__in=['514', '6514'], zone_id='0')) == [1, 3]
+    assert list(idx.select(kind='client', type_id='348')) == [3]
+
+
+def test_select_prefix_and_last_time_range():
+    idx = DevIndex(devtree)
+    assert list(idx.select(name__prefix='exch')) == [1, 3]
+    assert list(idx.select(last_time__lt=datetime(2017, 7, 3))) == [1]
+    assert list(idx.select(kind='datasource',
+                           last_time__gte='07/01/2017 10:00:00')) == [1, 2]
+
+
+def test_select_invalid_criteria():
+    idx = DevIndex(devtree)
+    with pytest.raises(ValueError):
+        idx.select(name__like='x')
+    with pytest.raises(ValueError):
+        idx.select(port__gt='500')
+    with pytest.raises(ValueError):
+        idx.select(kind='toaster')
+
+
+def test_ip_index():
+    tree = [{'ds_ip': '10.1.2.3'}, {'ds_ip': '10.1.200.1'},
+            {'ds_ip': '10.2.0.1'}, {'ds_ip': 'fe80::1'}, {'ds_ip': ''}]
+    ips = DevIndex(tree).ips
+    assert len(ips) == 4
+    assert ips.cidr('10.1.0.0/16') == [0, 1]
+    assert ips.range('10.1.100.0', '10.3.0.0') == [1, 2]
+    assert ips.cidr('fe80::/64') == [3]
+    net, positions = ips.longest_prefix('10.1.2.9')
+    assert str(net) == '10.1.2.0/28' and positions == [0]
+    assert sorted(vars(ips)) == ['_keys', '_positions']
+
+
+def test_name_index():
+    names = DevIndex(devtree).names
+    assert names.substring('exch') == [1, 3]
+    assert names.substring('EXCH', limit=1) == [1]
+    assert names.substring('x') == [1, 2, 3]
+    best = [pos for _, pos in names.fuzzy('exchange')]
+    assert best[0] == 1 and 3 in best
+
+
+def test_lookup():
+    tree = devtree + [{'name': '10.0.0.9', 'ds_ip': '10.0.0.9', 'ds_id': '104'},
+                      {'name': 'Linux-1', 'ds_id': '105'}]
+    idx = DevIndex(tree)
+    assert list(idx.lookup('LINUX-1')) == [2, 5]
+    assert list(idx.lookup('10.0.0.9')) == [4]
+    assert list(idx.lookup('103')) == [3]
+    assert list(idx.lookup('nothing')) == []
+
+
+def test_concurrent_select_matches_baseline():
+    import sys
+    from concurrent.futures import ThreadPoolExecutor
+    from mfe_saw.treestore import TreeStore
+    tree = TreeStore(dict(ds, ds_id=str(num), name='{}-{}'.format(ds['name'], num))
+                     for num in range(20) for ds in devtree).freeze()
+    idx = DevIndex(tree)
+    queries = [{'vendor': 'Microsoft'},
+               {'port__in': ['6514'], 'zone_id': '0'},
+               {'kind': 'client', 'type_id': '348'},
+               {'name__prefix': 'linux', 'zone_id': '7'},
+               {'kind': 'datasource', 'last_time__lt': datetime(2017, 7, 3)}]
+    baseline = [list(idx.select(**query)) for query in queries]
+
+    def run(num):
+        query = num % len(queries)
+        return query, list(idx.select(**queries[query]))
+
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(run, range(20000)))
+    finally:
+        sys.setswitchinterval(interval)
+    assert all(found == baseline[query] for query, found in results)
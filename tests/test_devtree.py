@@ -0,0 +1,553 @@
+# -*- coding: utf-8 -*-
+"""
+    mfe_saw devtree test
+"""
+import json
+
+import pytest
+
+try:
+    from mfe_saw.datasource import DevTree
+except ModuleNotFoundError:
+    from .utils.mfe_saw.datasource import DevTree
+
+from .esm_service import fake_esm
+
+
+def test_build_devtree(fake_esm):
+    devtree = DevTree()
+    assert [ds['name'] for ds in devtree._DevTree] == [
+        'Local ESM', 'ERC-1', 'app', 'Test-Parent-1', 'client-1', 'client-2',
+        'Tool', 'ERC-2', 'Mail']
+    assert [ds['idx'] for ds in devtree._DevTree] == list(range(1, 10))
+    assert devtree.search('client-2')['parent_id'] == '144117388424511488'
+    mail = devtree.search('Mail')
+    assert mail is None
+    mail = devtree.search('Mail', zone_id='7')
+    assert mail.zone_name == 'HQ' and mail.vendor == 'Microsoft'
+    assert mail.last_time == '07/05/2017 10:00:00'
+
+
+def test_incremental_refresh(fake_esm):
+    devtree = DevTree()
+    report = devtree.refresh()
+    assert report['rebuilt'] == []
+    assert sorted(report['reused']) == ['clients:144117388424511488',
+                                        'devtree', 'zonetree']
+    fake_esm.calls = []
+    fake_esm.devtree = fake_esm.devtree.replace('12.0.0.0,,2,1', '12.0.0.0,,3,1')
+    fake_esm.clients['144117388424511488'] += (
+        '144117388424577025,client-3,T,12.0.0.3,c3.corp,65,UNIX,Linux,51,0,0,514,F\n')
+    report = devtree.refresh()
+    assert sorted(report['rebuilt']) == ['clients:144117388424511488', 'devtree']
+    assert report['reused'] == ['zonetree']
+    assert 'zoneGetZoneTree' not in fake_esm.calls
+    assert len(devtree) == 10 and 'client-3' in devtree
+
+
+def test_background_refresh(fake_esm):
+    from mfe_saw.refresher import DevTreeRefresher
+    refresher = DevTreeRefresher(interval=60)
+    devtree = DevTree()
+    old = DevTree._Snapshot
+    fake_esm.devtree = fake_esm.devtree.replace(',Tool,', ',Tool-2,')
+    refresher.start()
+    refresher.refresh_now()
+    for _ in range(100):
+        if DevTree._Snapshot is not old:
+            break
+        refresher.join(0.05)
+    refresher.stop(timeout=5)
+    assert 'Tool' in [ds['name'] for ds in old.tree]
+    assert devtree.search('Tool-2') and not devtree.search('Tool')
+    assert devtree.age() < 60
+
+
+def test_snapshot_save_and_load(fake_esm, tmpdir):
+    from mfe_saw.treestore import TreeSnapshot
+    path = str(tmpdir.join('devtree.snap'))
+    devtree = DevTree()
+    devtree.save_snapshot(path)
+    built = DevTree._Snapshot.built
+    DevTree._publish(TreeSnapshot())
+    assert not devtree.load_snapshot(path=path, max_age=-1)
+    assert devtree.load_snapshot(path=path, max_age=60)
+    assert DevTree._Snapshot.built == built
+    assert devtree.search('client-1')['ds_ip'] == '12.0.0.1'
+    assert 'rec_name' not in devtree.search('client-1').props()
+    assert json.loads(repr(devtree.search('client-1')))['name'] == 'client-1'
+    assert list(devtree.query(vendor='Microsoft'))[0]['name'] == 'Mail'
+    assert TreeSnapshot.load(path, 'other-esm') is None
+
+
+def test_sqlite_backend(fake_esm, tmpdir):
+    devtree = DevTree(db_path=str(tmpdir.join('devtree.db')))
+    assert len(devtree) == 9
+    assert [step[1] for step in devtree.steptree()][3:6] == [
+        'Test-Parent-1', 'client-1', 'client-2']
+    assert devtree.search('C2.CORP')['parent_id'] == '144117388424511488'
+    mail = devtree.search('mail', zone_id='7')
+    assert mail.vendor == 'Microsoft' and mail.last_time == '07/05/2017 10:00:00'
+    assert [ds.name for ds in devtree.search_ds_group('type_id', '65')] == [
+        'app', 'Test-Parent-1', 'client-1', 'client-2', 'Tool']
+    assert [rec['name'] for rec in devtree.recs()] == ['ERC-1', 'ERC-2']
+    fake_esm.devtree = fake_esm.devtree.replace(',Tool,', ',Tool-2,')
+    devtree.refresh()
+    assert devtree.search('Tool-2') and not devtree.search('Tool')
+
+
+def test_diff_and_changes(fake_esm):
+    devtree = DevTree()
+    old = DevTree._Snapshot
+    changes = devtree.changes(timeout=0)
+    fake_esm.devtree = (fake_esm.devtree.replace(',22.22.26.6,', ',22.22.26.60,')
+                                        .replace('3,app,', '3,app2,')
+                                        .replace('144117387182997504', '144117387182997505'))
+    fake_esm.clients['144117387149443072'] = fake_esm.clients['144117388424511488']
+    fake_esm.clients['144117388424511488'] = ''
+    fake_esm.devtree = (fake_esm.devtree.replace('12.0.0.0,,2,1', '12.0.0.0,,0,1')
+                                        .replace('22.22.26.60,,0,0', '22.22.26.60,,2,0'))
+    devtree.refresh()
+    diff = devtree.diff(old)
+    kinds = sorted((c.kind, c.name, c.field) for c in diff)
+    assert kinds == [('added', 'app2', None, ), ('changed', 'Tool', 'ds_ip'),
+                     ('moved', 'client-1', 'parent_id'),
+                     ('moved', 'client-2', 'parent_id'),
+                     ('removed', 'app', None)]
+    assert sorted(changes) == sorted(diff)
+
+
+def test_diff_devtrees_across_refresh(fake_esm):
+    old = DevTree()
+    new = DevTree()
+    fake_esm.devtree = fake_esm.devtree.replace('3,Tool,', '3,Tool-2,')
+    new.refresh()
+    assert [(c.kind, c.old, c.new) for c in new.diff(old)] == [
+        ('changed', 'Tool', 'Tool-2')]
+    assert [(c.kind, c.old, c.new) for c in old.diff(new)] == [
+        ('changed', 'Tool-2', 'Tool')]
+    assert new.diff(new) == [] and old.diff(old) == []
+
+
+def test_clients_out_of_order(fake_esm):
+    fake_esm.devtree = fake_esm.devtree.replace('22.22.26.6,,0,0', '22.22.26.6,,1,0')
+    fake_esm.clients['144117387149443072'] = (
+        '144117387149443100,client-3,T,12.0.1.1,c3.corp,65,UNIX,Linux,51,0,0,514,F\n')
+    fake_esm.delays['144117388424511488'] = 0.2
+    devtree = DevTree()
+    assert [(ds['idx'], ds['name']) for ds in devtree._DevTree][3:8] == [
+        (4, 'Test-Parent-1'), (5, 'client-1'), (6, 'client-2'), (7, 'Tool'),
+        (8, 'client-3')]
+    assert devtree.search('client-3')['parent_id'] == '144117387149443072'
+
+
+def test_topology(fake_esm):
+    devtree = DevTree()
+    assert [step[3] for step in devtree.steptree()] == [
+        '1', '2', '3', '3', '4', '4', '3', '2', '3']
+    assert 'depth' not in DevTree._Snapshot.tree[0]
+    assert [ds['name'] for ds in devtree.subtree('144117387099111424')] == [
+        'app', 'Test-Parent-1', 'client-1', 'client-2', 'Tool']
+    assert devtree.subtree_count('144117388424511488') == 2
+    assert devtree.subtree_count('144115188075855872') == 8
+    assert devtree.receiver('144117388424511744')['name'] == 'ERC-1'
+    assert devtree.receiver('144117387199774720')['name'] == 'ERC-2'
+    assert [ds['name'] for ds in devtree._get_client_grps()] == ['Test-Parent-1']
+    topology = DevTree._Snapshot.index.topology
+    assert list(topology.children(1)) == [2, 3, 6]
+    assert topology.parent(4) == 3 and topology.parent(0) is None
+
+
+def test_receiver_shards(fake_esm):
+    fake_esm.devtree += (
+        '4,DBM-1,144117387250000000,0,T,T,T,T,T,T,T,T,TTT,3,0,F,TTTTTTTTTTTTTTTTTTTTTTTTTTTTTTTT,10001000,DBM-VM4,F,F,TTT,,syslog,0,T,F,22.22.28.17,,9,1,\n'
+        '3,db-audit,144117387250000256,0,T,T,T,T,T,T,T,T,TTT,0,0,T,65,syslog,F,F,F,TTT,0,gsyslog,0,T,F,22.22.28.4,,0,0,\n')
+    devtree = DevTree(recs=['ERC-2'])
+    assert [ds['name'] for ds in devtree._tree()] == [
+        'Local ESM', 'ERC-2', 'Mail', 'DBM-1', 'db-audit']
+    assert [ds['idx'] for ds in devtree._tree()] == [1, 2, 3, 4, 5]
+    assert [ds.name for ds in devtree] == ['Mail', 'db-audit']
+    assert devtree.search('Tool') is None
+    assert len(DevTree._Snapshot.tree) == 11
+    assert DevTree().search('Tool').name == 'Tool'
+    devtree.refresh()
+    assert devtree._snapshot().recs == ('144117387099111999',)
+    assert len(devtree) == 5 and len(DevTree._Snapshot.tree) == 11
+    devtree.refresh(recs='all')
+    assert devtree._snapshot() is DevTree._Snapshot
+    assert len(devtree) == 11
+    assert len(DevTree(recs=['144117387099111424'])) == 9
+    with pytest.raises(ValueError):
+        DevTree(recs=['ERC-9'])
+
+
+def test_last_time_index(fake_esm):
+    from datetime import datetime
+    devtree = DevTree()
+    assert [ds['name'] for ds in devtree.silent_since(datetime(2017, 7, 3))] == ['app']
+    assert [ds['name'] for ds in devtree.silent_since('07/06/2017 00:00:00')] == ['app', 'Mail']
+    assert [ds['name'] for ds in devtree.heard_between(
+        '07/02/2017 00:00:00', datetime(2017, 7, 5, 10))] == ['Mail']
+    assert [ds['name'] for ds in devtree.oldest(1)] == ['app']
+    assert devtree.oldest(5, kind='client') == []
+    assert [ds.name for ds in devtree.last_times(days=1)] == ['app', 'Mail']
+    assert [ds['name'] for ds in devtree.query(
+        last_time__gte=datetime(2017, 7, 2))] == ['Mail']
+
+
+def test_staleness_report(fake_esm):
+    import io
+    from datetime import datetime
+    from mfe_saw.staleness import write_csv, write_ndjson
+    devtree = DevTree()
+    rows = devtree.staleness(now=datetime(2017, 7, 5, 10, 30))
+    assert rows[0] == {'group': 'all', 'key': 'all', '<1h': 1, '<1d': 0,
+                       '<7d': 1, '<30d': 0, '30d+': 0, 'never': 4, 'total': 6}
+    by_rec = {row['key']: row for row in rows if row['group'] == 'rec_name'}
+    assert by_rec['ERC-2']['<1h'] == 1 and by_rec['ERC-2']['total'] == 1
+    assert by_rec['ERC-1']['<7d'] == 1 and by_rec['ERC-1']['never'] == 4
+    assert {row['group'] for row in rows} == {'all', 'rec_name', 'vendor/model',
+                                              'zone_name'}
+    out = io.StringIO()
+    write_csv(rows, out)
+    lines = out.getvalue().splitlines()
+    assert lines[0] == 'group,key,<1h,<1d,<7d,<30d,30d+,never,total'
+    assert lines[1] == 'all,all,1,0,1,0,0,4,6'
+    out = io.StringIO()
+    write_ndjson(rows, out)
+    assert len(out.getvalue().splitlines()) == len(rows)
+
+
+def test_staleness_bucket_bounds():
+    from mfe_saw.devindex import DevIndex, last_time_to_epoch
+    from mfe_saw.staleness import staleness
+    from mfe_saw.treestore import TreeStore
+    last_time = '07/05/2017 10:00:00'
+    tree = TreeStore([{'desc_id': '3', 'name': 'ds', 'last_time': last_time}])
+    index = DevIndex(tree)
+    epoch = last_time_to_epoch(last_time)
+    for age, label in [(0.4, '<1h'), (3599.3, '<1h'), (3600, '<1d'),
+                       (3600.2, '<1d'), (86399.9, '<1d'), (86400, '<7d')]:
+        row = staleness(tree, index, groupings=[], now=epoch + age)[0]
+        assert row[label] == 1, age
+
+
+def test_silence_watcher(fake_esm):
+    from datetime import datetime
+    from mfe_saw.watcher import SilenceWatcher
+    watcher = SilenceWatcher(threshold=2 * 86400,
+                             thresholds={'348': 3600})
+    now = datetime(2017, 7, 5, 12, 0).timestamp()
+    del fake_esm.calls[:]
+    events = watcher.poll(now)
+    assert fake_esm.calls == ['QRY%5FGETDEVICELASTALERTTIME']
+    assert [(e.kind, e.name) for e in events] == [('silent', 'app'),
+                                                  ('silent', 'Mail')]
+    assert watcher.poll(now) == []
+
+    fake_esm.last_times = ('144117387182997504,,,07/01/2017 10:00:00\n'
+                           '144117387199774720,,,07/05/2017 11:30:00\n'
+                           '144117387149443072,,,07/05/2017 11:00:00\n')
+    events = watcher.poll(now)
+    assert [(e.kind, e.name) for e in events] == [('back', 'Mail')]
+    assert watcher.silent() == {'144117387182997504'}
+
+    fake_esm.last_times += '144117399999999999,,,07/05/2017 11:00:00\n'
+    del fake_esm.calls[:]
+    watcher.poll(now)
+    assert 'GRP_GETVIRTUALGROUPIPSLISTDATA' in fake_esm.calls
+    del fake_esm.calls[:]
+    watcher.poll(now)
+    assert fake_esm.calls == ['QRY%5FGETDEVICELASTALERTTIME']
+
+    for minute in range(300):
+        fake_esm.last_times = ('144117387149443072,,,07/05/2017 '
+                               '11:{:02d}:{:02d}\n'.format(*divmod(minute, 60)))
+        watcher.poll(now)
+    assert len(watcher._due) == 2
+    assert len(watcher._deadlines) <= 2 * len(watcher._due) + 64
+    assert [(e.kind, e.name) for e in watcher.poll(now + 3 * 86400)] == [
+        ('silent', 'Mail'), ('silent', 'Tool')]
+
+
+def test_aggregate(fake_esm):
+    from mfe_saw.esm import ESM
+    devtree = DevTree()
+    counts = devtree.aggregate(['rec_name', ('vendor', 'model'), 'type_id',
+                                'client'], metrics=['count', 'clients', 'heard'])
+    assert counts['rec_name'] == {
+        'ERC-1': {'count': 5, 'clients': 2, 'heard': 1},
+        'ERC-2': {'count': 1, 'clients': 0, 'heard': 1}}
+    assert counts[('vendor', 'model')][('UNIX', 'Linux')]['count'] == 5
+    assert counts['type_id']['348'] == {'count': 1, 'clients': 0, 'heard': 1}
+    assert counts['client'][True]['count'] == 2
+    assert devtree.aggregate(['type_id']) == {
+        'type_id': {'65': {'count': 5}, '348': {'count': 1}}}
+    assert devtree.aggregate(['desc_id'], kind=None)['desc_id']['2'] == {
+        'count': 2}
+    with pytest.raises(ValueError):
+        devtree.aggregate(['colour'])
+    assert ESM().ds_count_by_type() == {'65': 5, '348': 1}
+
+
+def test_aggregate_under_dbm(fake_esm):
+    from datetime import datetime
+    fake_esm.devtree += (
+        '4,DBM-1,144117387250000000,0,T,T,T,T,T,T,T,T,TTT,3,0,F,TTTTTTTTTTTTTTTTTTTTTTTTTTTTTTTT,10001000,DBM-VM4,F,F,TTT,,syslog,0,T,F,22.22.28.17,,9,1,\n'
+        '3,db-audit,144117387250000256,0,T,T,T,T,T,T,T,T,TTT,0,0,T,65,syslog,F,F,F,TTT,0,gsyslog,0,T,F,22.22.28.4,,0,0,\n')
+    devtree = DevTree()
+    assert devtree.aggregate(['rec_name'])['rec_name'] == {
+        'ERC-1': {'count': 5}, 'ERC-2': {'count': 1}, 'DBM-1': {'count': 1}}
+    rows = devtree.staleness(now=datetime(2017, 7, 5, 10, 30))
+    by_rec = {row['key']: row for row in rows if row['group'] == 'rec_name'}
+    assert by_rec['DBM-1']['never'] == 1 and by_rec['DBM-1']['total'] == 1
+
+
+def test_published_tree_is_read_only(fake_esm):
+    devtree = DevTree()
+    snap = DevTree._Snapshot
+    with pytest.raises(TypeError):
+        snap.tree[2]['name'] = 'renamed'
+    recs = devtree.recs()
+    recs[0]['rec_ip'] = ['10.0.0.1']
+    assert 'rec_ip' not in devtree.recs()[0]
+    fake_esm.last_times = '144117387182997504,,,07/09/2017 10:00:00\n'
+    devtree.get_ds_times()
+    assert DevTree._Snapshot is not snap
+    assert snap.tree[2]['last_time'] == '07/01/2017 10:00:00'
+    assert DevTree._Snapshot.tree[2]['last_time'] == '07/09/2017 10:00:00'
+    assert DevTree._Snapshot.tree._columns['name'] is snap.tree._columns['name']
+
+
+def test_datasource_view(fake_esm):
+    from mfe_saw.datasource import DataSource, DataSourceView
+    devtree = DevTree()
+    view = devtree.search('Tool')
+    assert isinstance(view, DataSourceView)
+    assert view.name == view['name'] == view.get('name') == 'Tool'
+    assert view.ds_ip == '22.22.26.6'
+    assert view.get('colour', 'none') == 'none'
+    with pytest.raises(AttributeError):
+        view.colour
+    with pytest.raises(KeyError):
+        view['colour']
+    with pytest.raises(AttributeError):
+        view.name = 'renamed'
+
+    props = view.props()
+    props['name'] = 'renamed'
+    assert view.name == 'Tool'
+    assert len(view) == len(props)
+
+    edited = view.edit(name='Tool-2', port='6514')
+    assert isinstance(edited, DataSource)
+    assert (edited.name, edited.port) == ('Tool-2', '6514')
+    ds = view.datasource()
+    ds.name = 'renamed'
+    assert (view.name, devtree.search('Tool').name) == ('Tool', 'Tool')
+    assert DevTree._Snapshot.tree[view.idx - 1]['name'] == 'Tool'
+
+
+def test_bulk_add(fake_esm, tmp_path):
+    from mfe_saw.bulk import bulk_add
+    DevTree()
+    rec_id = '144117387099111424'
+    batch = [{'name': 'web-1', 'ds_ip': '22.22.26.40', 'type_id': '65',
+              'parent_id': rec_id},
+             {'name': 'Tool', 'ds_ip': '22.22.26.41', 'type_id': '65',
+              'parent_id': rec_id},
+             {'name': 'web-2', 'ds_ip': '22.22.26.40', 'type_id': '65',
+              'parent_id': rec_id},
+             {'name': 'web-3', 'ds_ip': '22.22.26.999', 'type_id': '65',
+              'parent_id': rec_id},
+             {'name': 'client-3', 'ds_ip': '12.0.0.3', 'type_id': '65',
+              'parent_id': '144117388424511488', 'client': True},
+             {'name': 'web-4', 'hostname': 'web4.corp', 'type_id': '65',
+              'parent_id': rec_id}]
+    fake_esm.rejects.add('web-4')
+    checkpoint = str(tmp_path / 'add.ckpt')
+    results = sorted(bulk_add(batch, checkpoint=checkpoint))
+    assert [r.status for r in results] == ['added', 'duplicate', 'duplicate',
+                                           'invalid', 'added', 'failed']
+    assert results[0].ds_id == '144117390000000001'
+    assert sorted(fake_esm.added) == ['client-3', 'web-1']
+    assert DevTree._Dirty.is_set()
+
+    fake_esm.rejects.clear()
+    results = sorted(bulk_add(batch, checkpoint=checkpoint))
+    assert [r.status for r in results] == ['skipped', 'duplicate', 'duplicate',
+                                           'invalid', 'skipped', 'added']
+    assert sorted(fake_esm.added) == ['client-3', 'web-1', 'web-4']
+
+
+def test_bulk_add_builds_tree(fake_esm):
+    from mfe_saw.bulk import bulk_add
+    results = list(bulk_add([{'name': 'Tool', 'ds_ip': '22.22.26.50',
+                              'type_id': '65',
+                              'parent_id': '144117387099111424'}]))
+    assert [r.status for r in results] == ['duplicate']
+    assert 'dsAddDataSource' not in fake_esm.calls
+
+
+def test_bulk_add_clients(fake_esm):
+    from mfe_saw.bulk import bulk_add_clients
+    DevTree()
+    container = '144117388424511488'
+    clients = [{'name': 'client-{}'.format(num), 'type_id': '65',
+                'ds_ip': '12.0.1.{}'.format(num), 'parent_id': container,
+                'port': '514'} for num in range(1, 6)]
+    clients.append({'name': 'client-9', 'type_id': '65', 'ds_ip': '12.0.1.9',
+                    'parent_id': '144117387182997504'})
+    with pytest.raises(ValueError):
+        next(bulk_add_clients(clients))
+    del fake_esm.calls[:]
+    results = sorted(bulk_add_clients(clients, chunk_size=2, unverified=True))
+    assert [r.status for r in results] == ['duplicate', 'duplicate', 'added',
+                                           'added', 'added', 'invalid']
+    assert fake_esm.calls.count('MISC_WRITEFILE') == 2
+    assert fake_esm.calls.count('DS_IMPORTDSCLIENTS') == 1
+    assert fake_esm.calls.count('DS_GETDSCLIENTLIST') == 1
+    assert results[2].ds_id == '144117390000000001'
+    DevTree().refresh(full=True)
+    assert DevTree().search('client-5')['ds_ip'] == '12.0.1.5'
+
+
+def test_bulk_import(fake_esm):
+    from mfe_saw.bulk import bulk_import
+    DevTree()
+    rec_id = '144117387099111424'
+    batch = [{'name': 'web-{}'.format(num), 'type_id': '65',
+              'ds_ip': '22.22.26.{}'.format(40 + num), 'parent_id': rec_id,
+              'facility': 'local7'} for num in range(1, 4)]
+    batch.append({'name': 'Tool', 'ds_ip': '22.22.26.50', 'type_id': '65',
+                  'parent_id': rec_id})
+    batch.append({'name': 'client-3', 'ds_ip': '12.0.0.3', 'type_id': '65',
+                  'parent_id': '144117388424511488', 'client': True})
+    fake_esm.rejects.add('web-2')
+    with pytest.raises(ValueError):
+        next(bulk_import(batch))
+    del fake_esm.calls[:]
+    results = sorted(bulk_import(batch, chunk_size=2, write_size=1,
+                                 unverified=True))
+    assert [(r.status, r.ds_id) for r in results] == [
+        ('added', '144117390000000001'), ('failed', None),
+        ('added', '144117390000000002'), ('duplicate', None),
+        ('invalid', None)]
+    assert fake_esm.calls.count('DS_IMPORTDATASOURCES') == 2
+    assert fake_esm.calls.count('MISC_WRITEFILE') == 7
+    assert fake_esm.calls.count('dsAddDataSource') == 0
+    lines = sorted(fake_esm.imports)[0].splitlines()
+    assert lines[0] == '#version#,1'
+    assert lines[1].split(',')[:3] == ['op', 'rec_id', 'dsname']
+    assert lines[1].endswith(',facility')
+    assert lines[2].split(',')[:6] == ['add', rec_id, 'web-1', '', 'UNIX',
+                                       'Linux']
+    assert DevTree().search('web-3')['ds_ip'] == '22.22.26.43'
+
+
+def test_bulk_import_file_errors(fake_esm, monkeypatch):
+    from mfe_saw.bulk import _Importer, bulk_import
+    from mfe_saw.exceptions import ESMException
+    submit = _Importer.submit
+
+    def failing(text, write_size):
+        if 'web-3' in text:
+            raise ESMException('import rejected')
+        return submit(text, write_size)
+
+    monkeypatch.setattr(_Importer, 'submit', failing)
+    batch = [{'name': 'web-{}'.format(num), 'type_id': '65',
+              'ds_ip': '22.22.26.{}'.format(40 + num),
+              'parent_id': '144117387099111424'} for num in range(1, 6)]
+    results = sorted(bulk_import(batch, chunk_size=2, unverified=True))
+    assert [(r.name, r.status, r.error) for r in results] == [
+        ('web-1', 'added', None), ('web-2', 'added', None),
+        ('web-3', 'failed', 'import rejected'),
+        ('web-4', 'failed', 'import rejected'), ('web-5', 'added', None)]
+
+
+def test_details_cache(fake_esm, tmp_path):
+    devtree = DevTree()
+    path = str(tmp_path / 'details.db')
+    fake_esm.rejects.add('144117387199774720')
+    results = {r.name: r for r in devtree.details(cache_path=path)}
+    assert sorted(results) == ['Mail', 'Test-Parent-1', 'Tool', 'app',
+                               'client-1', 'client-2']
+    assert results['Mail'].status == 'failed'
+    assert results['Tool'].status == 'fetched'
+    assert results['Tool'].detail['id'] == {'id': '144117387149443072'}
+
+    fake_esm.devtree = fake_esm.devtree.replace('22.22.26.6', '22.22.26.7')
+    devtree.refresh()
+    del fake_esm.calls[:]
+    results = list(devtree.details(['144117387149443072', '999',
+                                    '144117387182997504'], cache_path=path))
+    assert results[0].status == 'missing'
+    assert [(r.name, r.status) for r in results[1:]] == [
+        ('app', 'cached'), ('Tool', 'fetched')]
+    assert fake_esm.calls.count('dsGetDataSourceDetail') == 1
+
+
+def test_detail_cache_threads():
+    import sqlite3
+    from concurrent.futures import ThreadPoolExecutor
+    from mfe_saw.details import DetailCache
+    cache = DetailCache(':memory:')
+    cache.put('1', 'stamp', {'id': '1'})
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        assert pool.submit(cache.get, '1', 'stamp').result() == {'id': '1'}
+        pool.submit(cache.put, '2', 'stamp', {'id': '2'}).result()
+    assert len(cache) == 2 and cache.prune(['2']) == 1
+    cache.close()
+    with pytest.raises(sqlite3.ProgrammingError):
+        len(cache)
+
+
+def test_bulk_delete(fake_esm):
+    from mfe_saw.bulk import bulk_delete
+    devtree = DevTree()
+    changes = devtree.changes(timeout=0)
+    fake_esm.rejects.add('144117387149443072')
+    del fake_esm.calls[:]
+    targets = ['144117388424511744', '144117388424577024',
+               '144117387182997504', devtree.search('Tool'),
+               '144117387099111424', '999']
+    results = list(bulk_delete(targets, batch_size=1))
+    assert sorted((r.name or '', r.status) for r in results) == [
+        ('', 'missing'), ('ERC-1', 'invalid'), ('Tool', 'failed'),
+        ('app', 'deleted'), ('client-1', 'deleted'), ('client-2', 'deleted')]
+    assert fake_esm.calls.count('DS_DELETEDSCLIENTS') == 2
+    assert 'GRP_GETVIRTUALGROUPIPSLISTDATA' not in fake_esm.calls
+    assert [ds['name'] for ds in devtree._DevTree] == [
+        'Local ESM', 'ERC-1', 'Test-Parent-1', 'Tool', 'ERC-2', 'Mail']
+    assert [ds['idx'] for ds in devtree._DevTree] == list(range(1, 7))
+    assert devtree.subtree_count('144117388424511488') == 0
+    assert sorted(change.ds_id for change in changes) == [
+        '144117387182997504', '144117388424511744', '144117388424577024']
+
+    results = list(bulk_delete(['144117388424511488', '144117388424511744']))
+    assert [(r.status, r.error) for r in results] == [
+        ('missing', 'Not in the device tree.'), ('deleted', None)]
+
+
+def test_bulk_delete_under_dbm(fake_esm):
+    from mfe_saw.bulk import _plan_deletes
+    fake_esm.devtree += (
+        '4,DBM-1,144117387250000000,0,T,T,T,T,T,T,T,T,TTT,3,0,F,TTTTTTTTTTTTTTTTTTTTTTTTTTTTTTTT,10001000,DBM-VM4,F,F,TTT,,syslog,0,T,F,22.22.28.17,,9,1,\n'
+        '3,db-audit,144117387250000256,0,T,T,T,T,T,T,T,T,TTT,0,0,T,65,syslog,F,F,F,TTT,0,gsyslog,0,T,F,22.22.28.4,,0,0,\n')
+    DevTree()
+    _, _, datasources, _ = _plan_deletes(['144117387250000256',
+                                          '144117387149443072'])
+    assert datasources == [
+        ('144117387099111424', '144117387149443072', 'Tool'),
+        ('144117387250000000', '144117387250000256', 'db-audit')]
+
+
+def test_plan_deletes_sqlite_backend(fake_esm, tmpdir):
+    from mfe_saw.bulk import _plan_deletes
+    DevTree(db_path=str(tmpdir.join('devtree.db')))
+    results, _, datasources, _ = _plan_deletes(['144117387099111424',
+                                                '144117387149443072'])
+    assert [(r.name, r.status) for r in results] == [('ERC-1', 'invalid')]
+    assert datasources == [
+        ('144117387099111424', '144117387149443072', 'Tool')]
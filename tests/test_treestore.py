@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+    mfe_saw treestore test
+"""
+import pickle
+import time
+
+import pytest
+
+try:
+    from mfe_saw.treestore import TreeStore
+except ModuleNotFoundError:
+    from .utils.mfe_saw.treestore import TreeStore
+
+
+devtree = [{'idx': 1, 'desc_id': '2', 'name': 'ERC-1', 'vendor': ''},
+           {'idx': 2, 'desc_id': '3', 'name': 'linux-1', 'vendor': 'UNIX',
+            'parent_id': '100', 'client': False}]
+
+
+def test_records_match_dicts():
+    store = TreeStore(devtree)
+    assert len(store) == 2
+    assert [dict(rec) for rec in store] == devtree
+    assert 'parent_id' not in store[0]
+    with pytest.raises(KeyError):
+        store[0]['parent_id']
+    assert store.column('parent_id') == [None, '100']
+
+
+def test_record_writes():
+    store = TreeStore(devtree)
+    store[0]['depth'] = '2'
+    store[0]['rec_ip'] = ['10.0.0.1', '10.0.0.2']
+    store[1]['vendor'] = 'Linux'
+    assert store[0]['depth'] == '2'
+    assert store[0]['rec_ip'] == ['10.0.0.1', '10.0.0.2']
+    assert store[1]['vendor'] == 'Linux' and store[0]['vendor'] == ''
+    assert 'depth' not in store[1]
+
+
+def test_frozen_copy_on_write():
+    store = TreeStore(devtree).freeze()
+    with pytest.raises(TypeError):
+        store[1]['vendor'] = 'Linux'
+    with pytest.raises(TypeError):
+        store.append({'idx': 3})
+    copy = store.copy()
+    copy[1]['vendor'] = 'Linux'
+    copy.append({'idx': 3, 'name': 'linux-2'})
+    assert store[1]['vendor'] == 'UNIX' and len(store) == 2
+    assert copy[1]['vendor'] == 'Linux' and copy[2]['name'] == 'linux-2'
+    assert copy._columns['name'] is not store._columns['name']
+    assert store.copy()._columns['name'] is store._columns['name']
+    rec = store[0].copy()
+    rec['name'] = 'ERC-2'
+    assert store[0]['name'] == 'ERC-1'
+    subset = store.subset([1])
+    subset[0]['vendor'] = 'Linux'
+    assert len(subset) == 1 and subset[0]['name'] == store[1]['name']
+    assert store[1]['vendor'] == 'UNIX'
+
+
+def test_snapshot_keeps_missing_fields(tmpdir):
+    import json
+    from mfe_saw.treestore import TreeSnapshot
+    path = str(tmpdir.join('devtree.snap'))
+    TreeSnapshot(TreeStore(devtree).freeze()).save(path, 'esm')
+    tree = TreeSnapshot.load(path, 'esm').tree
+    assert 'parent_id' not in tree[0] and 'client' not in tree[0]
+    assert tree.column('parent_id') == [None, '100']
+    assert tree[0].get('client', 'none') == 'none'
+    assert json.loads(json.dumps(dict(tree[0]))) == devtree[0]
+
+
+@pytest.mark.parametrize('payload', [
+    b'\x80\x02cmfe_saw.treestore\nNoSuchClass\n.',
+    b'\x80\x02cno_such_module\nTreeStore\n.',
+    pickle.dumps(5),
+    pickle.dumps((TreeStore(devtree), None, {}, None))[:-20],
+    b'garbage'])
+def test_corrupt_snapshot_is_a_miss(tmpdir, payload):
+    from mfe_saw.treestore import (SNAPSHOT_MAGIC, SNAPSHOT_VERSION,
+                                   TreeSnapshot, _SNAPSHOT_HEADER)
+    path = str(tmpdir.join('devtree.snap'))
+    TreeSnapshot(TreeStore(devtree)).save(path, 'esm')
+    assert len(TreeSnapshot.load(path, 'esm').tree) == 2
+    with open(path, 'wb') as open_f:
+        open_f.write(_SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION,
+                                           time.time(), 3))
+        open_f.write(b'esm' + payload)
+    assert TreeSnapshot.load(path, 'esm') is None
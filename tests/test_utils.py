@@ -25,3 +25,30 @@ def test_dehexify_uri():
      #   assert x not in cleaned_str
 
 
+
+
+def test_dehexify_rows_blocks():
+    import csv
+    from io import StringIO
+    from mfe_saw.utils import dehexify_lines
+    expected = list(csv.reader(StringIO(dehexify(uri_string))))
+    for block_size in (1, 50, 65536):
+        assert list(csv.reader(dehexify_lines(uri_string, block_size))) == expected
+
+
+def test_dehexify_bytes():
+    cleaned_str = dehexify(uri_string)
+    assert dehexify(uri_string.encode()) == cleaned_str.encode()
+    assert dehexify('a\x1cb\x11c\x12d') == 'a,b\nc d'
+
+
+def test_hexify_round_trip():
+    from mfe_saw.base import Base
+    from mfe_saw.utils import hexify
+    text = "a%2Eb\\c\td\r\n'e' 100%, f:|"
+    assert dehexify(hexify(text)) == text
+    base = Base()
+    base._chunk = hexify(text)
+    base._ftoken = ''
+    _, data = base._get_params('get_wfile')
+    assert dehexify(data['DATA1']) == text